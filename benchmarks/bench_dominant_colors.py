@@ -0,0 +1,181 @@
+"""Benchmark del extractor local de colores dominantes (processing/dominant_colors.py)
+
+Compara latencia y concordancia de extract_dominant_colors contra una
+referencia:
+
+- --corpus DIR --vision-results FILE: colores de Vision ya grabados
+  ({nombre de archivo: [{'color', 'score', 'pixel_fraction'}, ...]}).
+- --corpus DIR --live-vision: llama a IMAGE_PROPERTIES (requiere credenciales);
+  --save-vision FILE guarda la respuesta para repetir sin Vision.
+- --synthetic N: etiquetas sintéticas pintadas con las paletas del catálogo;
+  la referencia es la paleta usada y la fracción de cada color.
+
+Concordancia: ΔE (CIELAB) de cada color de referencia al extraído más
+cercano, ponderado como en ColorMatcher, y si ColorMatcher llega al mismo
+resultado por marca (colores esperados presentes y veredicto de
+check_color_anomalies).
+
+Uso:
+    python benchmarks/bench_dominant_colors.py --synthetic 50
+    python benchmarks/bench_dominant_colors.py --corpus fotos/ --live-vision --save-vision fotos/vision.json
+    python benchmarks/bench_dominant_colors.py --corpus fotos/ --vision-results fotos/vision.json
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+PROCESSING = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'processing')
+sys.path.insert(0, PROCESSING)
+
+from color_matching import colors_to_arrays, hex_to_rgb_array, rgb_to_lab  # noqa: E402
+from dominant_colors import extract_dominant_colors  # noqa: E402
+from product_catalog import ProductCatalog  # noqa: E402
+
+
+def load_corpus(path):
+    images = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            with open(os.path.join(path, name), 'rb') as f:
+                images.append((name, f.read()))
+    return images
+
+
+def synthetic_corpus(catalog, count, width=1600, height=1200):
+    """Bandas con los colores de la paleta de una marca, ruido de cámara y fondo blanco"""
+    from PIL import Image, ImageFilter
+
+    rng = np.random.default_rng(0)
+    brands = list(catalog.products)
+    images, references = [], {}
+    for i in range(count):
+        palette = hex_to_rgb_array(catalog.products[brands[i % len(brands)]]['expected_colors'])
+        shares = rng.dirichlet(np.ones(len(palette) + 1))  # +1: fondo
+        colors = np.vstack([palette, [[245, 245, 240]]])
+        rows = np.repeat(np.arange(len(colors)), np.maximum(1, np.rint(shares * height).astype(int)))[:height]
+        pixels = colors[rows][:, None, :].repeat(width, axis=1)
+        pixels = np.clip(pixels + rng.normal(0, 6, pixels.shape), 0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(1))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        name = f'synthetic_{i:03d}.jpg'
+        images.append((name, buffer.getvalue()))
+        fractions = np.bincount(rows, minlength=len(colors)) / len(rows)
+        references[name] = [
+            {'color': {'red': int(r), 'green': int(g), 'blue': int(b)}, 'score': float(f), 'pixel_fraction': float(f)}
+            for (r, g, b), f in sorted(zip(colors, fractions), key=lambda item: -item[1]) if f > 0
+        ]
+    return images, references
+
+
+def vision_colors(images):
+    """Colores dominantes de Vision IMAGE_PROPERTIES y latencia por imagen"""
+    from google.cloud import vision
+
+    client = vision.ImageAnnotatorClient()
+    results, latencies = {}, []
+    for name, content in images:
+        start = time.perf_counter()
+        response = client.image_properties(image=vision.Image(content=content))
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = [
+            {'color': {'red': c.color.red, 'green': c.color.green, 'blue': c.color.blue},
+             'score': c.score, 'pixel_fraction': c.pixel_fraction}
+            for c in response.image_properties_annotation.dominant_colors.colors
+        ]
+    return results, latencies
+
+
+def weighted_delta_e(reference, extracted):
+    """ΔE promedio de cada color de referencia al extraído más cercano (pesos de ColorMatcher)"""
+    ref_rgb, weights = colors_to_arrays(reference)
+    ext_rgb, _ = colors_to_arrays(extracted)
+    if len(ref_rgb) == 0 or len(ext_rgb) == 0:
+        return float('nan')
+    distances = np.linalg.norm(rgb_to_lab(ref_rgb)[:, None, :] - rgb_to_lab(ext_rgb)[None, :, :], axis=-1)
+    return float(weights @ distances.min(axis=1))
+
+
+def verdict(matched_colors):
+    """Mismo umbral que ImageProcessor.check_color_anomalies"""
+    return 'inconsistente' if matched_colors < 1 else 'ligera' if matched_colors < 2 else 'ok'
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus')
+    parser.add_argument('--synthetic', type=int, default=0)
+    parser.add_argument('--vision-results')
+    parser.add_argument('--live-vision', action='store_true')
+    parser.add_argument('--save-vision')
+    parser.add_argument('--max-colors', type=int, default=8)
+    parser.add_argument('--sample-side', type=int, default=96)
+    parser.add_argument('--catalog', default=os.path.join(PROCESSING, 'catalog', 'products.json'))
+    args = parser.parse_args()
+
+    with open(args.catalog, encoding='utf-8') as f:
+        catalog = ProductCatalog(json.load(f))
+
+    vision_latencies = []
+    if args.synthetic:
+        images, references = synthetic_corpus(catalog, args.synthetic)
+    elif args.corpus:
+        images = load_corpus(args.corpus)
+        if args.live_vision:
+            references, vision_latencies = vision_colors(images)
+            if args.save_vision:
+                with open(args.save_vision, 'w', encoding='utf-8') as f:
+                    json.dump(references, f)
+        elif args.vision_results:
+            with open(args.vision_results, encoding='utf-8') as f:
+                references = json.load(f)
+        else:
+            parser.error('--corpus requiere --vision-results o --live-vision')
+    else:
+        parser.error('Indicar --synthetic N o --corpus DIR')
+
+    images = [(name, content) for name, content in images if name in references]
+    local_latencies, delta_es, top_delta_es = [], [], []
+    same_matched, same_verdict, score_diffs, comparisons = 0, 0, [], 0
+    for name, content in images:
+        start = time.perf_counter()
+        extracted = extract_dominant_colors(content, max_colors=args.max_colors, sample_side=args.sample_side)
+        local_latencies.append((time.perf_counter() - start) * 1000)
+
+        reference = references[name]
+        delta_es.append(weighted_delta_e(reference, extracted))
+        top_delta_es.append(weighted_delta_e(reference[:1], extracted[:3]))
+
+        # Mismo recorte que ImageProcessor.match_colors
+        expected, actual = catalog.color_matcher.match(reference[:5]), catalog.color_matcher.match(extracted[:5])
+        for brand in catalog.color_matcher.brands:
+            comparisons += 1
+            same_matched += expected[brand]['matched_colors'] == actual[brand]['matched_colors']
+            same_verdict += verdict(expected[brand]['matched_colors']) == verdict(actual[brand]['matched_colors'])
+            score_diffs.append(abs(expected[brand]['score'] - actual[brand]['score']))
+
+    print(f"Imágenes: {len(images)}  (k={args.max_colors}, lado={args.sample_side} px)")
+    print(f"Local:  p50={percentile(local_latencies, 50):7.2f} ms  p99={percentile(local_latencies, 99):7.2f} ms  "
+          f"media={statistics.mean(local_latencies):7.2f} ms")
+    if vision_latencies:
+        print(f"Vision: p50={percentile(vision_latencies, 50):7.2f} ms  p99={percentile(vision_latencies, 99):7.2f} ms  "
+              f"media={statistics.mean(vision_latencies):7.2f} ms")
+    print(f"ΔE ponderado:       media={statistics.mean(delta_es):6.2f}  p90={percentile(delta_es, 90):6.2f}")
+    print(f"ΔE color principal: media={statistics.mean(top_delta_es):6.2f}  p90={percentile(top_delta_es, 90):6.2f}")
+    print(f"ColorMatcher por marca: colores presentes iguales {same_matched / comparisons:.1%}, "
+          f"mismo veredicto {same_verdict / comparisons:.1%}, |Δscore| medio {statistics.mean(score_diffs):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark del cliente de la Graph API (shared/whatsapp_client.py)
+
+Levanta un servidor Graph API simulado en localhost con latencia y tasa de
+429 configurables y envía mensajes con WhatsAppClient desde varios hilos.
+Reporta throughput sostenido, p50/p99 por envío, reintentos y tiempo
+retenido por el limitador token bucket.
+
+Uso:
+    python benchmarks/bench_graph_client.py --messages 500 --concurrency 16
+    python benchmarks/bench_graph_client.py --rate-limited 0.1 --messages-per-second 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.whatsapp_client import WhatsAppClient  # noqa: E402
+
+
+def start_mock_server(latency_ms, rate_limited):
+    """Servidor Graph API simulado; retorna (servidor, URL base)"""
+    class GraphHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, igual que graph.facebook.com
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency_ms / 1000)
+            if random.random() < rate_limited:
+                self._reply(429, {'error': {'code': 4, 'message': 'rate limited'}}, {'Retry-After': '0'})
+            else:
+                self._reply(200, {'messages': [{'id': 'wamid.mock'}]})
+
+        def _reply(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    class GraphServer(ThreadingHTTPServer):
+        request_queue_size = 128  # Con el backlog por defecto (5) se pierden conexiones bajo ráfagas
+
+    server = GraphServer(('127.0.0.1', 0), GraphHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=80, help='Latencia simulada de la Graph API')
+    parser.add_argument('--rate-limited', type=float, default=0.05, help='Fracción de respuestas 429')
+    parser.add_argument('--messages-per-second', type=float, default=80, help='Límite del token bucket (0 = sin límite)')
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency_ms, args.rate_limited)
+    client = WhatsAppClient('token', 'phone', base_url=base_url, backoff_base=0.05,
+                            messages_per_second=args.messages_per_second, pool_maxsize=args.concurrency)
+
+    def send(i):
+        start = time.perf_counter()
+        ok = client.send_text(f'57300{i:07d}', 'benchmark')
+        return ok, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, range(args.messages)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    latencies = [ms for _, ms in results]
+    metrics = client.stats().get('messages', {})
+    print(f"Mensajes:          {args.messages} con {args.concurrency} hilos")
+    print(f"Entregados:        {sum(1 for ok, _ in results if ok)}")
+    print(f"Throughput:        {args.messages / elapsed:.1f} msg/s")
+    print(f"Latencia p50/p99:  {percentile(latencies, 50):.1f} / {percentile(latencies, 99):.1f} ms")
+    print(f"Peticiones HTTP:   {metrics.get('requests', 0)} (reintentos {metrics.get('retries', 0)})")
+    print(f"Espera limitador:  {metrics.get('rate_limited_seconds', 0.0):.2f} s acumulados")
+
+
+if __name__ == '__main__':
+    main()
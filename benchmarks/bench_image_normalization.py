@@ -0,0 +1,86 @@
+"""Benchmark de normalización de imágenes (shared/image_normalization.py)
+
+Mide bytes y latencia antes/después de normalizar un corpus de imágenes y
+estima el tiempo de transferencia (subida a GCS / envío a Vision) con un
+ancho de banda dado.
+
+Uso:
+    python benchmarks/bench_image_normalization.py --corpus ruta/a/imagenes
+    python benchmarks/bench_image_normalization.py --synthetic 20
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.image_normalization import normalize_image  # noqa: E402
+
+
+def load_corpus(path):
+    """Leer todas las imágenes de un directorio"""
+    images = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            with open(os.path.join(path, name), 'rb') as f:
+                images.append((name, f.read()))
+    return images
+
+
+def synthetic_corpus(count, width=4000, height=3000):
+    """Generar fotos sintéticas con ruido (peor caso para JPEG) del tamaño de una cámara de celular"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(count):
+        base = rng.integers(0, 255, size=(height // 50, width // 50, 3), dtype=np.uint8)
+        image = Image.fromarray(base).resize((width, height), Image.BICUBIC)
+        noise = rng.integers(-12, 12, size=(height, width, 3))
+        pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+        output = io.BytesIO()
+        Image.fromarray(pixels).save(output, format='JPEG', quality=95)
+        images.append((f"synthetic_{i}.jpg", output.getvalue()))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Directorio con imágenes de ejemplo')
+    parser.add_argument('--synthetic', type=int, default=10, help='Imágenes sintéticas si no hay corpus')
+    parser.add_argument('--max-side', type=int, default=1600)
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--mbps', type=float, default=50.0, help='Ancho de banda para estimar transferencia')
+    args = parser.parse_args()
+
+    images = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    if not images:
+        sys.exit('No se encontraron imágenes')
+
+    original_bytes = normalized_bytes = 0
+    latencies = []
+    for name, data in images:
+        normalized, info = normalize_image(data, max_side=args.max_side, jpeg_quality=args.quality)
+        original_bytes += len(data)
+        normalized_bytes += len(normalized)
+        latencies.append(info['elapsed_ms'])
+
+    bytes_per_second = args.mbps * 1_000_000 / 8
+    transfer_before = original_bytes / bytes_per_second / len(images) * 1000
+    transfer_after = normalized_bytes / bytes_per_second / len(images) * 1000
+    # Cada imagen se transfiere dos veces: subida a GCS y envío a Vision
+    saved_ms = 2 * (transfer_before - transfer_after) - statistics.mean(latencies)
+
+    print(f"Imágenes:                 {len(images)}")
+    print(f"Bytes originales:         {original_bytes:,}")
+    print(f"Bytes normalizados:       {normalized_bytes:,} ({normalized_bytes / original_bytes:.1%})")
+    print(f"Normalización p50/max:    {statistics.median(latencies):.1f} / {max(latencies):.1f} ms")
+    print(f"Transferencia por imagen: {transfer_before:.1f} → {transfer_after:.1f} ms a {args.mbps} Mbps")
+    print(f"Ahorro neto por imagen:   {saved_ms:.1f} ms (subida GCS + envío a Vision - normalización)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark de re-evaluación offline (processing/rescore.py) sobre un archivo sintético
+
+Genera --records registros con el formato de analysis_archive a partir de
+las anotaciones grabadas del harness de carga (benchmarks/load/
+vision_annotations.json), con ruido de OCR, palabras de relleno, etiquetas
+omitidas y colores desplazados, y los guarda en un lote .jsonl.gz con el
+veredicto que emite el código actual. Luego mide registros/s con cada
+número de procesos de --workers. Con el catálogo actual no debe cambiar
+ningún veredicto; --catalog evalúa otro catálogo y muestra el diff.
+
+Uso:
+    python benchmarks/bench_rescore.py --records 20000 --workers 1,4,8
+    python benchmarks/bench_rescore.py --records 5000 --catalog catalogo_editado.json
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROCESSING = os.path.join(ROOT, 'processing')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, PROCESSING)
+os.environ.setdefault('IDEMPOTENCY_BACKEND', 'none')
+os.environ.setdefault('VISION_CACHE_ENABLED', 'false')
+
+from analysis_archive import build_record, dump_line  # noqa: E402
+import main as processing  # noqa: E402
+
+FILLER = ('LOTE', 'VENCE', 'FECHA', 'HECHO', 'EN', 'COLOMBIA', 'USO', 'ADULTOS', 'CONSERVAR', 'TEMPERATURA',
+          'INFERIOR', 'A', '30', 'C', 'MANTENGASE', 'FUERA', 'DEL', 'ALCANCE', 'DE', 'LOS', 'NINOS', 'VENTA', 'LIBRE')
+OCR_CONFUSIONS = {'O': '0', 'I': 'l', 'E': 'F', 'S': '5', 'B': '8', 'A': '4'}
+
+
+def load_fixtures(processor):
+    from google.cloud import vision
+
+    with open(os.path.join(ROOT, 'benchmarks', 'load', 'vision_annotations.json'), encoding='utf-8') as f:
+        return [processor.parse_vision_response(vision.AnnotateImageResponse(item)) for item in json.load(f)]
+
+
+def ocr_noise(text, rng, rate):
+    return ''.join(OCR_CONFUSIONS.get(c, c) if rng.random() < rate else c for c in text)
+
+
+def variant(fixture, rng, filler_words):
+    """Copia de una imagen grabada con las variaciones típicas entre fotos del mismo producto"""
+    words = [a['description'] for a in fixture['text_annotations'][1:]]
+    words += [rng.choice(FILLER) for _ in range(filler_words if words else 0)]
+    full_text = ocr_noise(fixture['text_annotations'][0]['description'], rng, 0.03) if words else ''
+    text_annotations = [{'description': d, 'confidence': 0.0} for d in [full_text] + words if d]
+    labels = [label for label in fixture['labels'] if rng.random() > 0.15]
+    colors = [
+        dict(c, color={k: max(0, min(255, v + rng.randint(-20, 20))) for k, v in c['color'].items()})
+        for c in fixture['colors']
+    ]
+    return {'text_annotations': text_annotations, 'labels': labels, 'colors': colors}
+
+
+def build_archive(path, count, filler_words, seed=0):
+    logging.getLogger().setLevel(logging.ERROR)  # Sin el aviso de marca por defecto en cada registro
+    processor = processing.get_processor()
+    fixtures = load_fixtures(processor)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    with gzip.open(path, 'wb') as f:
+        for i in range(count):
+            analysis = variant(fixtures[i % len(fixtures)], rng, filler_words)
+            message_id = f'wamid.rescore{i:07d}'
+            image_path = f'gs://{processing.BUCKET_NAME}/57300{i % 997:07d}_{message_id}.jpg'
+            result = processor.score_analysis(analysis)
+            f.write(dump_line(build_record(message_id, f'57300{i % 997:07d}', image_path, result, analysis)) + b'\n')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--workers', default=f'1,{os.cpu_count()}')
+    parser.add_argument('--filler-words', type=int, default=120, help='palabras de OCR extra por etiqueta')
+    parser.add_argument('--catalog', default=processing.CATALOG_PATH)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, 'archivo.jsonl.gz')
+        elapsed = build_archive(archive, args.records, args.filler_words)
+        size = os.path.getsize(archive)
+        print(f"Archivo: {args.records} registros, {size / args.records:.0f} B/registro comprimido "
+              f"(generado en {elapsed:.1f} s)\n")
+
+        for workers in [int(w) for w in args.workers.split(',')]:
+            print(f"--- {workers} proceso(s)")
+            # Proceso aparte: mismo camino que el CLI (import, pool, lectura del lote)
+            subprocess.run([sys.executable, os.path.join(PROCESSING, 'rescore.py'), archive,
+                            '--workers', str(workers), '--catalog', args.catalog],
+                           env=dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')])),
+                           check=True)
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark del envío saliente de response: síncrono vs cola + pool de envío
+
+Levanta el servidor Graph API simulado de bench_graph_client.py, apunta el
+cliente de response a él y entrega --events eventos de resultado por
+/pubsub/result desde --request-threads hilos (los hilos de Gunicorn). En modo
+'sync' cada petición espera a WhatsApp; en modo 'async' solo encola y el
+OutboundSender envía con OUTBOUND_CONCURRENCY hilos. Reporta respuestas por
+segundo hasta la última entrega y la latencia de la petición HTTP.
+
+Uso:
+    python benchmarks/bench_response_sender.py --events 500 --latency-ms 150
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, BENCH_DIR)
+
+from bench_graph_client import percentile, start_mock_server  # noqa: E402
+
+# Después de bench_graph_client (que agrega la raíz): main debe resolver a response/main.py
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'response'))
+
+
+def load_response(base_url, concurrency):
+    """Importar response/main.py con la Graph API simulada y sin GCP real"""
+    os.environ.update({
+        'GRAPH_API_BASE_URL': base_url,
+        'WHATSAPP_ACCESS_TOKEN': 'token',
+        'WHATSAPP_PHONE_NUMBER_ID': 'phone',
+        'WHATSAPP_MESSAGES_PER_SECOND': '0',
+        'IDEMPOTENCY_BACKEND': 'local',
+        'OUTBOUND_CONCURRENCY': str(concurrency),
+    })
+    import google.auth
+    import google.auth.credentials
+    google.auth.default = lambda *args, **kwargs: (google.auth.credentials.AnonymousCredentials(), 'benchmark')
+
+    import main as response
+    response.requeue_publisher = StubPublisher()
+    return response
+
+
+class StubPublisher:
+    """Reencolado sin Pub/Sub real: cuenta los resultados y resuelve el future de inmediato"""
+    def __init__(self):
+        self.published = []
+
+    def publish(self, message_data, **attributes):
+        self.published.append(message_data)
+        future = Future()
+        future.set_result('stub')
+        return future
+
+
+def event_envelope(mode, i):
+    event = {'user_id': f'57300{i:07d}', 'message_id': f'wamid.{mode}{i}', 'probability': 42,
+             'anomalies': ['Texto requerido no encontrado'], 'status': 'completed'}
+    return {'message': {'data': base64.b64encode(json.dumps(event).encode('utf-8')).decode('ascii')}}
+
+
+def run_mode(response, mode, events, request_threads):
+    """Enviar los eventos y esperar a que todos lleguen a la Graph API simulada"""
+    client = response.app.test_client()
+    before = response.whatsapp_client.stats().get('messages', {}).get('requests', 0)
+
+    def post(i):
+        start = time.perf_counter()
+        if mode == 'sync':
+            response.deliver_result(json.loads(base64.b64decode(event_envelope(mode, i)['message']['data'])),
+                                    background=False)
+        else:
+            client.post('/pubsub/result', json=event_envelope(mode, i))
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=request_threads) as executor:
+        latencies = list(executor.map(post, range(events)))
+    while response.whatsapp_client.stats().get('messages', {}).get('requests', 0) - before < events:
+        time.sleep(0.01)
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=300)
+    parser.add_argument('--request-threads', type=int, default=4, help='Hilos de Gunicorn atendiendo peticiones')
+    parser.add_argument('--concurrency', type=int, default=32, help='OUTBOUND_CONCURRENCY del modo async')
+    parser.add_argument('--latency-ms', type=float, default=150, help='Latencia simulada de la Graph API')
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency_ms, rate_limited=0)
+    response = load_response(base_url, args.concurrency)
+
+    for mode in ('sync', 'async'):
+        latencies, elapsed = run_mode(response, mode, args.events, args.request_threads)
+        print(f"{mode:6s} {args.events / elapsed:8.1f} respuestas/s  petición p50={percentile(latencies, 50):7.1f} ms  "
+              f"p99={percentile(latencies, 99):7.1f} ms  media={statistics.mean(latencies):7.1f} ms")
+    print(f"Envío saliente: {response.outbound_sender.stats()}")
+    print(f"Reencolados: {len(response.requeue_publisher.published)}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
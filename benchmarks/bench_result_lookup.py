@@ -0,0 +1,101 @@
+"""Benchmark de búsqueda de resultados en response contra el emulador de Firestore
+
+Carga analysis_results con --users × --results-per-user documentos (con el
+documento por message_id y el puntero latest_results que escribe processing)
+y compara la latencia de la consulta compuesta anterior con la lectura
+puntual de get_latest_analysis_result, con y sin caché en proceso.
+
+Uso:
+    gcloud emulators firestore start --host-port=localhost:8085
+    FIRESTORE_EMULATOR_HOST=localhost:8085 python benchmarks/bench_result_lookup.py --users 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'response'))
+
+if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+    sys.exit('Definir FIRESTORE_EMULATOR_HOST (gcloud emulators firestore start)')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'benchmark')
+
+import main as response  # noqa: E402
+
+
+def seed(users, results_per_user):
+    """Escribir resultados con el mismo esquema que processing.save_to_firestore"""
+    client = response.firestore_client
+    samples = []
+    batch, pending = client.batch(), 0
+    for u in range(users):
+        user_id = f'57300{u:07d}'
+        for r in range(results_per_user):
+            message_id = f'wamid.bench{u}_{r}'
+            result = {'user_id': user_id, 'message_id': message_id, 'timestamp': time.time() + r,
+                      'probability': random.randint(0, 100), 'anomalies': ['Texto requerido no encontrado'],
+                      'status': 'completed'}
+            batch.set(client.collection(response.RESULTS_COLLECTION).document(message_id), result)
+            batch.set(client.collection(response.LATEST_RESULTS_COLLECTION).document(user_id),
+                      {k: result[k] for k in ('message_id', 'timestamp', 'probability', 'anomalies', 'status')})
+            pending += 2
+            if pending >= 400:
+                batch.commit()
+                batch, pending = client.batch(), 0
+            samples.append((user_id, message_id))
+    if pending:
+        batch.commit()
+    return samples
+
+
+def measure(lookups, fn):
+    latencies = []
+    for user_id, message_id in lookups:
+        start = time.perf_counter()
+        assert fn(user_id, message_id) is not None
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--results-per-user', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=300)
+    args = parser.parse_args()
+
+    samples = seed(args.users, args.results_per_user)
+    by_message = random.choices(samples, k=args.lookups)
+    latest = [(user_id, None) for user_id, _ in by_message]
+
+    response.result_cache.ttl_seconds = 0
+    scenarios = [
+        ('consulta compuesta (message_id)', by_message, response.query_legacy_analysis_result),
+        ('consulta compuesta (último)', latest, response.query_legacy_analysis_result),
+        ('lectura puntual (message_id)', by_message, response.get_latest_analysis_result),
+        ('lectura puntual (último)', latest, response.get_latest_analysis_result),
+    ]
+    for name, lookups, fn in scenarios:
+        latencies = measure(lookups, fn)
+        print(f"{name:34s} p50={percentile(latencies, 50):7.2f} ms  p99={percentile(latencies, 99):7.2f} ms  "
+              f"media={statistics.mean(latencies):7.2f} ms")
+
+    # Con caché: la segunda búsqueda del mismo message_id no llega a Firestore
+    response.result_cache.ttl_seconds = 60
+    measure(by_message, response.get_latest_analysis_result)
+    latencies = measure(by_message, response.get_latest_analysis_result)
+    print(f"{'lectura puntual + caché':34s} p50={percentile(latencies, 50):7.2f} ms  "
+          f"p99={percentile(latencies, 99):7.2f} ms  media={statistics.mean(latencies):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark de escritura de resultados contra el emulador de Firestore
+
+Escribe --messages resultados (documento por message_id + puntero por
+usuario, como processing.save_to_firestore) desde --concurrency hilos, con
+un commit por mensaje ('direct') y con ResultWriter ('batched'). Reporta
+mensajes por segundo y latencia por mensaje hasta que el commit es durable.
+
+Uso:
+    gcloud emulators firestore start --host-port=localhost:8085
+    FIRESTORE_EMULATOR_HOST=localhost:8085 python benchmarks/bench_result_writes.py --concurrency 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'processing'))
+
+if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+    sys.exit('Definir FIRESTORE_EMULATOR_HOST (gcloud emulators firestore start)')
+
+from google.cloud import firestore  # noqa: E402
+
+from result_writer import ResultWriter  # noqa: E402
+
+
+def result_writes(client, mode, i):
+    user_id, message_id = f'57300{i % 500:07d}', f'wamid.{mode}{i}'
+    summary = {'probability': 42, 'anomalies': ['Texto requerido no encontrado'], 'status': 'completed',
+               'timestamp': firestore.SERVER_TIMESTAMP}
+    return [
+        (client.collection('analysis_results').document(message_id), {'user_id': user_id, 'message_id': message_id, **summary}),
+        (client.collection('latest_results').document(user_id), {'message_id': message_id, **summary}),
+    ]
+
+
+def commit_direct(client, writes):
+    batch = client.batch()
+    for doc_ref, data in writes:
+        batch.set(doc_ref, data)
+    batch.commit()
+
+
+def run(client, mode, messages, concurrency, write):
+    def one(i):
+        start = time.perf_counter()
+        write(result_writes(client, mode, i))
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(messages)))
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-batch-writes', type=int, default=200)
+    parser.add_argument('--flush-interval-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    client = firestore.Client(project='benchmark')
+    writer = ResultWriter(client, max_batch_writes=args.max_batch_writes, flush_interval_ms=args.flush_interval_ms)
+    modes = [
+        ('direct', lambda writes: commit_direct(client, writes)),
+        ('batched', writer.write),
+    ]
+    for mode, write in modes:
+        latencies, elapsed = run(client, mode, args.messages, args.concurrency, write)
+        print(f"{mode:8s} {args.messages / elapsed:8.1f} msg/s  p50={percentile(latencies, 50):7.1f} ms  "
+              f"p99={percentile(latencies, 99):7.1f} ms  media={statistics.mean(latencies):7.1f} ms")
+    print(f"ResultWriter: {writer.stats()}")
+
+
+if __name__ == '__main__':
+    main()
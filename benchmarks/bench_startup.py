@@ -0,0 +1,94 @@
+"""Benchmark de arranque en frío de los servicios
+
+Para cada servicio lanza --runs procesos nuevos que importan su main.py y
+atienden la primera petición que no necesita GCP (GET de verificación del
+webhook, health check de response, catálogo cargado en processing). Reporta
+la mediana del tiempo de import y del tiempo hasta la primera respuesta, y
+qué librerías pesadas quedaron cargadas. Con --max-import-ms termina con
+código 1 si algún servicio lo supera (para detectar regresiones).
+
+Uso:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --max-import-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Librerías que no deberían cargarse para atender la primera petición
+HEAVY_MODULES = ['google.cloud.storage', 'google.cloud.firestore', 'google.cloud.pubsub_v1',
+                 'google.cloud.vision', 'requests']
+
+# Primera petición de cada servicio (se ejecuta en el proceso hijo, después del import)
+FIRST_RESPONSE = {
+    'webhook': """
+from flask import Flask, request
+with Flask(__name__).test_request_context('/?hub.mode=subscribe&hub.verify_token=' + main.WHATSAPP_TOKEN + '&hub.challenge=1'):
+    main.whatsapp_webhook(request)
+""",
+    'response': "main.app.test_client().get('/')",
+    'processing': "main.get_processor().catalog",
+}
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+{first_response}
+ready = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_response_ms': (ready - start) * 1000,
+    'heavy_modules': [m for m in {heavy} if m in sys.modules],
+}}))
+"""
+
+
+def run_once(service):
+    """Lanzar un proceso nuevo del servicio y retornar sus tiempos"""
+    paths = [os.path.join(ROOT, service), ROOT] + [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    code = CHILD.format(first_response=FIRST_RESPONSE[service], heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(ROOT, service), env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{service} falló al arrancar:\n{result.stderr.strip()[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--services', nargs='+', default=list(FIRST_RESPONSE))
+    parser.add_argument('--max-import-ms', type=float, help='Falla si la mediana de import lo supera')
+    args = parser.parse_args()
+
+    failed = False
+    for service in args.services:
+        try:
+            runs = [run_once(service) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(e)
+            failed = True
+            continue
+
+        import_ms = statistics.median(r['import_ms'] for r in runs)
+        first_ms = statistics.median(r['first_response_ms'] for r in runs)
+        heavy = runs[-1]['heavy_modules']
+        print(f"{service:10s} import={import_ms:7.1f} ms  primera respuesta={first_ms:7.1f} ms  "
+              f"cargadas: {', '.join(heavy) or '-'}")
+        if args.max_import_ms and import_ms > args.max_import_ms:
+            print(f"  ✗ import supera {args.max_import_ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
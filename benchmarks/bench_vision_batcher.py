@@ -0,0 +1,98 @@
+"""Benchmark del micro-batching de Vision (processing/vision_batcher.py)
+
+Simula Vision API con un costo fijo por llamada (--rpc-ms) más un costo por
+imagen (--image-ms) y envía --images imágenes desde --concurrency hilos (los
+hilos del worker de processing). Compara una llamada annotate_image por
+imagen contra VisionBatcher con distintos tamaños de lote y esperas.
+
+Uso:
+    python benchmarks/bench_vision_batcher.py --concurrency 16 --wait-ms 20 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'processing'))
+
+from vision_batcher import VisionBatcher  # noqa: E402
+
+
+class FakeVisionClient:
+    """Cliente con latencia simulada; --max-inflight limita las llamadas simultáneas (cuota)"""
+    def __init__(self, rpc_ms, image_ms, max_inflight):
+        self.rpc_ms = rpc_ms
+        self.image_ms = image_ms
+        self.rpcs = 0
+        self._slots = threading.Semaphore(max_inflight)
+        self._lock = threading.Lock()
+
+    def _call(self, images):
+        with self._slots:
+            with self._lock:
+                self.rpcs += 1
+            time.sleep((self.rpc_ms + self.image_ms * images) / 1000)
+
+    def annotate_image(self, request):
+        self._call(1)
+        return SimpleNamespace(error=SimpleNamespace(message=''))
+
+    def batch_annotate_images(self, requests):
+        self._call(len(requests))
+        return SimpleNamespace(responses=[SimpleNamespace(error=SimpleNamespace(message='')) for _ in requests])
+
+
+def run(annotate, images, concurrency):
+    request = SimpleNamespace(image=SimpleNamespace(content=b'0' * 300_000))
+
+    def one(_):
+        start = time.perf_counter()
+        annotate(request)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(images)))
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(name, latencies, elapsed, client, images):
+    print(f"{name:26s} {images / elapsed:7.1f} img/s  p50={percentile(latencies, 50):7.1f} ms  "
+          f"p99={percentile(latencies, 99):7.1f} ms  media={statistics.mean(latencies):7.1f} ms  llamadas={client.rpcs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rpc-ms', type=float, default=150, help='Costo fijo por llamada a Vision')
+    parser.add_argument('--image-ms', type=float, default=15, help='Costo adicional por imagen')
+    parser.add_argument('--max-inflight', type=int, default=4, help='Llamadas simultáneas permitidas')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--wait-ms', type=float, nargs='+', default=[20, 50])
+    args = parser.parse_args()
+
+    client = FakeVisionClient(args.rpc_ms, args.image_ms, args.max_inflight)
+    latencies, elapsed = run(lambda r: client.annotate_image(request=r), args.images, args.concurrency)
+    report('una llamada por imagen', latencies, elapsed, client, args.images)
+
+    for size in args.batch_sizes:
+        for wait_ms in args.wait_ms:
+            client = FakeVisionClient(args.rpc_ms, args.image_ms, args.max_inflight)
+            batcher = VisionBatcher(client, max_batch_size=size, max_wait_ms=wait_ms,
+                                    max_concurrent_batches=args.max_inflight)
+            latencies, elapsed = run(batcher.annotate, args.images, args.concurrency)
+            report(f'lote {size:2d} / {wait_ms:g} ms', latencies, elapsed, client, args.images)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark de latencia del webhook: modo 'inline' vs 'fast_ack'
+
+Ejecuta whatsapp_webhook en proceso con las llamadas de red reemplazadas por
+esperas de latencia configurable (Graph API, GCS, Pub/Sub) y reporta p50/p99
+de la respuesta al POST de WhatsApp en cada modo.
+
+Uso:
+    python benchmarks/bench_webhook_latency.py --requests 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'webhook'))
+
+# Los clientes GCP se construyen al importar; no se usan porque la red se simula
+os.environ.setdefault('IDEMPOTENCY_BACKEND', 'local')
+
+import google.auth  # noqa: E402
+import google.auth.credentials  # noqa: E402
+google.auth.default = lambda *args, **kwargs: (google.auth.credentials.AnonymousCredentials(), 'benchmark')
+
+import main as webhook  # noqa: E402
+
+
+def sample_payload(mode, i):
+    """Payload de WhatsApp con un mensaje de imagen"""
+    return {
+        'entry': [{'changes': [{'value': {'messages': [{
+            'from': f'57300{i:07d}',
+            'id': f'wamid.{mode}{i}',
+            'timestamp': str(int(time.time())),
+            'type': 'image',
+            'image': {'id': f'media{i}'}
+        }]}}]}]
+    }
+
+
+def simulate_network(args):
+    """Reemplazar las llamadas externas del webhook por esperas"""
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+    def download(media_id):
+        sleep_ms(args.media_lookup_ms + args.download_ms)
+        return b'\xff\xd8' + b'0' * 1024
+
+    def upload(image_data, file_name, storage_class=None):
+        sleep_ms(args.upload_ms)
+        return f"gs://{webhook.BUCKET_NAME}/{file_name}"
+
+    def publish(jobs):
+        sleep_ms(args.publish_ms)
+        return ['message-id'] * len(jobs)
+
+    def send(user_id, text):
+        sleep_ms(args.reply_ms)
+        return True
+
+    webhook.download_whatsapp_image = download
+    webhook.prepare_image = lambda image_data, file_name: image_data
+    webhook.upload_to_gcs = upload
+    webhook.publish_to_pubsub = publish
+    webhook.send_text_message = send
+
+
+def run_mode(mode, count):
+    """Latencias (ms) de count POST en el modo indicado"""
+    from flask import Flask
+    app = Flask(__name__)
+    webhook.WEBHOOK_MODE = mode
+
+    latencies = []
+    for i in range(count):
+        with app.test_request_context('/', method='POST', json=sample_payload(mode, i)):
+            from flask import request
+            start = time.perf_counter()
+            webhook.whatsapp_webhook(request)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--media-lookup-ms', type=float, default=120)
+    parser.add_argument('--download-ms', type=float, default=250)
+    parser.add_argument('--upload-ms', type=float, default=150)
+    parser.add_argument('--publish-ms', type=float, default=30)
+    parser.add_argument('--reply-ms', type=float, default=200)
+    args = parser.parse_args()
+
+    simulate_network(args)
+    for mode in ('inline', 'fast_ack'):
+        latencies = run_mode(mode, args.requests)
+        print(f"{mode:9s} p50={percentile(latencies, 50):8.1f} ms  "
+              f"p99={percentile(latencies, 99):8.1f} ms  media={statistics.mean(latencies):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""Dobles en proceso de GCS, Pub/Sub, Vision, Firestore y Graph API para el harness de carga
+
+Cada doble espera una latencia muestreada de un LatencyModel y falla con la
+probabilidad configurada para su nombre ('gcs', 'pubsub', 'vision',
+'firestore', 'graph_media', 'graph_send').
+"""
+import io
+import json
+import queue
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+# Latencia (media y desviación en ms, normal truncada en 0) y tasa de error por dependencia
+class LatencyModel:
+    DEFAULTS = {
+        'gcs': (40, 15),
+        'pubsub': (20, 10),
+        'vision': (300, 100),
+        'firestore': (25, 10),
+        'graph_media': (120, 40),
+        'graph_send': (150, 50),
+    }
+
+    def __init__(self, latencies=None, error_rates=None, seed=None):
+        self.latencies = dict(self.DEFAULTS, **(latencies or {}))
+        self.error_rates = error_rates or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {name: 0 for name in self.latencies}
+        self.errors = {name: 0 for name in self.latencies}
+
+    def sample(self, name):
+        """Muestrear (segundos de latencia, si la llamada falla) sin esperar"""
+        mean, jitter = self.latencies[name]
+        with self._lock:
+            delay = max(0.0, self._random.gauss(mean, jitter)) / 1000
+            fail = self._random.random() < self.error_rates.get(name, 0.0)
+            self.calls[name] += 1
+            self.errors[name] += int(fail)
+        return delay, fail
+
+    def wait(self, name):
+        """Esperar la latencia de 'name'; True si la llamada debe fallar"""
+        delay, fail = self.sample(name)
+        time.sleep(delay)
+        return fail
+
+
+class InjectedError(Exception):
+    """Error simulado por un doble"""
+
+
+# --- Cloud Storage ---
+
+class FakeBlob:
+    def __init__(self, store, bucket, name, model):
+        self.store, self.bucket, self.name, self.model = store, bucket, name, model
+        self.storage_class = None
+
+    def upload_from_string(self, data, content_type=None):
+        if self.model.wait('gcs'):
+            raise InjectedError(f"GCS no disponible ({self.name})")
+        self.store[(self.bucket, self.name)] = bytes(data)
+
+    def download_as_bytes(self):
+        if self.model.wait('gcs'):
+            raise InjectedError(f"GCS no disponible ({self.name})")
+        return self.store[(self.bucket, self.name)]
+
+    def exists(self):
+        if self.model.wait('gcs'):
+            raise InjectedError(f"GCS no disponible ({self.name})")
+        return (self.bucket, self.name) in self.store
+
+    @contextmanager
+    def open(self, mode='rb', **kwargs):
+        buffer = io.BytesIO()
+        yield buffer
+        self.upload_from_string(buffer.getvalue())
+
+
+class FakeBucket:
+    def __init__(self, store, name, model):
+        self.store, self.name, self.model = store, name, model
+
+    def blob(self, name):
+        return FakeBlob(self.store, self.name, name, self.model)
+
+
+class FakeStorageClient:
+    def __init__(self, model):
+        self.model = model
+        self.objects = {}
+
+    def bucket(self, name):
+        return FakeBucket(self.objects, name, self.model)
+
+
+# --- Firestore ---
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data[field]
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self.client, self.path = client, path
+
+    def get(self, transaction=None):
+        if self.client.model.wait('firestore'):
+            raise InjectedError(f"Firestore no disponible ({self.path})")
+        with self.client.lock:
+            return FakeSnapshot(self.client.documents.get(self.path))
+
+    def set(self, data):
+        batch = self.client.batch()
+        batch.set(self, data)
+        batch.commit()
+
+    def delete(self):
+        with self.client.lock:
+            self.client.documents.pop(self.path, None)
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    def document(self, document_id):
+        return FakeDocument(self.client, (self.name, document_id))
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, doc_ref, data):
+        self.writes.append((doc_ref.path, dict(data)))
+
+    def commit(self):
+        if self.client.model.wait('firestore'):
+            raise InjectedError("Firestore: commit fallido")
+        with self.client.lock:
+            for path, data in self.writes:
+                self.client.documents[path] = data
+            self.client.commits += 1
+
+
+class FakeFirestoreClient:
+    def __init__(self, model):
+        self.model = model
+        self.documents = {}
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+
+# --- Vision ---
+
+class FakeVisionClient:
+    """Responde con anotaciones grabadas (AnnotateImageResponse en JSON), elegidas por el contenido de la imagen"""
+    def __init__(self, model, annotations_path):
+        from google.cloud import vision
+
+        self.model = model
+        self.vision = vision
+        with open(annotations_path, encoding='utf-8') as f:
+            self.responses = [vision.AnnotateImageResponse(item) for item in json.load(f)]
+
+    def _response_for(self, request):
+        if self.model.wait('vision'):
+            return self.vision.AnnotateImageResponse(error={'code': 14, 'message': 'Vision no disponible (simulado)'})
+        return self.responses[zlib.crc32(request.image.content) % len(self.responses)]
+
+    def annotate_image(self, request):
+        return self._response_for(request)
+
+    # Modo 'concurrent': una llamada por feature (cada una con su latencia)
+    def _detect(self, image):
+        return self._response_for(self.vision.AnnotateImageRequest(image=image))
+
+    def text_detection(self, image):
+        return self._detect(image)
+
+    def label_detection(self, image):
+        return self._detect(image)
+
+    def image_properties(self, image):
+        return self._detect(image)
+
+    def batch_annotate_images(self, requests):
+        # Una sola latencia de llamada para todo el lote
+        responses = [self._response_for(requests[0])]
+        responses += [self.responses[zlib.crc32(r.image.content) % len(self.responses)] for r in requests[1:]]
+        return self.vision.BatchAnnotateImagesResponse(responses=responses)
+
+
+# --- Pub/Sub ---
+
+class FakeTopic:
+    """Cola de mensajes de un tópico; los consumidores la drenan con get()"""
+    def __init__(self, name):
+        self.name = name
+        self.queue = queue.Queue()
+        self.published = 0
+        self.in_transit = 0  # Publicados que aún no llegan a la cola
+        self.lock = threading.Lock()
+
+
+class FakePublisher:
+    """Misma interfaz que shared.pubsub_publisher.BatchPublisher"""
+    def __init__(self, topic, model, on_publish=None):
+        self.topic = topic
+        self.model = model
+        self.on_publish = on_publish
+
+    def publish(self, message_data, **attributes):
+        """No bloquea: el mensaje llega a la cola y el future se resuelve tras la latencia de 'pubsub'"""
+        future = Future()
+        data = json.loads(json.dumps(message_data))
+        delay, fail = self.model.sample('pubsub')
+        with self.topic.lock:
+            self.topic.in_transit += 1
+
+        def deliver():
+            with self.topic.lock:
+                self.topic.in_transit -= 1
+            if fail:
+                future.set_exception(InjectedError(f"Pub/Sub: error publicando en {self.topic.name}"))
+                return
+            if self.on_publish is not None:
+                self.on_publish(data)
+            self.topic.queue.put((data, 1))
+            with self.topic.lock:
+                self.topic.published += 1
+            future.set_result(str(self.topic.published))
+
+        timer = threading.Timer(delay, deliver)
+        timer.daemon = True
+        timer.start()
+        return future
+
+    def publish_many(self, messages):
+        return [self.publish(message_data) for message_data in messages]
+
+    def stats(self):
+        return {'published': self.topic.published}
+
+    def shutdown(self):
+        pass
+
+
+# --- Graph API de WhatsApp ---
+
+class FakeMediaResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_content(self, chunk_size=256 * 1024):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class FakeWhatsAppClient:
+    """Misma interfaz que shared.whatsapp_client.WhatsAppClient"""
+    loaded = True
+
+    def __init__(self, model, images, on_send=None):
+        self.model = model
+        self.images = images  # media_id → bytes de la imagen
+        self.on_send = on_send
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def download_media(self, media_id):
+        if self.model.wait('graph_media'):
+            return None
+        return self.images(media_id)
+
+    @contextmanager
+    def open_media_stream(self, media_id):
+        data = self.download_media(media_id)
+        yield FakeMediaResponse(data) if data is not None else None
+
+    def send_text(self, to, body):
+        if self.model.wait('graph_send'):
+            return False
+        with self._lock:
+            self.sent.append((to, body))
+        if self.on_send is not None:
+            self.on_send(to, body)
+        return True
+
+    def stats(self):
+        return {'messages': {'requests': len(self.sent)}}
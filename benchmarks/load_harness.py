@@ -0,0 +1,454 @@
+"""Harness de carga extremo a extremo, sin red ni credenciales
+
+Carga webhook, processing y response en un mismo proceso y reemplaza GCS,
+Pub/Sub, Vision, Firestore y la Graph API por los dobles de
+benchmarks/load/fakes.py, con latencia y tasa de error configurables por
+dependencia. Reproduce las entregas de un corpus JSONL (un payload de
+webhook por línea) a --rate entregas por segundo y sigue cada imagen por
+todo el pipeline:
+
+    webhook      recepción → respuesta 200 del webhook
+    pubsub_wait  publicación del job → inicio del procesamiento
+    processing   inicio → fin de handle_image_job (incluye reintentos)
+    delivery     evento de resultado publicado → mensaje enviado por response
+    end_to_end   recepción → mensaje de resultado enviado
+
+Las latencias se miden desde el instante programado de cada entrega, así que
+si el harness se atrasa el retraso cuenta (sin omisión coordinada). Los jobs
+que fallan se reentregan como haría Pub/Sub, hasta --max-attempts.
+
+La configuración de los servicios se toma del entorno (VISION_REQUEST_MODE,
+RESULT_WRITE_MODE, WORKER_THREADS, ...); la idempotencia y el caché de
+Vision usan el backend 'local'.
+
+Uso:
+    python benchmarks/load_harness.py --rate 20 --messages 400
+    python benchmarks/load_harness.py --mode fast_ack --latency vision=600,200 --errors vision=0.05
+    python benchmarks/load_harness.py --generate 200 --corpus /tmp/corpus.jsonl
+"""
+import argparse
+import collections
+import importlib.util
+import io
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+LOAD_DIR = os.path.join(ROOT, 'benchmarks', 'load')
+sys.path.insert(0, LOAD_DIR)
+
+from fakes import (FakeFirestoreClient, FakePublisher, FakeStorageClient, FakeTopic,  # noqa: E402
+                   FakeVisionClient, FakeWhatsAppClient, LatencyModel)
+
+STAGES = ['webhook', 'pubsub_wait', 'processing', 'delivery', 'end_to_end']
+RESULT_MARKER = 'ANÁLISIS COMPLETADO'
+
+
+# --- Corpus ---
+
+def generate_corpus(path, deliveries, text_ratio=0.1, seed=7):
+    """Escribir un corpus sintético: una imagen por entrega, algunas con dos y algunos textos"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(deliveries):
+            user_id = f'57300{i:07d}'
+            timestamp = str(1700000000 + i)
+            if rng.random() < text_ratio:
+                messages = [{'from': user_id, 'id': f'wamid.load{i}_0', 'timestamp': timestamp,
+                             'type': 'text', 'text': {'body': 'hola'}}]
+            else:
+                messages = [{'from': user_id, 'id': f'wamid.load{i}_{n}', 'timestamp': timestamp,
+                             'type': 'image', 'image': {'id': f'media.load{i}_{n}', 'mime_type': 'image/jpeg'}}
+                            for n in range(2 if rng.random() < 0.05 else 1)]
+            payload = {'object': 'whatsapp_business_account', 'entry': [{'id': 'load', 'changes': [
+                {'field': 'messages', 'value': {'messaging_product': 'whatsapp', 'messages': messages}}]}]}
+            f.write(json.dumps(payload) + '\n')
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(corpus, count):
+    """Repetir el corpus hasta 'count' entregas, con ids y remitentes nuevos en cada vuelta"""
+    for i in range(count):
+        payload = corpus[i % len(corpus)]
+        cycle = i // len(corpus)
+        if cycle:
+            payload = json.loads(json.dumps(payload))
+            for message in iter_messages(payload):
+                message['id'] = f"{message['id']}.r{cycle}"
+                message['from'] = f"{message['from']}{cycle}"
+        yield payload
+
+
+def iter_messages(payload):
+    for entry in payload.get('entry', []):
+        for change in entry.get('changes', []):
+            yield from change.get('value', {}).get('messages', [])
+
+
+# --- Imágenes ---
+
+class ImagePool:
+    """JPEG sintético y distinto por media_id (mismo media_id → mismos bytes)"""
+    def __init__(self, size=(800, 600)):
+        self.size = size
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, media_id):
+        with self._lock:
+            if media_id not in self._images:
+                self._images[media_id] = self._render(media_id)
+            return self._images[media_id]
+
+    def _render(self, media_id):
+        from PIL import Image, ImageDraw
+
+        rng = random.Random(media_id)
+        image = Image.new('RGB', self.size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(self.size[0]), rng.randrange(self.size[1])
+            draw.rectangle([x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 200)],
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        return buffer.getvalue()
+
+
+# --- Seguimiento por mensaje ---
+
+class Tracker:
+    def __init__(self):
+        self.times = collections.defaultdict(dict)
+        self.pending_results = collections.defaultdict(collections.deque)  # user_id → message_ids
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def mark(self, message_id, stage, at=None, first=False):
+        with self._lock:
+            if first:
+                self.times[message_id].setdefault(stage, at or time.perf_counter())
+            else:
+                self.times[message_id][stage] = at or time.perf_counter()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def result_published(self, event):
+        self.mark(event['message_id'], 'result_published')
+        with self._lock:
+            self.pending_results[event['user_id']].append(event['message_id'])
+
+    # El mensaje de WhatsApp no lleva message_id: se asocia al resultado pendiente más antiguo del usuario
+    def sent(self, user_id, body):
+        if RESULT_MARKER not in body:
+            return
+        with self._lock:
+            pending = self.pending_results.get(user_id)
+            if not pending:
+                return
+            self.times[pending.popleft()]['delivered'] = time.perf_counter()
+
+    def durations(self, stage):
+        spans = {
+            'webhook': ('received', 'acked'),
+            'pubsub_wait': ('published', 'processing_start'),
+            'processing': ('processing_start', 'processing_end'),
+            'delivery': ('result_published', 'delivered'),
+            'end_to_end': ('received', 'delivered'),
+        }
+        start, end = spans[stage]
+        with self._lock:
+            return [(t[end] - t[start]) * 1000 for t in self.times.values() if start in t and end in t]
+
+
+# --- Servicios ---
+
+def load_service(service, module_name):
+    """Importar <service>/main.py con un nombre propio (los tres se llaman main)"""
+    service_dir = os.path.join(ROOT, service)
+    for path in (ROOT, service_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(service_dir, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Pipeline:
+    def __init__(self, args, model, tracker):
+        self.args = args
+        self.model = model
+        self.tracker = tracker
+        self.images = ImagePool()
+        self.jobs_topic = FakeTopic('image-processing')
+        self.results_topic = FakeTopic('analysis-results')
+        self.busy = collections.Counter()
+        self.pending_redeliveries = 0
+        self.status_codes = collections.Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # Un solo "proyecto": los tres servicios comparten GCS y Firestore
+        storage = FakeStorageClient(model)
+        firestore = FakeFirestoreClient(model)
+        vision = FakeVisionClient(model, os.path.join(LOAD_DIR, 'vision_annotations.json'))
+
+        self.webhook = load_service('webhook', 'webhook_main')
+        self.processing = load_service('processing', 'processing_main')
+        self.response = load_service('response', 'response_main')
+
+        self.webhook.storage_client.override(storage)
+        self.webhook.firestore_client.override(firestore)
+        self.webhook.whatsapp_client.override(FakeWhatsAppClient(model, self.images))
+        self.webhook.publisher = FakePublisher(
+            self.jobs_topic, model, on_publish=lambda job: tracker.mark(job['message_id'], 'published'))
+
+        self.processing.storage_client.override(storage)
+        self.processing.firestore_client.override(firestore)
+        self.processing.vision_client.override(vision)
+        self.processing.whatsapp_client.override(FakeWhatsAppClient(model, self.images))
+        self.processing.results_publisher = FakePublisher(self.results_topic, model, on_publish=tracker.result_published)
+
+        self.response.firestore_client.override(firestore)
+        self.response.whatsapp_client.override(FakeWhatsAppClient(model, self.images, on_send=tracker.sent))
+        # Resultados cuyo envío en segundo plano falló vuelven al mismo tópico
+        self.response.requeue_publisher = FakePublisher(self.results_topic, model)
+
+        self.flask_app = self.response.app
+        self.webhook_executor = ThreadPoolExecutor(max_workers=args.webhook_concurrency)
+        self.consumers = (
+            [threading.Thread(target=self._consume, args=(self.jobs_topic, 'processing', self._process), daemon=True)
+             for _ in range(args.processing_workers)] +
+            [threading.Thread(target=self._consume, args=(self.results_topic, 'response', self._deliver), daemon=True)
+             for _ in range(args.response_workers)]
+        )
+
+    def start(self):
+        self.processing.get_processor()  # Catálogo cargado antes de medir
+        for thread in self.consumers:
+            thread.start()
+
+    # POST al webhook dentro de un contexto de petición de Flask
+    def post(self, payload, scheduled_at, attempt=1):
+        from flask import request
+
+        image_ids = [m['id'] for m in iter_messages(payload) if m.get('type') == 'image']
+        if attempt == 1:
+            for message_id in image_ids:
+                self.tracker.mark(message_id, 'received', at=scheduled_at)
+        with self.flask_app.test_request_context('/', method='POST', json=payload):
+            _, status = self.webhook.whatsapp_webhook(request)
+        with self._lock:
+            self.status_codes[status] += 1
+        if status >= 500:
+            # WhatsApp reintenta la entrega completa si el webhook no responde 2xx
+            self._repost(payload, scheduled_at, attempt)
+            return
+        acked_at = time.perf_counter()
+        for message_id in image_ids:
+            self.tracker.mark(message_id, 'acked', at=acked_at)
+
+    def _repost(self, payload, scheduled_at, attempt):
+        if attempt >= self.args.max_attempts:
+            self.tracker.count('webhook_dead_lettered')
+            return
+        self.tracker.count('webhook_redelivered')
+        with self._lock:
+            self.pending_redeliveries += 1
+
+        def post_again():
+            try:
+                self.post(payload, scheduled_at, attempt + 1)
+            finally:
+                with self._lock:
+                    self.pending_redeliveries -= 1
+
+        timer = threading.Timer(min(10.0, 0.1 * 2 ** attempt), post_again)
+        timer.daemon = True
+        timer.start()
+
+    def _consume(self, topic, name, handle):
+        while not self._stop.is_set():
+            try:
+                message, attempt = topic.queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self.busy[name] += 1
+            try:
+                ok = handle(dict(message))
+            except Exception:
+                ok = False
+            finally:
+                with self._lock:
+                    self.busy[name] -= 1
+            if not ok:
+                self._redeliver(topic, name, message, attempt)
+
+    def _process(self, job):
+        self.tracker.mark(job['message_id'], 'processing_start', first=True)
+        self.processing.handle_image_job(job)
+        self.tracker.mark(job['message_id'], 'processing_end')
+        return True
+
+    def _deliver(self, event):
+        # Igual que el endpoint push: True si el envío quedó encolado en OutboundSender
+        return self.response.deliver_result(event)
+
+    # Reentrega con backoff, como Pub/Sub tras un nack o un error
+    def _redeliver(self, topic, name, message, attempt):
+        if attempt >= self.args.max_attempts:
+            self.tracker.count(f'{name}_dead_lettered')
+            return
+        self.tracker.count(f'{name}_redelivered')
+        with self._lock:
+            self.pending_redeliveries += 1
+
+        def put_back():
+            topic.queue.put((message, attempt + 1))
+            with self._lock:
+                self.pending_redeliveries -= 1
+
+        timer = threading.Timer(min(10.0, 0.1 * 2 ** attempt), put_back)
+        timer.daemon = True
+        timer.start()
+
+    def idle(self):
+        outbound = self.response.outbound_sender.stats()
+        with self._lock:
+            busy = sum(self.busy.values()) + self.pending_redeliveries
+        topics = (self.jobs_topic, self.results_topic)
+        return (busy == 0 and all(t.queue.empty() and t.in_transit == 0 for t in topics)
+                and outbound['queue_depth'] == 0 and outbound['in_flight'] == 0)
+
+    def stop(self):
+        self._stop.set()
+
+
+# --- Reporte ---
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(args, pipeline, tracker, model, deliveries, replay_seconds, total_seconds):
+    images = [t for t in tracker.times.values() if 'received' in t]
+    delivered = [t for t in images if 'delivered' in t]
+    print(f"Entregas: {deliveries} a {args.rate}/s en modo {pipeline.webhook.WEBHOOK_MODE} "
+          f"({len(images)} imágenes), respuestas {dict(pipeline.status_codes)}")
+    print(f"Throughput: {deliveries / replay_seconds:.1f} entregas/s recibidas, "
+          f"{len(delivered) / total_seconds:.1f} resultados/s entregados ({len(delivered)}/{len(images)} "
+          f"en {total_seconds:.1f} s)")
+    print(f"{'etapa':12s} {'n':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}  (ms)")
+    for stage in STAGES:
+        values = tracker.durations(stage)
+        if not values:
+            print(f"{stage:12s} {0:6d}")
+            continue
+        print(f"{stage:12s} {len(values):6d} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f} "
+              f"{percentile(values, 99):9.1f} {max(values):9.1f}")
+    print("Dobles (llamadas/errores): " + ', '.join(
+        f"{name}={model.calls[name]}/{model.errors[name]}" for name in model.calls))
+    print(f"Reentregas: {dict(tracker.counters) or 0}, sin entregar: {len(images) - len(delivered)}")
+    print(f"OutboundSender: {pipeline.response.outbound_sender.stats()}")
+
+
+def parse_overrides(values, parse):
+    overrides = {}
+    for value in values or []:
+        name, _, setting = value.partition('=')
+        overrides[name] = parse(setting)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join(LOAD_DIR, 'corpus.jsonl'))
+    parser.add_argument('--generate', type=int, metavar='N', help='Escribir un corpus sintético de N entregas y salir')
+    parser.add_argument('--rate', type=float, default=20, help='Entregas por segundo')
+    parser.add_argument('--messages', type=int, help='Entregas a enviar (por defecto, el corpus una vez)')
+    parser.add_argument('--mode', choices=['inline', 'fast_ack'], default=os.environ.get('WEBHOOK_MODE', 'inline'))
+    parser.add_argument('--latency', action='append', metavar='NOMBRE=MEDIA,DESV',
+                        help=f"Latencia en ms de un doble ({', '.join(LatencyModel.DEFAULTS)})")
+    parser.add_argument('--errors', action='append', metavar='NOMBRE=TASA', help='Tasa de error de un doble (0-1)')
+    parser.add_argument('--webhook-concurrency', type=int, default=32)
+    parser.add_argument('--processing-workers', type=int, default=int(os.environ.get('WORKER_THREADS', '8')))
+    parser.add_argument('--response-workers', type=int, default=4)
+    parser.add_argument('--max-attempts', type=int, default=5)
+    parser.add_argument('--drain-timeout', type=float, default=60, help='Segundos para vaciar el pipeline')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help='Mostrar los logs de los servicios')
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_corpus(args.corpus, args.generate)
+        print(f"Corpus de {args.generate} entregas escrito en {args.corpus}")
+        return
+
+    # Configuración que los servicios leen al importarse
+    os.environ['WEBHOOK_MODE'] = args.mode
+    os.environ.setdefault('IDEMPOTENCY_BACKEND', 'local')
+    os.environ.setdefault('VISION_CACHE_BACKEND', 'local')
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'load-harness')
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    model = LatencyModel(
+        latencies=parse_overrides(args.latency, lambda s: tuple(float(v) for v in s.split(','))),
+        error_rates=parse_overrides(args.errors, float),
+        seed=args.seed
+    )
+    tracker = Tracker()
+    pipeline = Pipeline(args, model, tracker)
+
+    corpus = load_corpus(args.corpus)
+    deliveries = args.messages or len(corpus)
+    payloads = list(replay(corpus, deliveries))
+    for payload in payloads:  # Imágenes generadas antes de medir
+        for message in iter_messages(payload):
+            if message.get('type') == 'image':
+                pipeline.images(message['image']['id'])
+    pipeline.start()
+
+    # Entregas a ritmo constante; cada una se mide desde su instante programado
+    start = time.perf_counter()
+    futures = []
+    for i, payload in enumerate(payloads):
+        scheduled_at = start + i / args.rate
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        futures.append(pipeline.webhook_executor.submit(pipeline.post, payload, scheduled_at))
+    for future in futures:
+        future.result()
+    replay_seconds = time.perf_counter() - start
+
+    # Esperar a que el pipeline quede vacío (dos chequeos seguidos: un consumidor puede estar entre get() y busy)
+    deadline = time.perf_counter() + args.drain_timeout
+    idle_checks = 0
+    while time.perf_counter() < deadline and idle_checks < 2:
+        idle_checks = idle_checks + 1 if pipeline.idle() else 0
+        time.sleep(0.1)
+    total_seconds = time.perf_counter() - start
+    pipeline.stop()
+
+    report(args, pipeline, tracker, model, deliveries, replay_seconds, total_seconds)
+
+
+if __name__ == '__main__':
+    main()
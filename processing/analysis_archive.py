@@ -0,0 +1,50 @@
+# Archivo del análisis de Vision completo de cada imagen (JSON comprimido con gzip), para re-evaluar sin Vision
+import gzip
+import json
+
+ARCHIVE_FORMAT = 1  # Versión del esquema del registro
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def build_record(message_id, user_id, image_path, result, vision_analysis):
+    """Registro archivado: análisis de Vision ya normalizado (parse_vision_response) + veredicto emitido"""
+    return {
+        'format': ARCHIVE_FORMAT,
+        'message_id': message_id,
+        'user_id': user_id,
+        'image_path': image_path,
+        'catalog_version': result.get('catalog_version'),
+        'product_type': result['product_type'],
+        'probability': result['probability'],
+        'anomalies': result['anomalies'],
+        'vision_analysis': {
+            'text_annotations': vision_analysis['text_annotations'],
+            'labels': vision_analysis['labels'],
+            'colors': vision_analysis['colors'],
+            'skipped_features': list(vision_analysis.get('skipped_features', ()))
+        }
+    }
+
+
+def encode_record(record, compresslevel=6):
+    """JSON sin espacios comprimido con gzip (el texto OCR repetido en cada palabra comprime bien)"""
+    return gzip.compress(dump_line(record), compresslevel=compresslevel)
+
+
+def dump_line(record):
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def decode_records(data):
+    """Registros de un objeto .json.gz, de un lote .jsonl.gz o de JSONL sin comprimir"""
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    for line in data.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def archive_blob_name(image_path, prefix='analysis/'):
+    """gs://bucket/<usuario>_<mensaje>.jpg → <prefix><usuario>_<mensaje>.json.gz"""
+    name = image_path.split('/', 3)[3] if image_path.startswith('gs://') else image_path
+    return f"{prefix}{name.rsplit('.', 1)[0]}.json.gz"
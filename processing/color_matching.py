@@ -0,0 +1,103 @@
+# Comparación vectorizada de colores en espacio CIELAB
+import numpy as np
+
+# Blanco de referencia D65 para la conversión XYZ → Lab
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+# Matriz sRGB (lineal) → XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+
+
+def rgb_to_lab(rgb):
+    """Convertir un array (..., 3) de RGB 0-255 a CIELAB"""
+    rgb = np.clip(np.asarray(rgb, dtype=np.float64) / 255.0, 0.0, 1.0)
+
+    # Quitar la corrección gamma de sRGB
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = (linear @ _RGB_TO_XYZ.T) / _D65_WHITE
+
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+
+    lightness = 116 * f[..., 1] - 16
+    a = 500 * (f[..., 0] - f[..., 1])
+    b = 200 * (f[..., 1] - f[..., 2])
+    return np.stack([lightness, a, b], axis=-1)
+
+
+def hex_to_rgb_array(hex_colors):
+    """Convertir lista de '#RRGGBB' a array (N, 3)"""
+    return np.array([[int(h[1:3], 16), int(h[3:5], 16), int(h[5:7], 16)] for h in hex_colors],
+                    dtype=np.float64).reshape(-1, 3)
+
+
+def rgb_array_to_hex(rgb):
+    """Convertir array (N, 3) de RGB 0-255 a lista de '#rrggbb'"""
+    values = np.clip(np.rint(rgb), 0, 255).astype(int)
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in values]
+
+
+def colors_to_arrays(colors):
+    """Colores de Vision → (rgb (N, 3), pesos (N,)) con pesos normalizados a 1"""
+    if not colors:
+        return np.empty((0, 3)), np.empty(0)
+
+    rgb = np.array([[c['color']['red'], c['color']['green'], c['color']['blue']] for c in colors],
+                   dtype=np.float64)
+    # Peso = relevancia de Vision × fracción de píxeles que ocupa el color
+    weights = np.array([c.get('score', 0.0) * c.get('pixel_fraction', 0.0) for c in colors],
+                       dtype=np.float64)
+    total = weights.sum()
+    weights = weights / total if total > 0 else np.full(len(colors), 1.0 / len(colors))
+    return rgb, weights
+
+
+# Motor de comparación contra todas las paletas de referencia
+class ColorMatcher:
+    def __init__(self, palettes, max_delta_e=25.0, top_colors=3):
+        """palettes: {product_type: ['#RRGGBB', ...]}"""
+        self.max_delta_e = max_delta_e  # ΔE76 máximo para considerar dos colores iguales
+        self.top_colors = top_colors    # Colores dominantes usados para contar coincidencias
+        self.brands = list(palettes)
+
+        rgb = [hex_to_rgb_array(palettes[brand]) for brand in self.brands]
+        self.palette_sizes = np.array([len(p) for p in rgb])
+        # Todas las paletas concatenadas + índice de marca de cada color
+        self.reference_lab = rgb_to_lab(np.concatenate(rgb)) if rgb else np.empty((0, 3))
+        self.reference_brand = np.repeat(np.arange(len(self.brands)), self.palette_sizes)
+
+    def match(self, colors):
+        """Comparar colores detectados contra todas las marcas en una sola operación
+
+        Devuelve {product_type: {'matched_colors': int, 'score': float}} donde
+        matched_colors cuenta los colores esperados presentes entre los dominantes
+        y score (0-1) mide qué tanto explica la paleta de la marca los colores
+        detectados, ponderados por score/pixel_fraction de Vision.
+        """
+        rgb, weights = colors_to_arrays(colors)
+        if len(rgb) == 0 or len(self.reference_lab) == 0:
+            return {brand: {'matched_colors': 0, 'score': 0.0} for brand in self.brands}
+
+        # Matriz de distancias (detectados × referencias)
+        detected_lab = rgb_to_lab(rgb)
+        distances = np.linalg.norm(detected_lab[:, None, :] - self.reference_lab[None, :, :], axis=-1)
+
+        # Colores esperados presentes entre los dominantes
+        present = (distances[:self.top_colors] <= self.max_delta_e).any(axis=0)
+        matched = np.bincount(self.reference_brand, weights=present, minlength=len(self.brands))
+
+        # Similitud de cada detectado con el color más cercano de cada marca
+        similarity = np.clip(1.0 - distances / (2 * self.max_delta_e), 0.0, 1.0)
+        best_per_brand = np.zeros((len(rgb), len(self.brands)))
+        np.maximum.at(best_per_brand.T, self.reference_brand, similarity.T)
+        scores = weights @ best_per_brand
+
+        return {
+            brand: {'matched_colors': int(matched[i]), 'score': round(float(scores[i]), 4)}
+            for i, brand in enumerate(self.brands)
+        }
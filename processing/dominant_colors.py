@@ -0,0 +1,78 @@
+# Colores dominantes calculados en proceso (k-means vectorizado), alternativa a IMAGE_PROPERTIES de Vision
+import io
+
+import numpy as np
+from PIL import Image
+
+from color_matching import rgb_to_lab
+
+
+def load_pixels(image_content, sample_side=96):
+    """Decodificar la imagen reducida a ~sample_side px de lado; retorna array (N, 3) RGB"""
+    with Image.open(io.BytesIO(image_content)) as image:
+        image.draft('RGB', (sample_side, sample_side))  # JPEG: decodificar ya reducida (DCT escalada)
+        image = image.convert('RGB')
+        image.thumbnail((sample_side, sample_side), Image.BILINEAR)
+        return np.asarray(image, dtype=np.float64).reshape(-1, 3)
+
+
+def cluster_sums(points, labels, k):
+    """Suma de los puntos de cada grupo (bincount por columna, más rápido que np.add.at)"""
+    return np.stack([np.bincount(labels, weights=points[:, c], minlength=k) for c in range(points.shape[1])], axis=1)
+
+
+def kmeans(points, k, iterations=12, seed=0):
+    """k-means con inicialización k-means++; retorna (centros (k, d), etiqueta por punto)"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    centers = np.empty((k, points.shape[1]))
+    centers[0] = points[rng.integers(len(points))]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers[i] = points[index]
+        closest = np.minimum(closest, ((points - centers[i]) ** 2).sum(axis=1))
+
+    labels = np.zeros(len(points), dtype=np.intp)
+    for iteration in range(iterations):
+        distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+        new_labels = distances.argmin(axis=1)
+        if iteration and np.array_equal(new_labels, labels):
+            break  # Convergió
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums = cluster_sums(points, labels, k)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]  # Un centro vacío conserva su posición
+    return centers, labels
+
+
+def extract_dominant_colors(image_content, max_colors=8, sample_side=96, iterations=12):
+    """Colores dominantes con la misma estructura que parse_vision_response:
+
+    [{'color': {'red', 'green', 'blue'}, 'score', 'pixel_fraction'}, ...] ordenados
+    por score. Se agrupa en CIELAB (distancias perceptuales, igual que ColorMatcher)
+    y el color de cada grupo es el promedio RGB de sus píxeles; score y
+    pixel_fraction son la fracción de píxeles del grupo.
+    """
+    rgb = load_pixels(image_content, sample_side)
+    if len(rgb) == 0:
+        return []
+
+    _, labels = kmeans(rgb_to_lab(rgb), max_colors, iterations)
+    counts = np.bincount(labels, minlength=max_colors)
+    sums = cluster_sums(rgb, labels, len(counts))
+
+    colors = []
+    for cluster in np.argsort(-counts):
+        if counts[cluster] == 0:
+            break
+        red, green, blue = np.rint(sums[cluster] / counts[cluster]).astype(int)
+        fraction = float(counts[cluster] / len(rgb))
+        colors.append({
+            'color': {'red': int(red), 'green': int(green), 'blue': int(blue)},
+            'score': round(fraction, 6),
+            'pixel_fraction': round(fraction, 6)
+        })
+    return colors
@@ -2,129 +2,326 @@
 import base64 # Para decodificar mensajes Pub/Sub
 import json
 import os
-from google.cloud import storage, vision, firestore
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import logging
 import functions_framework 
-from google.cloud import vision # Cloud Vision API
+from vision_cache import VisionCache, FirestoreCacheStore, LocalCacheStore
+from vision_batcher import VisionBatcher
+from result_writer import ResultWriter
+from color_matching import colors_to_arrays, rgb_array_to_hex
+from dominant_colors import extract_dominant_colors
+from product_catalog import CatalogLoader
+from analysis_archive import archive_blob_name, build_record, encode_record
+from shared.image_normalization import normalize_image
+from shared.idempotency import ClaimInProgress, create_idempotency_guard
+from shared.pubsub_publisher import BatchPublisher
+from shared.lazy import lazy_client
+from shared.metrics import CONTENT_TYPE, Metrics
 
 
 # Configuración
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'prj-botlabs-dev-aiasigna-images')
 PROJECT_ID = os.environ.get('GCP_PROJECT', 'prj-botlabs-dev')
+# 'single' → una sola petición annotate_image con todas las features
+# 'concurrent' → una llamada por feature, ejecutadas en paralelo
+# 'batched' → imágenes de mensajes concurrentes agrupadas en batch_annotate_images (modo worker)
+VISION_REQUEST_MODE = os.environ.get('VISION_REQUEST_MODE', 'single')
+VISION_BATCH_MAX_SIZE = int(os.environ.get('VISION_BATCH_MAX_SIZE', '8'))  # Máximo 16 por llamada
+VISION_BATCH_MAX_WAIT_MS = float(os.environ.get('VISION_BATCH_MAX_WAIT_MS', '50'))  # Presupuesto de espera por imagen
+VISION_BATCH_TIMEOUT = float(os.environ.get('VISION_BATCH_TIMEOUT', '60'))  # segundos esperando el lote (espera + llamada)
+
+# Features de Vision API disponibles: nombre → tipo de feature (vision.Feature.Type)
+VISION_FEATURES = {
+    'text': 'TEXT_DETECTION', # OCR
+    'labels': 'LABEL_DETECTION', # etiquetas
+    'colors': 'IMAGE_PROPERTIES', # colores dominantes
+}
+# Clave del resultado de analyze_with_vision_api que llena cada feature
+VISION_FEATURE_KEYS = {'text': 'text_annotations', 'labels': 'labels', 'colors': 'colors'}
+DEFAULT_VISION_FEATURES = tuple(
+    f.strip() for f in os.environ.get('VISION_FEATURES', 'text,labels,colors').split(',') if f.strip()
+)
+
+# Caché de resultados de Vision por hash de contenido
+VISION_CACHE_ENABLED = os.environ.get('VISION_CACHE_ENABLED', 'true').lower() == 'true'
+VISION_CACHE_MODE = os.environ.get('VISION_CACHE_MODE', 'sha256')  # 'sha256' exacto o 'phash' casi-duplicados
+VISION_CACHE_BACKEND = os.environ.get('VISION_CACHE_BACKEND', 'firestore')  # 'firestore', 'local' o 'none'
+VISION_CACHE_COLLECTION = os.environ.get('VISION_CACHE_COLLECTION', 'vision_cache')
+VISION_CACHE_MAX_ENTRIES = int(os.environ.get('VISION_CACHE_MAX_ENTRIES', '512'))
+VISION_CACHE_TTL_SECONDS = int(os.environ.get('VISION_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Comparación de colores: ΔE (CIELAB) máximo para considerar que un color coincide
+COLOR_MATCH_MAX_DELTA_E = float(os.environ.get('COLOR_MATCH_MAX_DELTA_E', '25'))
+
+# Búsqueda aproximada de textos del catálogo en el OCR: errores permitidos por carácter de la frase
+TEXT_MATCH_MAX_ERROR_RATE = float(os.environ.get('TEXT_MATCH_MAX_ERROR_RATE', '0.2'))
+
+# Origen de los colores dominantes: 'vision' (IMAGE_PROPERTIES) o 'local' (k-means en proceso, sin llamada a Vision)
+COLOR_SOURCE = os.environ.get('COLOR_SOURCE', 'vision')
+COLOR_MAX_COLORS = int(os.environ.get('COLOR_MAX_COLORS', '8'))
+COLOR_SAMPLE_SIDE = int(os.environ.get('COLOR_SAMPLE_SIDE', '96'))  # Lado de la imagen reducida para agrupar
+
+# Modo de análisis: 'full' (todas las features en una petición) o 'cascade' (por etapas en el orden
+# CASCADE_ORDER, deteniéndose cuando las features restantes ya no pueden cambiar la banda del veredicto)
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'full')
+CASCADE_ORDER = tuple(f.strip() for f in os.environ.get('CASCADE_ORDER', 'text,labels,colors').split(',') if f.strip())
+VERDICT_THRESHOLDS = (30, 70)  # Bandas de format_whatsapp_message en response: <30, <70, resto
+VISION_LABEL_MAX_RESULTS = 10  # Etiquetas que devuelve LABEL_DETECTION por defecto (cota de puntos de marca)
+MINOR_ANOMALY_WEIGHT = 8  # Peso de anomalías sin peso propio en el catálogo
+
+# Catálogo de referencias: archivo local o gs://bucket/ruta.json, recargado en caliente
+CATALOG_PATH = os.environ.get('CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog', 'products.json'))
+CATALOG_RELOAD_SECONDS = int(os.environ.get('CATALOG_RELOAD_SECONDS', '60'))
+
+# Jobs del webhook en modo fast_ack: la imagen se descarga de WhatsApp aquí
+IMAGE_NORMALIZATION_ENABLED = os.environ.get('IMAGE_NORMALIZATION_ENABLED', 'true').lower() == 'true'
+IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', '1600'))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+
+# Idempotencia por message_id: una reentrega de Pub/Sub o de WhatsApp no llega a Vision
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'firestore')  # 'firestore', 'local' o 'none'
+IDEMPOTENCY_COLLECTION = os.environ.get('IDEMPOTENCY_COLLECTION', 'processed_messages')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(7 * 24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '600'))  # Reserva mientras se procesa
+
+# Resultados: un documento por message_id + puntero al último resultado de cada usuario
+RESULTS_COLLECTION = os.environ.get('RESULTS_COLLECTION', 'analysis_results')
+LATEST_RESULTS_COLLECTION = os.environ.get('LATEST_RESULTS_COLLECTION', 'latest_results')
+# 'direct' → un commit por mensaje; 'batched' → commits agrupados entre mensajes concurrentes (modo worker)
+RESULT_WRITE_MODE = os.environ.get('RESULT_WRITE_MODE', 'direct')
+RESULT_BATCH_MAX_WRITES = int(os.environ.get('RESULT_BATCH_MAX_WRITES', '200'))  # 2 escrituras por mensaje, máximo 500
+RESULT_FLUSH_INTERVAL_MS = float(os.environ.get('RESULT_FLUSH_INTERVAL_MS', '50'))
+RESULT_WRITE_MAX_RETRIES = int(os.environ.get('RESULT_WRITE_MAX_RETRIES', '3'))  # Reintentos ante contención
+RESULT_WRITE_TIMEOUT = float(os.environ.get('RESULT_WRITE_TIMEOUT', '30'))  # segundos esperando el commit agrupado
+# Guardar también vision_analysis completo en el documento (response no lo lee)
+RESULT_INCLUDE_ANALYSIS_DATA = os.environ.get('RESULT_INCLUDE_ANALYSIS_DATA', 'false').lower() == 'true'
+RESULT_MAX_ANOMALIES = 5  # response muestra como máximo 5 anomalías
+
+# Análisis de Vision completo en GCS (.json.gz) para re-evaluar el historial con rescore.py sin llamar a Vision
+ANALYSIS_ARCHIVE_ENABLED = os.environ.get('ANALYSIS_ARCHIVE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_ARCHIVE_BUCKET = os.environ.get('ANALYSIS_ARCHIVE_BUCKET', BUCKET_NAME)
+ANALYSIS_ARCHIVE_PREFIX = os.environ.get('ANALYSIS_ARCHIVE_PREFIX', 'analysis/')
+
+# Evento de resultado para el servicio response (opt-in: el tópico debe existir; '' = sin eventos)
+RESULTS_TOPIC_NAME = os.environ.get('RESULTS_TOPIC_NAME', '')
+RESULT_EVENT_TIMEOUT = float(os.environ.get('RESULT_EVENT_TIMEOUT', '10'))  # segundos esperando confirmación
+
+# Modo worker (python main.py): streaming pull sobre la suscripción de jobs
+PROCESSING_SUBSCRIPTION = os.environ.get('PROCESSING_SUBSCRIPTION', 'aiasigna-image-processing-sub')
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', '8'))  # Imágenes en paralelo por instancia
+WORKER_MAX_MESSAGES = int(os.environ.get('WORKER_MAX_MESSAGES', str(WORKER_THREADS * 2)))  # Mensajes sin ack
+WORKER_MAX_BYTES = int(os.environ.get('WORKER_MAX_BYTES', str(10 * 1024 * 1024)))
+WORKER_MAX_LEASE_SECONDS = int(os.environ.get('WORKER_MAX_LEASE_SECONDS', '600'))  # Extensión máxima del lease
+WORKER_IN_PROGRESS_DELAY = int(os.environ.get('WORKER_IN_PROGRESS_DELAY', '60'))  # Reentrega de un duplicado en curso (10-600 s)
+
+# Métricas por etapa (GET /metrics del worker) y fracción de jobs con log estructurado
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+metrics = Metrics('processing', log_sample_rate=LOG_SAMPLE_RATE)
 
 # Clientes GCP inicializados
-storage_client = storage.Client() # Cloud Storage
-vision_client = vision.ImageAnnotatorClient() # Cloud vision API
-firestore_client = firestore.Client() # Firestore
+# (import y construcción en el primer uso: acorta el cold start)
+@lazy_client
+def storage_client(): # Cloud Storage
+    from google.cloud import storage
+    return storage.Client()
+
+@lazy_client
+def vision_client(): # Cloud vision API
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+@lazy_client
+def firestore_client(): # Firestore
+    from google.cloud import firestore
+    return firestore.Client()
+
+# Pool para el modo de llamadas concurrentes a Vision
+_vision_executor = ThreadPoolExecutor(max_workers=len(VISION_FEATURES))
+
+# Micro-batcher para el modo 'batched'
+vision_batcher = VisionBatcher(
+    vision_client,
+    max_batch_size=VISION_BATCH_MAX_SIZE,
+    max_wait_ms=VISION_BATCH_MAX_WAIT_MS
+) if VISION_REQUEST_MODE == 'batched' else None
+
+# Escritor de resultados para el modo 'batched'
+result_writer = ResultWriter(
+    firestore_client,
+    max_batch_writes=RESULT_BATCH_MAX_WRITES,
+    flush_interval_ms=RESULT_FLUSH_INTERVAL_MS,
+    max_retries=RESULT_WRITE_MAX_RETRIES
+) if RESULT_WRITE_MODE == 'batched' else None
+
+# Cliente de la Graph API compartido (descarga de media y confirmaciones)
+@lazy_client
+def whatsapp_client():
+    from shared.whatsapp_client import create_whatsapp_client
+    return create_whatsapp_client(metrics=metrics)
+
+# Publisher de eventos de resultado (lotes pequeños: un resultado por invocación)
+results_publisher = BatchPublisher(
+    f"projects/{PROJECT_ID}/topics/{RESULTS_TOPIC_NAME}",
+    max_messages=100,
+    max_latency=0.005
+) if RESULTS_TOPIC_NAME else None
+
+# Caché de Vision compartido por todas las invocaciones de la instancia
+def create_vision_cache():
+    """Crear caché de Vision según configuración"""
+    if not VISION_CACHE_ENABLED:
+        return None
+
+    shared_store = None
+    if VISION_CACHE_BACKEND == 'firestore':
+        shared_store = FirestoreCacheStore(firestore_client, VISION_CACHE_COLLECTION)
+    elif VISION_CACHE_BACKEND == 'local':
+        shared_store = LocalCacheStore()
+
+    return VisionCache(
+        shared_store=shared_store,
+        max_entries=VISION_CACHE_MAX_ENTRIES,
+        ttl_seconds=VISION_CACHE_TTL_SECONDS,
+        mode=VISION_CACHE_MODE
+    )
+
+vision_cache = create_vision_cache()
+
+idempotency_guard = create_idempotency_guard(
+    'processing',
+    IDEMPOTENCY_BACKEND,
+    firestore_client_factory=lambda: firestore_client,
+    collection=IDEMPOTENCY_COLLECTION,
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    lease_seconds=IDEMPOTENCY_LEASE_SECONDS
+)
 
 # Clase para procesamiento de imágenes
 class ImageProcessor:
-    def __init__(self):
-        self.authentic_products = self.load_authentic_references()
-    
+    def __init__(self, catalog_loader=None):
+        self.catalog_loader = catalog_loader or CatalogLoader(
+            CATALOG_PATH,
+            reload_seconds=CATALOG_RELOAD_SECONDS,
+            storage_client=storage_client,
+            color_match_max_delta_e=COLOR_MATCH_MAX_DELTA_E,
+            text_match_max_error_rate=TEXT_MATCH_MAX_ERROR_RATE
+        )
+        self.catalog_loader.get()  # Cargar el catálogo al construir el procesador
+
+    # catálogo vigente (se recarga si cambió el archivo)
+    @property
+    def catalog(self):
+        return self.catalog_loader.get()
+
     # referencias de productos auténticos
-    def load_authentic_references(self): 
-        """Cargar referencias de productos auténticos"""
+    @property
+    def authentic_products(self):
+        return self.catalog.products
+
+    # normalizar una sola vez el texto OCR y las etiquetas de la imagen
+    def normalize_analysis(self, vision_analysis):
+        """Texto OCR en mayúsculas y etiquetas en minúsculas, compartidos por todo el análisis"""
+        text = ' '.join([t['description'].upper() for t in vision_analysis['text_annotations']])
+        catalog = self.catalog  # misma versión del catálogo durante todo el análisis
         return {
-            "bayer": {
-                "brand_name": "BAYER",
-                "expected_colors": ["#FFFFFF", "#FF0000", "#0033A0"],  # Blanco, Rojo Bayer, Azul
-                "expected_fonts": ["Arial", "Helvetica"], # Fuentes comunes usadas por Bayer
-                "required_text": ["BAYER", "ASPIRINA", "REGISTRO", "SANITARIO", "LABORATORIO", "FABRICANTE"], # Texto clave esperado
-                "expected_labels": ["medicine", "pharmacy", "medical", "drug", "pill", "tablet", "bottle"],# Etiquetas comunes relacionadas
-                "security_features": ["Hologram", "QR Code", "Batch Number"],# Características de seguridad comunes
-                "packaging_elements": ["Cross logo", "Bayer logo", "Pharmaceutical symbols"] # Elementos visuales comunes
-            },
-            "fla": {
-                "brand_name": "FLA",
-                "expected_colors": ["#8B0000", "#FFD700", "#000000", "#FFFFFF"],  # Rojo oscuro, Dorado, Negro, Blanco
-                "expected_fonts": ["Times New Roman", "Georgia", "Serif"], # Fuentes usadaspor la fla
-                "required_text": ["FLA", "RON", "EL CONSUMO DE ESTE PRODUCTO ES NOCIVO PARA LA SALUD", "CONTENIDO", "Aguardiente Antioqueño", "BOTELLA", "IMPORTADO"],
-                "expected_labels": ["alcohol", "bottle", "wine", "beer", "liquor", "rum", "spirits"],
-                "security_features": ["Tax Stamp", "Seal", "Hologram"],
-                "packaging_elements": ["FLA logo", "Rum bottle", "Caribbean symbols"]
-            }
+            'catalog': catalog,
+            'text': text,
+            'text_matches': catalog.text_matcher.match(text),  # frase del catálogo → confianza (OCR aproximado)
+            'labels': [label['description'].lower() for label in vision_analysis['labels']],
+            'label_matches': {},  # product_type → etiquetas esperadas encontradas
+            'color_matches': None  # product_type → coincidencias de color (ver ColorMatcher.match)
         }
 
-    def process_image(self, image_path, product_type=None):  # product_type ahora es opcional
+    # contar etiquetas esperadas presentes (memoizado por tipo de producto)
+    def count_expected_labels(self, normalized, product_type):
+        """Número de etiquetas esperadas de la referencia encontradas en la imagen"""
+        matches = normalized['label_matches'].get(product_type)
+        if matches is None:
+            detected_labels = normalized['labels']
+            matches = sum(1 for expected in normalized['catalog'].compiled[product_type]['expected_labels']
+                          if any(expected in detected for detected in detected_labels))
+            normalized['label_matches'][product_type] = matches
+        return matches
+
+    # comparar colores detectados contra todas las paletas (memoizado por imagen)
+    def match_colors(self, vision_analysis, normalized):
+        """Coincidencias de color por marca calculadas en un solo lote"""
+        if normalized['color_matches'] is None:
+            normalized['color_matches'] = normalized['catalog'].color_matcher.match(vision_analysis['colors'][:5])
+        return normalized['color_matches']
+
+    def process_image(self, image_path, product_type=None, image_content=None):  # product_type ahora es opcional
         """Procesar imagen y detectar anomalías"""
         try:
-            # 1. Descargar imagen de Cloud Storage
-            image_content = self.download_image(image_path)
-            
-            # 2. Analizar con Cloud Vision API
-            vision_analysis = self.analyze_with_vision_api(image_content)
-            
-            # 3. Detectar tipo de producto automáticamente si no se especifica
-            if product_type is None:
-                product_type = self.detect_product_type(vision_analysis)
-                logging.info(f"Tipo de producto detectado: {product_type}")
+            # 1. Descargar imagen de Cloud Storage (si no se recibió ya en memoria)
+            if image_content is None:
+                with metrics.timer('gcs_fetch'):
+                    image_content = self.download_image(image_path)
             
-            # 4. Detección de anomalías vs referencias específicas
-            anomalies = self.detect_anomalies(vision_analysis, product_type)
+            # 2. Analizar con Cloud Vision API (o reutilizar resultado cacheado)
+            with metrics.timer('vision'):
+                if ANALYSIS_MODE == 'cascade':
+                    vision_analysis = self.analyze_image_cascade(image_content)
+                else:
+                    vision_analysis = self.analyze_image(image_content)
             
-            # 5. Calcular probabilidad de falsificación
-            probability = self.calculate_counterfeit_probability(anomalies, vision_analysis, product_type)
-            
-            return {
-                'probability': probability,
-                'anomalies': anomalies,
-                'product_type': product_type,
-                'brand': self.authentic_products[product_type]['brand_name'],
-                'vision_analysis': {
-                    'text_found': len(vision_analysis['text_annotations']) > 0,
-                    'labels_found': [label['description'] for label in vision_analysis['labels'][:5]],
-                    'dominant_colors': [self.rgb_to_hex(color['color']) for color in vision_analysis['colors'][:3]]
-                },
-                'status': 'completed'
-            }
+            # 3-5. Tipo de producto, anomalías y probabilidad
+            result = self.score_analysis(vision_analysis, product_type)
+            result['raw_vision_analysis'] = vision_analysis  # Para el archivo de análisis (no va a Firestore)
+            return result
             
         except Exception as e:
             logging.error(f"Error procesando imagen: {e}")
             raise
 
-    # detección automática de tipo de producto   
-    def detect_product_type(self, vision_analysis):
-        """Detectar automáticamente si es Bayer o FLA basado en texto y etiquetas"""
-        detected_text = ' '.join([t['description'].upper() for t in vision_analysis['text_annotations']])
-        detected_labels = [label['description'].lower() for label in vision_analysis['labels']]
+    # evaluar un análisis de Vision ya obtenido (también lo usa rescore.py sobre el archivo)
+    def score_analysis(self, vision_analysis, product_type=None):
+        """Detectar tipo de producto, anomalías y probabilidad a partir de vision_analysis"""
+        normalized = self.normalize_analysis(vision_analysis)
         
-        # Puntaje para cada marca
-        bayer_score = 0
-        fla_score = 0
+        # 3. Detectar tipo de producto automáticamente si no se especifica
+        if product_type is None:
+            with metrics.timer('detect_product_type'):
+                product_type = self.detect_product_type(vision_analysis, normalized)
+            logging.info(f"Tipo de producto detectado: {product_type}")
         
-        # Verificar texto específico de Bayer
-        bayer_keywords = ["BAYER", "ASPIRINA", "MEDICAMENTO", "FARMACIA", "LABORATORIO"]
-        for keyword in bayer_keywords:
-            if keyword in detected_text:
-                bayer_score += 2
+        # 4. Detección de anomalías vs referencias específicas
+        with metrics.timer('detect_anomalies'):
+            anomalies = self.detect_anomalies(vision_analysis, product_type, normalized)
         
-        # Verificar texto específico de FLA
-        fla_keywords = ["FLA", "RON", "LICOR", "ALCOHOL", "BOTELLA", "DISTRIBUIDOR"]
-        for keyword in fla_keywords:
-            if keyword in detected_text:
-                fla_score += 2
+        # 5. Calcular probabilidad de falsificación
+        with metrics.timer('scoring'):
+            probability = self.calculate_counterfeit_probability(anomalies, vision_analysis, product_type, normalized)
         
-        # Verificar etiquetas de Vision API
-        bayer_labels = ["medicine", "pharmacy", "medical", "drug", "pill", "tablet"]
-        fla_labels = ["alcohol", "bottle", "wine", "beer", "liquor", "rum"]
-        
-        for label in detected_labels:
-            if any(bayer_label in label for bayer_label in bayer_labels):
-                bayer_score += 1
-            if any(fla_label in label for fla_label in fla_labels):
-                fla_score += 1
-        
-        logging.info(f"Puntajes - Bayer: {bayer_score}, FLA: {fla_score}")
-        
-        # Determinar tipo de producto
-        if bayer_score > fla_score and bayer_score >= 2:
-            return "bayer"
-        elif fla_score > bayer_score and fla_score >= 2:
-            return "fla"
-        else:
-            logging.warning("No se pudo determinar el tipo de producto, usando Bayer por defecto")
-            return "bayer"     
+        return {
+            'probability': probability,
+            'anomalies': anomalies,
+            'product_type': product_type,
+            'brand': normalized['catalog'].products[product_type]['brand_name'],
+            'catalog_version': normalized['catalog'].version,
+            'vision_analysis': {
+                'text_found': len(vision_analysis['text_annotations']) > 0,
+                'labels_found': [label['description'] for label in vision_analysis['labels'][:5]],
+                'dominant_colors': rgb_array_to_hex(colors_to_arrays(vision_analysis['colors'][:3])[0]),
+                'color_match_score': self.match_colors(vision_analysis, normalized)[product_type]['score'],
+                'required_text_confidence': {
+                    required: normalized['text_matches'].get(required, 0.0)
+                    for required in normalized['catalog'].compiled[product_type]['required_text']
+                }
+            },
+            'skipped_features': list(vision_analysis.get('skipped_features', ())),
+            'status': 'completed'
+        }
+
+    # detección automática de tipo de producto   
+    def detect_product_type(self, vision_analysis, normalized=None):
+        """Detectar la marca con el índice de palabras clave y etiquetas del catálogo"""
+        normalized = normalized or self.normalize_analysis(vision_analysis)
+        return normalized['catalog'].detect(normalized['text_matches'], normalized['labels'])
 
     # descargar imagen de Cloud Storage
     def download_image(self, gcs_path):
@@ -137,32 +334,190 @@ class ImageProcessor:
         blob = bucket.blob(blob_name)
         return blob.download_as_bytes()
     
-    # análisis con vision API - llamadas paralelas a visión api OCR, labels, colors
-    def analyze_with_vision_api(self, image_content):
+    # análisis con caché delante de Vision API
+    def analyze_image(self, image_content, features=None):
+        """Analizar imagen consultando primero el caché por hash de contenido"""
+        features = tuple(features or DEFAULT_VISION_FEATURES)
+        # Features no pedidas (VISION_FEATURES): no cuentan como datos faltantes al detectar anomalías
+        skipped = tuple(f for f in VISION_FEATURE_KEYS if f not in features)
+        # Con COLOR_SOURCE=local no se pide IMAGE_PROPERTIES a Vision
+        local_colors = COLOR_SOURCE == 'local' and 'colors' in features
+        if local_colors:
+            features = tuple(f for f in features if f != 'colors')
+
+        if not features:
+            analysis = self.parse_vision_response(None)
+        elif vision_cache is None:
+            analysis = self.analyze_with_vision_api(image_content, features)
+        else:
+            analysis = vision_cache.get_or_compute(
+                image_content,
+                features,
+                lambda: self.analyze_with_vision_api(image_content, features)
+            )
+
+        if local_colors:
+            with metrics.timer('colors_local'):
+                analysis = dict(analysis, colors=extract_dominant_colors(
+                    image_content, max_colors=COLOR_MAX_COLORS, sample_side=COLOR_SAMPLE_SIDE))
+        if skipped:
+            analysis = dict(analysis, skipped_features=skipped)
+        return analysis
+
+    # modo cascada: pedir features solo mientras puedan cambiar la banda del veredicto
+    def analyze_image_cascade(self, image_content):
+        """Analizar por etapas (CASCADE_ORDER); el análisis lleva 'skipped_features' con lo que no se pidió"""
+        stages = [(f,) for f in CASCADE_ORDER if f in DEFAULT_VISION_FEATURES]
+        if COLOR_SOURCE == 'local' and ('colors',) in stages and len(stages) > 1:
+            # Colores locales: no cuestan una llamada a Vision, van en la primera etapa
+            stages.remove(('colors',))
+            stages[0] += ('colors',)
+
+        analysis = self.parse_vision_response(None)
+        known, requested_stages = set(), 0
+        for i, stage in enumerate(stages):
+            requested_stages += 1
+            partial = self.analyze_image(image_content, stage)
+            for feature in stage:
+                analysis[VISION_FEATURE_KEYS[feature]] = partial[VISION_FEATURE_KEYS[feature]]
+            known.update(stage)
+
+            remaining = [f for pending in stages[i + 1:] for f in pending]
+            if not remaining:
+                break
+            low, high = self.probability_bounds(analysis, known)
+            settled = verdict_band(low) == verdict_band(high)
+            logging.info(f"Cascada tras {'+'.join(stage)}: probabilidad posible {low}-{high}% → "
+                         f"{'veredicto decidido, se omiten ' + '+'.join(remaining) if settled else 'continuar'}")
+            if settled:
+                break
+
+        skipped = tuple(f for f in VISION_FEATURE_KEYS if f not in known)  # Incluye las que VISION_FEATURES excluye
+        for feature in skipped:
+            metrics.inc('cascade_features', feature=feature, outcome='skipped')
+        for feature in known:
+            metrics.inc('cascade_features', feature=feature, outcome='requested')
+        metrics.log_sample('cascade', requested=sorted(known), skipped=list(skipped), stages=requested_stages)
+        analysis['skipped_features'] = skipped
+        return analysis
+
+    # rango de probabilidad alcanzable con las features que faltan
+    def probability_bounds(self, vision_analysis, known):
+        """(mínimo, máximo) de calculate_counterfeit_probability sobre toda marca y resultado posible"""
+        skipped = tuple(f for f in VISION_FEATURE_KEYS if f not in known)
+        analysis = dict(vision_analysis, skipped_features=skipped)
+        normalized = self.normalize_analysis(analysis)
+        catalog = normalized['catalog']
+
+        # La marca queda fija con texto y etiquetas, o si la ventaja por texto supera lo que sumarían las etiquetas
+        candidates = list(catalog.products)
+        if {'text', 'labels'} <= known:
+            candidates = [self.detect_product_type(analysis, normalized)]
+        elif 'text' in known:
+            ranking = catalog.score_brands(normalized['text_matches'], [])
+            if ranking:
+                best_type, best_score = ranking[0]
+                runner_up = ranking[1][1] if len(ranking) > 1 else 0
+                if best_score - VISION_LABEL_MAX_RESULTS > runner_up and best_score >= catalog.min_detection_score:
+                    candidates = [best_type]
+
+        low, high = 100, 0
+        for product_type in candidates:
+            reference = catalog.compiled[product_type]
+            weights = reference['weights']
+            anomalies = self.detect_anomalies(analysis, product_type, normalized)
+            points = self.counterfeit_points(anomalies, analysis, product_type, normalized)
+            min_points = max_points = points
+
+            if 'colors' not in known:
+                outcomes = [None] + [{'matched_colors': n} for n in range(3)]
+                max_points += max(sum(anomaly_weight(a, weights) for a in self.check_color_anomalies(o)) for o in outcomes)
+            if 'labels' not in known:
+                max_points += max(sum(anomaly_weight(a, weights) for a in self.check_label_anomalies(n)) for n in range(3))
+                if len(reference['expected_labels']) >= 3:
+                    min_points -= 10  # Bonificación por 3+ etiquetas esperadas
+            if 'text' not in known:
+                max_points += len(reference['required_text']) * weights['texto_no_encontrado'] \
+                    + weights['texto_ilegible'] + 15
+
+            low = min(low, clamp_probability(min_points))
+            high = max(high, clamp_probability(max_points))
+        return low, high
+
+    # análisis con vision API - una sola petición con OCR, labels y colors
+    def analyze_with_vision_api(self, image_content, features=None):
         """Analizar imagen con Google Vision API"""
+        features = tuple(features or DEFAULT_VISION_FEATURES)
+        unknown = [f for f in features if f not in VISION_FEATURES]
+        if unknown:
+            raise ValueError(f"Features de Vision no soportadas: {unknown}")
+
+        if VISION_REQUEST_MODE == 'concurrent':
+            return self.analyze_with_vision_api_concurrent(image_content, features)
+
+        from google.cloud import vision
+
+        request = vision.AnnotateImageRequest(
+            image=vision.Image(content=image_content),
+            features=[vision.Feature(type_=vision.Feature.Type[VISION_FEATURES[f]]) for f in features]
+        )
+        # Solo las llamadas reales (la etapa 'vision' incluye los aciertos de caché)
+        with metrics.timer('vision_api'):
+            if vision_batcher is not None:
+                response = vision_batcher.annotate(request, timeout=VISION_BATCH_TIMEOUT)
+            else:
+                response = vision_client.annotate_image(request=request)
+        # En modo batched el error de una imagen no afecta a las demás del lote
+        if response.error.message:
+            raise RuntimeError(f"Error de Vision API: {response.error.message}")
+
+        return self.parse_vision_response(response)
+
+    # fallback - una llamada por feature ejecutadas en paralelo
+    def analyze_with_vision_api_concurrent(self, image_content, features=None):
+        """Analizar imagen con llamadas concurrentes por feature"""
+        from google.cloud import vision
+
+        features = tuple(features or DEFAULT_VISION_FEATURES)
         image = vision.Image(content=image_content)
-        
-        # 1. OCR - detección de texto
-        text_response = vision_client.text_detection(image=image)
-        # 2. label detection - identificación de objetos
-        label_response = vision_client.label_detection(image=image)
-         # 3. image properties - colors dominantes
-        color_response = vision_client.image_properties(image=image)
-        
+        calls = {
+            'text': vision_client.text_detection,
+            'labels': vision_client.label_detection,
+            'colors': vision_client.image_properties,
+        }
+
+        futures = {f: _vision_executor.submit(calls[f], image=image) for f in features}
+
+        analysis = self.parse_vision_response(None)
+        for feature, future in futures.items():
+            response = future.result()
+            if response.error.message:
+                raise RuntimeError(f"Error de Vision API ({feature}): {response.error.message}")
+            partial = self.parse_vision_response(response)
+            key = VISION_FEATURE_KEYS[feature]
+            analysis[key] = partial[key]
+        return analysis
+
+    # convertir respuesta de Vision al diccionario usado por el análisis
+    def parse_vision_response(self, response):
+        """Convertir AnnotateImageResponse a text_annotations/labels/colors"""
+        if response is None:
+            return {'text_annotations': [], 'labels': [], 'colors': []}
+
         return {
             'text_annotations': [
                 {
                     'description': annotation.description,
                     'confidence': getattr(annotation, 'confidence', 0.0)
                 }
-                for annotation in text_response.text_annotations
+                for annotation in response.text_annotations
             ],
             'labels': [
                 {
                     'description': label.description,
                     'score': label.score
                 }
-                for label in label_response.label_annotations
+                for label in response.label_annotations
             ],
             'colors': [
                 {
@@ -174,64 +529,60 @@ class ImageProcessor:
                     'score': color.score,
                     'pixel_fraction': color.pixel_fraction
                 }
-                for color in color_response.image_properties_annotation.dominant_colors.colors
+                for color in response.image_properties_annotation.dominant_colors.colors
             ]
         }
     
     # detección de anomalías
-    def detect_anomalies(self, vision_analysis, product_type):
+    def detect_anomalies(self, vision_analysis, product_type, normalized=None):
         """✅ DETECCIÓN MEJORADA DE ANOMALÍAS"""
         anomalies = []
-        reference = self.authentic_products[product_type]
+        normalized = normalized or self.normalize_analysis(vision_analysis)
+        reference = normalized['catalog'].compiled[product_type]
+        skipped = vision_analysis.get('skipped_features', ())  # Modo cascada: features no pedidas
         
         # Verificar texto requerido
-        detected_text = ' '.join([t['description'].upper() for t in vision_analysis['text_annotations']])
-        text_anomalies = self.check_text_anomalies(detected_text, reference['required_text'])
-        anomalies.extend(text_anomalies)
+        if 'text' not in skipped:
+            text_anomalies = self.check_text_anomalies(normalized['text_matches'], reference['required_text'])
+            anomalies.extend(text_anomalies)
         
         # Verificar colors 
-        detected_colors = [c['color'] for c in vision_analysis['colors'][:5]]
-        color_anomalies = self.check_color_anomalies(detected_colors, reference['expected_colors'])
-        anomalies.extend(color_anomalies)
+        if 'colors' not in skipped:
+            color_match = self.match_colors(vision_analysis, normalized)[product_type] if vision_analysis['colors'] else None
+            color_anomalies = self.check_color_anomalies(color_match)
+            anomalies.extend(color_anomalies)
         
         # Verificar etiquetas
-        label_anomalies = self.check_label_anomalies(vision_analysis['labels'], reference['expected_labels'])
-        anomalies.extend(label_anomalies)
+        if 'labels' not in skipped:
+            label_anomalies = self.check_label_anomalies(self.count_expected_labels(normalized, product_type))
+            anomalies.extend(label_anomalies)
         
         # Verificar calidad de imagen
-        if len(vision_analysis['text_annotations']) < 2:
+        if 'text' not in skipped and len(vision_analysis['text_annotations']) < 2:
             anomalies.append("Texto en etiqueta poco claro o ilegible")
         
         return anomalies
     
     # verificación de texto requerido MLheurística
-    def check_text_anomalies(self, detected_text, required_texts):
-        """ Verificar texto requerido"""
+    def check_text_anomalies(self, text_matches, required_texts):
+        """ Verificar texto requerido (text_matches: frases encontradas por el matcher aproximado)"""
         anomalies = []
         for required in required_texts:
-            if required not in detected_text:
+            if required not in text_matches:
                 anomalies.append(f"Texto requerido no encontrado: '{required}'")
         return anomalies
     
     # verificación de colores
-    def check_color_anomalies(self, detected_colors, expected_colors_hex):
+    def check_color_anomalies(self, color_match):
         """ VERIFICACIÓN MEJORADA DE COLORES"""
         anomalies = []
         
-        if not detected_colors:
+        if not color_match:
             anomalies.append("No se pudieron detectar colores en la imagen")
             return anomalies
         
-        # Convertir colores detectados a HEX
-        detected_hex = [self.rgb_to_hex(color) for color in detected_colors[:3]] # Usar solo los 3 colores dominantes
-        
-        # Verificar similitud con colores esperados
-        color_matches = 0
-        for expected_hex in expected_colors_hex:
-            for detected_hex_color in detected_hex:
-                if self.color_similarity(expected_hex, detected_hex_color) > 0.7: # umbral de similitud
-                    color_matches += 1
-                    break
+        # Colores esperados presentes entre los 3 dominantes (ver ColorMatcher)
+        color_matches = color_match['matched_colors']
         
         if color_matches < 1:
             anomalies.append("Inconsistencias significativas en colores de etiqueta")
@@ -241,13 +592,9 @@ class ImageProcessor:
         return anomalies
     
     # verificación de etiquetas
-    def check_label_anomalies(self, detected_labels, expected_labels):
+    def check_label_anomalies(self, expected_found):
         """ Verificar etiquetas esperadas"""
         anomalies = []
-        detected_label_descriptions = [label['description'].lower() for label in detected_labels]
-        
-        expected_found = sum(1 for expected in expected_labels 
-                           if any(expected in detected for detected in detected_label_descriptions))
         
         if expected_found == 0:
             anomalies.append("No se detectaron características esperadas del producto")
@@ -256,134 +603,361 @@ class ImageProcessor:
             
         return anomalies
     
-    # convertir RGB a Hexadecimal
-    def rgb_to_hex(self, color):
-        """Convertir RGB a HEX"""
-        r = int(color['red'] * 255)
-        g = int(color['green'] * 255) 
-        b = int(color['blue'] * 255)
-        return f"#{r:02x}{g:02x}{b:02x}"
-    
-    # calcular similitud entre colores
-    def color_similarity(self, hex1, hex2):
-        """✅ CALCULAR SIMILITUD ENTRE COLORES HEX"""
-        # Convertir HEX a RGB
-        r1, g1, b1 = int(hex1[1:3], 16), int(hex1[3:5], 16), int(hex1[5:7], 16) # RGB del color 1
-        r2, g2, b2 = int(hex2[1:3], 16), int(hex2[3:5], 16), int(hex2[5:7], 16) # RGB del color 2
-        
-        # Calcular distancia euclidiana
-        distance = ((r1 - r2) ** 2 + (g1 - g2) ** 2 + (b1 - b2) ** 2) ** 0.5
-        max_distance = (255 ** 2 * 3) ** 0.5 # Distancia máxima posible
-        
-        # Convertir a similitud (1 = idéntico, 0 = completamente diferente)
-        similarity = 1 - (distance / max_distance)
-        return similarity
-    
     # cálculo de probabilidad de falsificación     
-    def calculate_counterfeit_probability(self, anomalies, vision_analysis, product_type):
+    def calculate_counterfeit_probability(self, anomalies, vision_analysis, product_type, normalized=None):
         """✅ ALGORITMO DE PROBABILIDAD"""
+        return clamp_probability(self.counterfeit_points(anomalies, vision_analysis, product_type, normalized))
+
+    # puntos de probabilidad antes de acotar a 5-95
+    def counterfeit_points(self, anomalies, vision_analysis, product_type, normalized=None):
+        """Base + pesos de anomalías + ajustes de calidad (sin acotar)"""
         base_probability = 10  # Probabilidad base
         
-        # Pesos dinámicos basados en la importancia para cada producto
-        weights = {
-            "bayer": {
-                'texto_no_encontrado': 30,      # Crítico en medicamentos
-                'inconsistencias_significativas_colores': 25,
-                'inconsistencias_leves_colores': 15,
-                'no_caracteristicas_esperadas': 40,  #  importante
-                'pocas_caracteristicas': 20,
-                'texto_ilegible': 35,           #  importante
-                'falta_sello_seguridad': 50     
-            },
-            "fla": {
-                'texto_no_encontrado': 20,
-                'inconsistencias_significativas_colores': 35,  #  importante en licores
-                'inconsistencias_leves_colores': 20,
-                'no_caracteristicas_esperadas': 25,
-                'pocas_caracteristicas': 15,
-                'texto_ilegible': 20,
-                'falta_sello_seguridad': 30    
-            }
-        }    
-
-        product_weights = weights[product_type]
-        total_increase = 0
+        # Pesos dinámicos basados en la importancia para cada producto (definidos en el catálogo)
+        normalized = normalized or self.normalize_analysis(vision_analysis)
+        product_weights = normalized['catalog'].compiled[product_type]['weights']
+        skipped = vision_analysis.get('skipped_features', ())
         
         # Evaluar cada anomalía y sumar su peso
-        for anomaly in anomalies:
-            if "Texto requerido no encontrado" in anomaly:
-                total_increase += product_weights['texto_no_encontrado']
-            elif "Inconsistencias significativas" in anomaly:
-                total_increase += product_weights['inconsistencias_significativas_colores']
-            elif "Ligeras inconsistencias" in anomaly:
-                total_increase += product_weights['inconsistencias_leves_colores']
-            elif "No se detectaron características" in anomaly:
-                total_increase += product_weights['no_caracteristicas_esperadas']
-            elif "Pocas características" in anomaly:
-                total_increase += product_weights['pocas_caracteristicas']
-            elif "Texto en etiqueta poco claro" in anomaly:
-                total_increase += product_weights['texto_ilegible']
-            elif "Sello de seguridad" in anomaly:
-                total_increase += product_weights['falta_sello_seguridad']
-            else:
-                total_increase += 8 # Peso por anomalías menores
+        total_increase = sum(anomaly_weight(anomaly, product_weights) for anomaly in anomalies)
+        
+        # Texto requerido encontrado con errores de OCR: suma la parte del peso que no cubre la confianza
+        if 'text' not in skipped:
+            for required in normalized['catalog'].compiled[product_type]['required_text']:
+                confidence = normalized['text_matches'].get(required)
+                if confidence is not None:
+                    total_increase += (1 - confidence) * product_weights['texto_no_encontrado']
         
         # Factores de ajuste basados en calidad de análisis
         quality_adjustment = 0
 
         # Penalizar si no se detectó texto - prudto con texto poco claro
-        if not vision_analysis['text_annotations']:
+        if 'text' not in skipped and not vision_analysis['text_annotations']:
             quality_adjustment += 15
         
         # Bonificar si se detectan múltiples características esperadas
-        expected_labels = self.authentic_products[product_type]['expected_labels']
-        detected_labels = [label['description'].lower() for label in vision_analysis['labels']]
-        matches = sum(1 for expected in expected_labels if any(expected in detected for detected in detected_labels)) # 
+        matches = self.count_expected_labels(normalized, product_type) if 'labels' not in skipped else 0
         
         if matches >= 3:  # Si coincide con 3+ características, reducir probabilidad
             quality_adjustment -= 10
         
-        total_probability = min(base_probability + total_increase + quality_adjustment, 95) # Máximo 95% evitar falsos positivos extremos.
-        return max(5, total_probability)  # Mínimo 5% de probabilidad evitar dar certeza absoluta de autenticidad
+        return round(base_probability + total_increase + quality_adjustment)
+
+# Peso de una anomalía según el catálogo de la marca
+def anomaly_weight(anomaly, product_weights):
+    if "Texto requerido no encontrado" in anomaly:
+        return product_weights['texto_no_encontrado']
+    if "Inconsistencias significativas" in anomaly:
+        return product_weights['inconsistencias_significativas_colores']
+    if "Ligeras inconsistencias" in anomaly:
+        return product_weights['inconsistencias_leves_colores']
+    if "No se detectaron características" in anomaly:
+        return product_weights['no_caracteristicas_esperadas']
+    if "Pocas características" in anomaly:
+        return product_weights['pocas_caracteristicas']
+    if "Texto en etiqueta poco claro" in anomaly:
+        return product_weights['texto_ilegible']
+    if "Sello de seguridad" in anomaly:
+        return product_weights['falta_sello_seguridad']
+    return MINOR_ANOMALY_WEIGHT # Peso por anomalías menores
+
+def clamp_probability(points):
+    """Máximo 95% para evitar falsos positivos extremos; mínimo 5% para no dar certeza absoluta de autenticidad"""
+    return max(5, min(points, 95))
+
+def verdict_band(probability):
+    """Índice de la banda del veredicto (mismos umbrales que response)"""
+    return sum(probability >= threshold for threshold in VERDICT_THRESHOLDS)
+
+# Procesador caliente reutilizado por todas las invocaciones de la instancia
+_processor = None
+_processor_lock = threading.Lock()
+
+def get_processor():
+    """Obtener el ImageProcessor de la instancia (se construye una sola vez)"""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = ImageProcessor()
+    return _processor
 
 # Manejador de Cloud Functions para Pub/Sub
 @functions_framework.cloud_event
 def process_image_pubsub(cloud_event):
     """Manejador de Pub/Sub para procesamiento de imágenes"""
+    # Decodificar mensaje de Pub/Sub
+    message_data = json.loads(base64.b64decode(cloud_event.data['message']['data']).decode('utf-8'))
+    handle_image_job(message_data)
+
+# Procesar un job de imagen (Cloud Function o worker de streaming pull)
+def handle_image_job(message_data):
+    """Procesar, guardar y publicar el resultado; relanza la excepción para que Pub/Sub reintente"""
+    start = time.perf_counter()
     try:
-        # Decodificar mensaje de Pub/Sub
-        message_data = json.loads(base64.b64decode(cloud_event.data['message']['data']).decode('utf-8'))
+        # Descartar reentregas antes de descargar la imagen o llamar a Vision
+        if idempotency_guard is not None and not idempotency_guard.claim(message_data['message_id']):
+            logging.info(f"Mensaje duplicado descartado: {message_data['message_id']}")
+            metrics.inc('processing_jobs', outcome='duplicate')
+            return
         
         logging.info(f"Iniciando procesamiento para usuario: {message_data['user_id']}")
         
-        processor = ImageProcessor()
-        
+        processor = get_processor()
+        
+        # Job del modo fast_ack: descargar la imagen de WhatsApp y subirla a GCS
+        image_content = None
+        if 'image_path' not in message_data:
+            # Reentrega tras un fallo posterior a la subida: retomar desde GCS sin descargar ni avisar otra vez
+            message_data['image_path'] = ingested_image_path(message_data)
+            if not message_data['image_path']:
+                with metrics.timer('ingest'):
+                    message_data['image_path'], image_content = ingest_whatsapp_media(message_data)
+                if not message_data['image_path']:
+                    send_text_message(message_data['user_id'], "❌ Error al descargar la imagen. Por favor intenta nuevamente.")
+                    if idempotency_guard is not None:
+                        idempotency_guard.complete(message_data['message_id'])
+                    metrics.inc('processing_jobs', outcome='download_failed')
+                    return
+                send_text_message(message_data['user_id'], "🔄 Procesando tu imagen... Esto puede tomar unos segundos.")
         
         result = processor.process_image(
             image_path=message_data['image_path'],
-            product_type=None # Detectar automáticamente el tipo de producto
+            product_type=None, # Detectar automáticamente el tipo de producto
+            image_content=image_content # Imagen ya descargada (fast_ack) para no leerla de GCS
         )
         
         # Guardar resultado en Firestore
-        save_to_firestore(message_data['user_id'], message_data['message_id'], result)
-        
+        with metrics.timer('firestore_write'):
+            save_to_firestore(message_data['user_id'], message_data['message_id'], result)
+        
+        # Enviar el resultado ya calculado a response (sin volver a leer Firestore)
+        with metrics.timer('publish_result'):
+            publish_result_event(message_data['user_id'], message_data['message_id'], result)
+        
+        # Archivar el análisis completo (después de notificar: no retrasa la respuesta al usuario)
+        if ANALYSIS_ARCHIVE_ENABLED:
+            with metrics.timer('archive_write'):
+                archive_analysis(message_data, result)
+        if idempotency_guard is not None:
+            idempotency_guard.complete(message_data['message_id'])
+        
+        elapsed = time.perf_counter() - start
+        metrics.observe('job', elapsed)
+        metrics.inc('processing_jobs', outcome='completed')
+        metrics.log_sample('processing_job', message_id=message_data['message_id'], product_type=result['product_type'],
+                           probability=result['probability'], anomalies=len(result['anomalies']),
+                           elapsed_ms=round(elapsed * 1000, 2))
         logging.info(f"Procesamiento completado para {message_data['user_id']}: {result['probability']}%")
-        
+        if vision_cache is not None:
+            logging.info(f"Caché de Vision: {vision_cache.stats()}")
+        if vision_batcher is not None:
+            logging.info(f"Lotes de Vision: {vision_batcher.stats()}")
+        if result_writer is not None:
+            logging.info(f"Escrituras de resultados: {result_writer.stats()}")
+        
+    except ClaimInProgress:
+        # Otro intento sigue con el job: relanzar para que Pub/Sub lo reentregue (sin liberar su reserva)
+        logging.info(f"Mensaje en proceso en otra instancia, se reintentará: {message_data['message_id']}")
+        metrics.inc('processing_jobs', outcome='in_progress')
+        raise
     except Exception as e:
-        logging.error(f"Error en process_image_pubsub: {e}")
+        logging.error(f"Error en handle_image_job: {e}")
+        metrics.inc('processing_jobs', outcome='error')
+        # Liberar la reserva para que el reintento de Pub/Sub pueda procesar el mensaje
+        if idempotency_guard is not None and 'message_id' in message_data:
+            idempotency_guard.release(message_data['message_id'])
         raise
 
 def save_to_firestore(user_id, message_id, result):
-    """Guardar resultados en Firestore"""
-    doc_ref = firestore_client.collection('analysis_results').document()
-    doc_ref.set({
+    """Guardar resultados en Firestore (ID del documento = message_id); retorna con el commit hecho"""
+    from google.cloud.firestore import SERVER_TIMESTAMP
+
+    timestamp = SERVER_TIMESTAMP
+    # Solo los campos que lee response
+    summary = {
+        'probability': result['probability'],
+        'anomalies': result['anomalies'][:RESULT_MAX_ANOMALIES],
+        'status': 'completed',
+        'timestamp': timestamp
+    }
+    document = {'user_id': user_id, 'message_id': message_id, **summary}
+    if RESULT_INCLUDE_ANALYSIS_DATA:
+        document['analysis_data'] = result.get('vision_analysis', {})
+
+    # El resultado y el puntero van en el mismo commit: response los lee con una sola lectura puntual
+    writes = [
+        (firestore_client.collection(RESULTS_COLLECTION).document(message_id), document),
+        (firestore_client.collection(LATEST_RESULTS_COLLECTION).document(user_id), {'message_id': message_id, **summary})
+    ]
+    if result_writer is not None:
+        # Espera el commit agrupado: el ack del mensaje nunca se adelanta a la escritura
+        result_writer.write(writes, timeout=RESULT_WRITE_TIMEOUT)
+    else:
+        batch = firestore_client.batch()
+        for doc_ref, data in writes:
+            batch.set(doc_ref, data)
+        batch.commit()
+    
+    logging.info(f"Resultados guardados en Firestore para {user_id}")
+
+# Publicar evento compacto de resultado para el servicio response
+def publish_result_event(user_id, message_id, result):
+    """Publicar y esperar la confirmación: si falla, Pub/Sub reintenta el job completo"""
+    if results_publisher is None:
+        return
+    results_publisher.publish({
         'user_id': user_id,
         'message_id': message_id,
-        'timestamp': firestore.SERVER_TIMESTAMP,
         'probability': result['probability'],
         'anomalies': result['anomalies'],
-        'analysis_data': result.get('vision_analysis', {}),
         'status': 'completed'
-    })
-    
-    logging.info(f"Resultados guardados en Firestore para {user_id}")
\ No newline at end of file
+    }).result(timeout=RESULT_EVENT_TIMEOUT)
+
+# Guardar el análisis de Vision y el veredicto junto a la imagen (entrada de rescore.py)
+def archive_analysis(message_data, result):
+    """Subir el registro .json.gz; un error solo se registra (el archivo no es parte de la respuesta)"""
+    try:
+        record = build_record(message_data['message_id'], message_data['user_id'], message_data['image_path'],
+                              result, result['raw_vision_analysis'])
+        blob_name = archive_blob_name(message_data['image_path'], ANALYSIS_ARCHIVE_PREFIX)
+        storage_client.bucket(ANALYSIS_ARCHIVE_BUCKET).blob(blob_name).upload_from_string(
+            encode_record(record), content_type='application/gzip')
+        metrics.inc('analysis_archive', outcome='written')
+    except Exception as e:
+        logging.error(f"Error archivando análisis de {message_data['message_id']}: {e}")
+        metrics.inc('analysis_archive', outcome='error')
+
+# Descargar media de WhatsApp, normalizarla y subirla a GCS (jobs fast_ack)
+def ingest_whatsapp_media(message_data):
+    """Retorna (ruta gs://, bytes de la imagen) o (None, None) si falla la descarga"""
+    try:
+        image_content = whatsapp_client.download_media(message_data['media_id'])
+        if not image_content:
+            return None, None
+
+        if IMAGE_NORMALIZATION_ENABLED:
+            image_content, _ = normalize_image(image_content, max_side=IMAGE_MAX_SIDE, jpeg_quality=IMAGE_JPEG_QUALITY)
+
+        file_name = ingest_file_name(message_data)
+        storage_client.bucket(BUCKET_NAME).blob(file_name).upload_from_string(image_content, content_type='image/jpeg')
+        return f"gs://{BUCKET_NAME}/{file_name}", image_content
+
+    except Exception as e:
+        logging.error(f"Error en ingest_whatsapp_media: {e}")
+        return None, None
+
+def ingest_file_name(message_data):
+    return f"{message_data['user_id']}_{message_data['message_id']}.jpg"
+
+# Imagen de un job fast_ack ya subida por un intento anterior (la subida es atómica: si existe, está completa)
+def ingested_image_path(message_data):
+    """Ruta gs:// si el objeto ya existe; None si hay que ingerir (o si GCS no responde)"""
+    file_name = ingest_file_name(message_data)
+    try:
+        if not storage_client.bucket(BUCKET_NAME).blob(file_name).exists():
+            return None
+    except Exception as e:
+        logging.warning(f"No se pudo comprobar {file_name} en GCS, se vuelve a descargar: {e}")
+        return None
+    logging.info(f"Imagen ya subida en un intento anterior: {file_name}")
+    return f"gs://{BUCKET_NAME}/{file_name}"
+
+# Enviar mensaje de texto a WhatsApp (confirmaciones de jobs fast_ack)
+def send_text_message(user_id, text):
+    """Enviar mensaje de texto; retorna True si WhatsApp lo aceptó"""
+    return whatsapp_client.send_text(user_id, text)
+
+# Worker de streaming pull: jobs en paralelo con un solo ImageProcessor y clientes compartidos
+def run_worker():
+    """Consumir PROCESSING_SUBSCRIPTION hasta recibir SIGTERM"""
+    from google.cloud import pubsub_v1
+
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(PROJECT_ID, PROCESSING_SUBSCRIPTION)
+    get_processor()  # Cargar catálogo antes del primer mensaje
+
+    def callback(message):
+        start = time.monotonic()
+        try:
+            message_data = json.loads(message.data.decode('utf-8'))
+            if not isinstance(message_data, dict):
+                raise ValueError(f"se esperaba un objeto, llegó {type(message_data).__name__}")
+        except ValueError as e:
+            # Mensaje mal formado: reentregarlo no lo arregla, se descarta con ack
+            logging.error(f"Mensaje {message.message_id} descartado, JSON inválido: {e}")
+            metrics.inc('processing_jobs', outcome='invalid')
+            message.ack()
+            return
+        try:
+            handle_image_job(message_data)
+        except ClaimInProgress:
+            # Otro intento tiene el job: reentregar tras WORKER_IN_PROGRESS_DELAY (un nack reentrega de inmediato)
+            message.modify_ack_deadline(WORKER_IN_PROGRESS_DELAY)
+            message.drop()
+            return
+        except Exception:
+            # nack: Pub/Sub lo reentrega (la reserva de idempotencia ya se liberó)
+            message.nack()
+            return
+        message.ack()
+        logging.info(f"Job {message.message_id} terminado en {time.monotonic() - start:.2f}s")
+
+    # El cliente extiende el lease de los mensajes en curso hasta max_lease_duration (Vision lento)
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=WORKER_MAX_MESSAGES,
+        max_bytes=WORKER_MAX_BYTES,
+        max_lease_duration=WORKER_MAX_LEASE_SECONDS
+    )
+    scheduler = pubsub_v1.subscriber.scheduler.ThreadScheduler(
+        ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='worker')
+    )
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path,
+        callback=callback,
+        flow_control=flow_control,
+        scheduler=scheduler,
+        await_callbacks_on_shutdown=True  # Terminar los jobs en curso antes de salir
+    )
+
+    # SIGTERM de Cloud Run/GKE: dejar de recibir y esperar los jobs en curso
+    # (reemplaza el handler del publisher de resultados, que se vacía igual con atexit al salir)
+    signal.signal(signal.SIGTERM, lambda signum, frame: streaming_pull_future.cancel())
+    start_health_server()
+
+    logging.info(f"Worker escuchando {subscription_path} ({WORKER_THREADS} hilos, {WORKER_MAX_MESSAGES} mensajes)")
+    with subscriber:
+        try:
+            streaming_pull_future.result()
+        except Exception as e:
+            logging.error(f"Streaming pull detenido: {e}")
+            streaming_pull_future.cancel()
+            streaming_pull_future.result()
+    logging.info("Worker detenido")
+
+# Health check HTTP para Cloud Run (solo si se define PORT)
+def start_health_server():
+    """Responder 200 en PORT mientras el worker está vivo; /metrics expone las métricas"""
+    if not os.environ.get('PORT'):
+        return
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body, content_type = b'OK', 'text/plain'
+            if self.path.rstrip('/') == '/metrics':
+                body, content_type = metrics.render().encode('utf-8'), CONTENT_TYPE
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', int(os.environ['PORT'])), HealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_worker()
@@ -0,0 +1,157 @@
+# Catálogo de productos auténticos con índice invertido para detección de marca
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from color_matching import ColorMatcher
+from text_matching import PhraseMatcher
+
+
+# Catálogo inmutable ya indexado (se reemplaza completo al recargar)
+class ProductCatalog:
+    def __init__(self, data, color_match_max_delta_e=25.0, text_match_max_error_rate=0.2):
+        self.version = data.get('version', 'unversioned')
+        self.products = data['products']
+        self.default_product = data.get('default_product') or next(iter(self.products))
+        self.min_detection_score = data.get('min_detection_score', 2)
+        self.compiled = {product_type: self.compile_reference(reference)
+                         for product_type, reference in self.products.items()}
+
+        # Índices invertidos: palabra clave → {product_type}, término de etiqueta → {product_type}
+        self.keyword_index = defaultdict(set)
+        self.label_index = defaultdict(set)
+        self._label_candidates = {}  # etiqueta de Vision → marcas (memo de la búsqueda por subcadena)
+        for product_type, reference in self.compiled.items():
+            for keyword in reference['detection_text']:
+                self.keyword_index[keyword].add(product_type)
+            for label in reference['detection_labels']:
+                self.label_index[label].add(product_type)
+
+        # Un solo matcher aproximado para los textos requeridos y las palabras clave de todas las marcas
+        self.text_matcher = PhraseMatcher(
+            [text for reference in self.compiled.values() for text in reference['required_text']] +
+            list(self.keyword_index),
+            max_error_rate=text_match_max_error_rate
+        )
+
+        self.color_matcher = ColorMatcher(
+            {product_type: reference['expected_colors'] for product_type, reference in self.products.items()},
+            max_delta_e=color_match_max_delta_e
+        )
+
+    # precompilar una referencia en estructuras listas para usar
+    def compile_reference(self, reference):
+        """Precalcular textos, etiquetas y palabras clave de detección"""
+        detection = reference.get('detection', {})
+        return {
+            'required_text': tuple(text.upper() for text in reference['required_text']),
+            'expected_labels': tuple(label.lower() for label in reference['expected_labels']),
+            'expected_colors': reference['expected_colors'],
+            'detection_text': tuple(keyword.upper() for keyword in detection.get('text', [])),
+            'detection_labels': tuple(label.lower() for label in detection.get('labels', [])),
+            'weights': reference['weights']
+        }
+
+    # puntajes por marca a partir del índice (solo marcas candidatas)
+    def score_brands(self, text_matches, labels, top_k=3):
+        """Top-k (product_type, puntaje): 2 puntos por palabra clave encontrada en el OCR, 1 por etiqueta"""
+        scores = defaultdict(int)
+
+        # text_matches: resultado de text_matcher.match (frase → confianza)
+        for phrase in text_matches:
+            for product_type in self.keyword_index.get(phrase, ()):
+                scores[product_type] += 2
+
+        for label in labels:
+            # Cada etiqueta suma como máximo un punto por marca
+            for product_type in self.label_candidates(label):
+                scores[product_type] += 1
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def label_candidates(self, label):
+        """Marcas con algún término de detección contenido en la etiqueta ('alcohol' en 'alcoholic beverage')"""
+        candidates = self._label_candidates.get(label)
+        if candidates is None:
+            # Las etiquetas de Vision son un vocabulario acotado: se recorre el índice una vez por etiqueta distinta
+            candidates = frozenset(product_type for term, product_types in self.label_index.items()
+                                   if term in label for product_type in product_types)
+            self._label_candidates[label] = candidates
+        return candidates
+
+    def detect(self, text_matches, labels):
+        """Elegir la marca con mayor puntaje o la marca por defecto si hay empate o es insuficiente"""
+        ranking = self.score_brands(text_matches, labels)
+        logging.info(f"Puntajes de marca (catálogo {self.version}): {ranking}")
+
+        if ranking:
+            best_type, best_score = ranking[0]
+            runner_up = ranking[1][1] if len(ranking) > 1 else 0
+            if best_score > runner_up and best_score >= self.min_detection_score:
+                return best_type
+
+        logging.warning(f"No se pudo determinar el tipo de producto, usando {self.default_product} por defecto")
+        return self.default_product
+
+
+# Cargador con recarga en caliente (archivo local o gs://)
+class CatalogLoader:
+    def __init__(self, path, reload_seconds=60, storage_client=None, color_match_max_delta_e=25.0,
+                 text_match_max_error_rate=0.2):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.storage_client = storage_client
+        self.color_match_max_delta_e = color_match_max_delta_e
+        self.text_match_max_error_rate = text_match_max_error_rate
+        self._catalog = None
+        self._stamp = None  # mtime local o generation de GCS
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Catálogo vigente; revisa si cambió como máximo cada reload_seconds"""
+        if self._catalog is not None and time.monotonic() - self._checked_at < self.reload_seconds:
+            return self._catalog
+
+        with self._lock:
+            if self._catalog is None or time.monotonic() - self._checked_at >= self.reload_seconds:
+                self._reload_if_changed()
+            return self._catalog
+
+    def _reload_if_changed(self):
+        self._checked_at = time.monotonic()
+        try:
+            stamp = self._current_stamp()
+            if self._catalog is not None and stamp == self._stamp:
+                return
+
+            catalog = ProductCatalog(json.loads(self._read()), self.color_match_max_delta_e,
+                                     self.text_match_max_error_rate)
+            self._catalog, self._stamp = catalog, stamp
+            logging.info(f"Catálogo cargado: versión {catalog.version}, {len(catalog.products)} productos")
+        except Exception as e:
+            if self._catalog is None:
+                raise
+            # Conservar el catálogo anterior si la nueva versión no es válida
+            logging.error(f"Error recargando catálogo {self.path}: {e}")
+
+    def _blob(self):
+        bucket_name, blob_name = self.path[len('gs://'):].split('/', 1)
+        return self.storage_client.bucket(bucket_name).blob(blob_name)
+
+    def _current_stamp(self):
+        if self.path.startswith('gs://'):
+            blob = self._blob()
+            blob.reload()
+            return blob.generation
+        return os.stat(self.path).st_mtime_ns
+
+    def _read(self):
+        if self.path.startswith('gs://'):
+            return self._blob().download_as_bytes()
+        with open(self.path, 'rb') as f:
+            return f.read()
@@ -0,0 +1,212 @@
+"""Re-evaluar análisis archivados con el catálogo y el código actuales, sin llamar a Vision
+
+Lee los registros que escribe archive_analysis (un .json.gz por imagen bajo
+ANALYSIS_ARCHIVE_PREFIX), repite detect_product_type, detect_anomalies y el
+cálculo de probabilidad (ImageProcessor.score_analysis) en un pool de
+procesos y reporta los veredictos que cambian respecto al emitido.
+
+Fuentes: prefijo gs://, directorio con .json.gz / .jsonl.gz, o archivo.
+--export guarda lo leído en un solo lote .jsonl.gz para repetir sin GCS.
+
+Uso (desde la raíz del repositorio):
+    PYTHONPATH=. python processing/rescore.py gs://bucket/analysis/ --export historial.jsonl.gz
+    PYTHONPATH=. python processing/rescore.py historial.jsonl.gz --catalog nuevo.json --diff cambios.jsonl
+"""
+import argparse
+import gzip
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from analysis_archive import GZIP_MAGIC, decode_records, dump_line
+from product_catalog import CatalogLoader
+import main as processing
+
+# Nombre de cada banda del veredicto (índices de verdict_band)
+BAND_NAMES = [f'<{processing.VERDICT_THRESHOLDS[0]}%'] + [
+    f'{low}-{high - 1}%' for low, high in zip(processing.VERDICT_THRESHOLDS, processing.VERDICT_THRESHOLDS[1:])
+] + [f'≥{processing.VERDICT_THRESHOLDS[-1]}%']
+
+# Procesador de cada proceso del pool
+_processor = None
+
+
+def init_worker(catalog_path):
+    global _processor
+    logging.getLogger().setLevel(logging.ERROR)  # Sin el aviso de marca por defecto en cada registro
+    _processor = processing.ImageProcessor(CatalogLoader(
+        catalog_path,
+        reload_seconds=float('inf'),  # Mismo catálogo durante toda la corrida
+        storage_client=processing.storage_client,
+        color_match_max_delta_e=processing.COLOR_MATCH_MAX_DELTA_E,
+        text_match_max_error_rate=processing.TEXT_MATCH_MAX_ERROR_RATE
+    ))
+
+
+def compare(record, result):
+    """Veredicto archivado vs re-evaluado; 'detail' solo si algo cambió"""
+    old_band = processing.verdict_band(record['probability'])
+    new_band = processing.verdict_band(result['probability'])
+    outcome = {
+        'catalog_version': record.get('catalog_version'),
+        'bands': (old_band, new_band),
+        'product_changed': record['product_type'] != result['product_type'],
+        'delta': result['probability'] - record['probability'],
+        'detail': None
+    }
+    added = [a for a in result['anomalies'] if a not in record['anomalies']]
+    removed = [a for a in record['anomalies'] if a not in result['anomalies']]
+    if outcome['delta'] or outcome['product_changed'] or added or removed:
+        outcome['detail'] = {
+            'message_id': record['message_id'],
+            'user_id': record['user_id'],
+            'image_path': record['image_path'],
+            'probability': [record['probability'], result['probability']],
+            'verdict': [BAND_NAMES[old_band], BAND_NAMES[new_band]],
+            'product_type': [record['product_type'], result['product_type']],
+            'anomalies_added': added,
+            'anomalies_removed': removed
+        }
+    return outcome
+
+
+def rescore_chunk(items):
+    """Re-evaluar un lote de objetos .json.gz o líneas JSON; retorna (resultados, errores)"""
+    outcomes, errors = [], 0
+    for item in items:
+        try:
+            for record in decode_records(item):
+                outcomes.append(compare(record, _processor.score_analysis(record['vision_analysis'])))
+        except Exception as e:
+            errors += 1
+            logging.error(f"Registro inválido: {e}")
+    return outcomes, errors
+
+
+def iter_items(source, download_threads):
+    """Objetos comprimidos o líneas JSON de la fuente, en orden y sin cargarla completa en memoria"""
+    if source.startswith('gs://'):
+        bucket_name, _, prefix = source[len('gs://'):].partition('/')
+        blobs = processing.storage_client.list_blobs(bucket_name, prefix=prefix)
+        archived = (blob for blob in blobs if blob.name.endswith('.gz'))  # Un solo generador para todas las páginas
+        with ThreadPoolExecutor(max_workers=download_threads) as pool:
+            while True:
+                page = list(itertools.islice(archived, download_threads * 4))
+                if not page:
+                    return
+                yield from pool.map(lambda blob: blob.download_as_bytes(), page)
+    elif os.path.isdir(source):
+        for directory, _, files in os.walk(source):
+            for name in sorted(files):
+                yield from iter_items(os.path.join(directory, name), download_threads)
+    elif source.endswith('.jsonl.gz') or source.endswith('.jsonl'):
+        opener = gzip.open if source.endswith('.gz') else open
+        with opener(source, 'rb') as f:
+            yield from (line for line in f if line.strip())
+    elif source.endswith('.json.gz'):
+        with open(source, 'rb') as f:
+            yield f.read()
+
+
+def exported(items, export_file):
+    """Copiar cada registro leído al lote .jsonl.gz de --export"""
+    for item in items:
+        if item[:2] == GZIP_MAGIC:
+            for record in decode_records(item):
+                export_file.write(dump_line(record) + b'\n')
+        else:
+            export_file.write(item.rstrip(b'\n') + b'\n')
+        yield item
+
+
+def chunked(items, size):
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(items, catalog_path, workers, chunk_size):
+    """Resultados de todos los lotes; con workers > 1, como máximo 2 lotes pendientes por proceso"""
+    if workers <= 1:
+        init_worker(catalog_path)
+        yield from map(rescore_chunk, chunked(items, chunk_size))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(catalog_path,)) as pool:
+        pending = set()
+        for chunk in chunked(items, chunk_size):
+            pending.add(pool.submit(rescore_chunk, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+        yield from (future.result() for future in pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', nargs='+', help='gs://bucket/prefijo/, directorio, .json.gz o .jsonl.gz')
+    parser.add_argument('--catalog', default=processing.CATALOG_PATH, help='catálogo a evaluar (local o gs://)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--download-threads', type=int, default=32)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--diff', help='JSONL con el detalle de cada registro cuyo resultado cambió')
+    parser.add_argument('--export', help='guardar los registros leídos en un lote .jsonl.gz')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    items = itertools.chain.from_iterable(iter_items(source, args.download_threads) for source in args.source)
+    if args.limit:
+        items = itertools.islice(items, args.limit)
+    export_file = gzip.open(args.export, 'wb') if args.export else None
+    if export_file:
+        items = exported(items, export_file)
+    diff_file = open(args.diff, 'wb') if args.diff else None
+
+    total, errors = 0, 0
+    transitions, versions = Counter(), Counter()
+    product_changes, deltas = 0, []
+    start = time.perf_counter()
+    try:
+        for outcomes, chunk_errors in run(items, args.catalog, args.workers, args.chunk_size):
+            errors += chunk_errors
+            for outcome in outcomes:
+                total += 1
+                versions[outcome['catalog_version']] += 1
+                transitions[outcome['bands']] += 1
+                product_changes += outcome['product_changed']
+                if outcome['delta']:
+                    deltas.append(abs(outcome['delta']))
+                if diff_file and outcome['detail']:
+                    diff_file.write(dump_line(outcome['detail']) + b'\n')
+    finally:
+        for f in (export_file, diff_file):
+            if f:
+                f.close()
+    elapsed = time.perf_counter() - start
+
+    catalog_version = CatalogLoader(args.catalog, storage_client=processing.storage_client).get().version
+    changed = sum(n for (old, new), n in transitions.items() if old != new)
+    print(f"Registros: {total} re-evaluados, {errors} con error, en {elapsed:.2f} s "
+          f"({total / elapsed if elapsed else 0:.0f} registros/s, {max(1, args.workers)} procesos)")
+    print(f"Catálogo: {catalog_version} (archivados con {dict(versions)})")
+    print(f"Veredicto cambiado: {changed} ({changed / total if total else 0:.1%})")
+    for (old, new), n in sorted(transitions.items()):
+        if old != new:
+            print(f"  {BAND_NAMES[old]:>7} → {BAND_NAMES[new]:<7} {n}")
+    print(f"Marca detectada cambiada: {product_changes}")
+    if deltas:
+        print(f"Probabilidad cambiada: {len(deltas)}, |Δ| medio {sum(deltas) / len(deltas):.1f}, máx {max(deltas)}")
+    else:
+        print("Probabilidad cambiada: 0")
+    if args.diff:
+        print(f"Detalle de cambios: {args.diff}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# Escrituras de resultados agrupadas en batches de Firestore
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Errores transitorios de Firestore (contención o disponibilidad) que se reintentan, subclases incluidas
+# (ResourceExhausted hereda de TooManyRequests); import diferido para no cargar google.api_core al arrancar
+def retryable_errors():
+    from google.api_core.exceptions import (
+        Aborted, DeadlineExceeded, InternalServerError, ServiceUnavailable, TooManyRequests
+    )
+    return (Aborted, DeadlineExceeded, ServiceUnavailable, InternalServerError, TooManyRequests)
+
+
+# Agrupa las escrituras de varios mensajes en un solo commit
+class ResultWriter:
+    def __init__(self, client, max_batch_writes=200, flush_interval_ms=50, max_retries=3, backoff_base=0.2):
+        if not 1 <= max_batch_writes <= 500:
+            raise ValueError("max_batch_writes debe estar entre 1 y 500 (límite de Firestore)")
+
+        self.client = client
+        self.max_batch_writes = max_batch_writes
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._pending = []  # (escrituras, future, encolado en)
+        self._pending_writes = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {
+            'commits': 0,
+            'messages': 0,
+            'writes': 0,
+            'retries': 0,
+            'failed_commits': 0,
+            'commit_seconds_total': 0.0,
+            'wait_seconds_total': 0.0,
+        }
+
+    def write(self, writes, timeout=None):
+        """Escribir y esperar el commit: al retornar, los documentos ya son durables"""
+        return self.submit(writes).result(timeout)
+
+    def submit(self, writes):
+        """Encolar las escrituras [(doc_ref, data), ...] de un mensaje; el Future se resuelve al hacer commit"""
+        if len(writes) > self.max_batch_writes:
+            raise ValueError(f"Un mensaje no puede tener más de {self.max_batch_writes} escrituras")
+
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+                self._thread.start()
+            self._pending.append((writes, future, time.monotonic()))
+            self._pending_writes += len(writes)
+            self._cond.notify()
+        return future
+
+    # hilo colector: commit al llenar el batch o al vencer flush_interval desde el mensaje más antiguo
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0][2] + self.flush_interval
+                while self._pending_writes < self.max_batch_writes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Un error inesperado falla solo este batch: el colector sigue atendiendo a los demás
+                logging.error(f"Error en el escritor de resultados ({len(batch)} mensajes): {e}")
+                self._fail(batch, e)
+
+    def _take_batch(self):
+        batch, writes = [], 0
+        while self._pending and writes + len(self._pending[0][0]) <= self.max_batch_writes:
+            item = self._pending.pop(0)
+            batch.append(item)
+            writes += len(item[0])
+        self._pending_writes -= writes
+        return batch
+
+    def _commit(self, batch):
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                write_batch = self.client.batch()
+                for writes, _, _ in batch:
+                    for doc_ref, data in writes:
+                        write_batch.set(doc_ref, data)
+                write_batch.commit()
+                break
+            except Exception as e:
+                if not isinstance(e, retryable_errors()) or attempt >= self.max_retries:
+                    logging.error(f"Error en commit de resultados ({len(batch)} mensajes): {e}")
+                    self._record(batch, started_at, failed=True)
+                    self._fail(batch, e)
+                    return
+                attempt += 1
+                self._count('retries')
+                delay = self.backoff_base * (2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+                logging.warning(f"Commit de resultados reintento {attempt}/{self.max_retries} en {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+        self._record(batch, started_at)
+        for _, future, _ in batch:
+            future.set_result(True)
+
+    def _fail(self, batch, error):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _record(self, batch, started_at, failed=False):
+        with self._cond:
+            self._stats['failed_commits' if failed else 'commits'] += 1
+            if failed:
+                return
+            self._stats['messages'] += len(batch)
+            self._stats['writes'] += sum(len(writes) for writes, _, _ in batch)
+            self._stats['commit_seconds_total'] += time.monotonic() - started_at
+            self._stats['wait_seconds_total'] += sum(started_at - enqueued_at for _, _, enqueued_at in batch)
+
+    def stats(self):
+        """Commits, mensajes por commit y latencias promedio de espera y commit"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        commits = stats['commits']
+        stats['avg_messages_per_commit'] = round(stats['messages'] / commits, 2) if commits else 0.0
+        stats['avg_commit_ms'] = round(stats['commit_seconds_total'] / commits * 1000, 2) if commits else 0.0
+        stats['avg_wait_ms'] = round(stats['wait_seconds_total'] / stats['messages'] * 1000, 2) if stats['messages'] else 0.0
+        return stats
@@ -0,0 +1,98 @@
+"""Pruebas de text_matching: distancia acotada contra la DP de Levenshtein y casos de OCR del catálogo
+
+Uso (desde la raíz del repositorio):
+    python -m pytest -q processing/tests
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from text_matching import PhraseMatcher, bounded_edit_distance, normalize_tokens  # noqa: E402
+
+
+def levenshtein(pattern, text, semi_global=False):
+    """DP de referencia; con semi_global, pattern contra la mejor subcadena de text"""
+    previous = [0] * (len(text) + 1) if semi_global else list(range(len(text) + 1))
+    rows = [previous]
+    for i, char in enumerate(pattern, 1):
+        current = [i]
+        for j, other in enumerate(text, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+        rows.append(current)
+    return min(previous) if semi_global else previous[-1]
+
+
+def random_pairs(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        pattern = ''.join(rng.choice('ABCD') for _ in range(rng.randint(1, 12)))
+        text = ''.join(rng.choice('ABCD') for _ in range(rng.randint(0, 20)))
+        yield pattern, text
+
+
+def test_anchored_distance_matches_dp():
+    for pattern, text in random_pairs(3000):
+        assert bounded_edit_distance(pattern, text, 99, anchored=True) == levenshtein(pattern, text), (pattern, text)
+
+
+def test_semi_global_distance_matches_dp():
+    for pattern, text in random_pairs(3000, seed=1):
+        assert bounded_edit_distance(pattern, text, 99) == levenshtein(pattern, text, semi_global=True), (pattern, text)
+
+
+def test_distance_above_bound_is_none():
+    for pattern, text in random_pairs(1000, seed=2):
+        expected = levenshtein(pattern, text)
+        for bound in range(4):
+            result = bounded_edit_distance(pattern, text, bound, anchored=True)
+            assert result == (expected if expected <= bound else None), (pattern, text, bound)
+
+
+def test_normalize_tokens_strips_accents_and_punctuation():
+    assert normalize_tokens('Ácido acetil-salicílico\n500 mg, ÑANDÚ') == ['ACIDO', 'ACETIL', 'SALICILICO', '500', 'MG', 'NANDU']
+
+
+def test_single_word_does_not_match_inside_longer_token():
+    matcher = PhraseMatcher(['BAYER', 'FABRICANTE'])
+    assert matcher.match('PLAYER') == {}
+    assert matcher.match('BAYERISCHE') == {}
+
+
+def test_single_word_does_not_match_across_words():
+    matcher = PhraseMatcher(['FABRICANTE'])
+    assert matcher.match('FABRICA DE LICORES') == {}
+
+
+def test_single_word_with_ocr_errors():
+    matcher = PhraseMatcher(['ASPIRINA', 'FABRICANTE', 'BAYER'])
+    assert matcher.match('ASIRINA')['ASPIRINA'] == 0.875
+    assert matcher.match('G FARCANTE G')['FABRICANTE'] == 0.8
+    assert matcher.match('Bayer S.A.')['BAYER'] == 1.0
+
+
+def test_phrase_split_across_lines_or_glued():
+    matcher = PhraseMatcher(['LABORATORIOS BAYER'])
+    assert matcher.match('LABORATO\nRIOS BAYER') == {'LABORATORIOS BAYER': 1.0}
+    assert matcher.match('LABORATORIOSBAYER') == {'LABORATORIOS BAYER': 1.0}
+    assert matcher.match('lote 123 Laboratorios\nBayer S.A.') == {'LABORATORIOS BAYER': 1.0}
+
+
+def test_deletion_at_start_of_text():
+    # El inicio estimado queda en la diagonal -1: debe verificarse igual
+    matcher = PhraseMatcher(['LABORATORIOS BAYER'])
+    assert matcher.match('ABORATORIOS BAYER') == {'LABORATORIOS BAYER': round(1 - 1 / 17, 4)}
+
+
+def test_short_phrases_require_exact_tokens():
+    # Frases sin margen de error (max_errors == 0): tokens consecutivos exactos
+    matcher = PhraseMatcher(['USP', 'MK'])
+    assert matcher.match('MK 500 USP') == {'USP': 1.0, 'MK': 1.0}
+    assert matcher.match('MKS USPX') == {}
+
+
+def test_too_many_errors_do_not_match():
+    matcher = PhraseMatcher(['LABORATORIOS BAYER'], max_error_rate=0.2)
+    assert matcher.match('LAXOXAXOXIOS BAYER') == {}
@@ -0,0 +1,163 @@
+# Búsqueda aproximada de frases del catálogo en el texto OCR (índice de q-gramas + distancia de edición acotada)
+import re
+import unicodedata
+from collections import defaultdict
+
+# Tokens tras normalizar: letras y dígitos sin acentos, en mayúsculas
+TOKEN_PATTERN = re.compile(r'[A-Z0-9]+')
+
+
+def normalize_tokens(text):
+    """Mayúsculas sin acentos ni puntuación; los saltos de línea y espacios solo separan tokens"""
+    text = text.upper()
+    if not text.isascii():
+        # Separar acentos y descartar lo que no es ASCII (Ñ → N, Á → A)
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return TOKEN_PATTERN.findall(text)
+
+
+def pattern_masks(pattern):
+    """Carácter → máscara de bits de sus posiciones en pattern (entrada de bounded_edit_distance)"""
+    masks = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def bounded_edit_distance(pattern, text, max_distance, masks=None, anchored=False):
+    """Menor distancia de Levenshtein entre pattern y cualquier subcadena de text; None si supera max_distance
+
+    Algoritmo bit-paralelo de Myers: una columna de la matriz de distancias por
+    carácter del texto, con la frase completa en un entero de Python. Con
+    anchored, distancia entre pattern y text completo.
+    """
+    masks = masks or pattern_masks(pattern)
+    full = (1 << len(pattern)) - 1
+    last = 1 << (len(pattern) - 1)
+    positive, negative = full, 0  # Diferencias verticales +1 / -1 de la columna actual
+    score = best = len(pattern)
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        horizontal_positive = negative | ~(xh | positive)
+        horizontal_negative = positive & xh
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+            if score < best:
+                best = score
+        # Sin arrastre del bit 0: la coincidencia puede empezar en cualquier posición del texto
+        horizontal_positive = (horizontal_positive << 1) | anchored
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(xv | horizontal_positive)) & full
+        negative = horizontal_positive & xv & full
+    if anchored:
+        best = score
+    return best if best <= max_distance else None
+
+
+# Matcher precompilado para todas las frases de un catálogo
+class PhraseMatcher:
+    def __init__(self, phrases, max_error_rate=0.2):
+        """phrases: textos tal como aparecen en el catálogo (la clave del resultado de match)"""
+        self.max_error_rate = max_error_rate
+        self.phrases = []  # (frase, tokens, frase sin espacios, errores permitidos, máscaras de bits)
+        self.exact_index = defaultdict(list)  # primer token → [id] (frases sin margen de error)
+        self.gram_index = {2: defaultdict(list), 3: defaultdict(list)}  # q → q-grama → [(id, offset)]
+        self.token_gram_index = {2: defaultdict(list), 3: defaultdict(list)}  # q → q-grama → [id] (una palabra)
+        self.min_votes = []  # q-gramas compartidos mínimos para verificar un candidato
+
+        for phrase in dict.fromkeys(phrases):
+            tokens = tuple(normalize_tokens(phrase))
+            if not tokens:
+                continue
+            compact = ''.join(tokens)
+            max_errors = int(len(compact) * max_error_rate)
+            phrase_id = len(self.phrases)
+            self.phrases.append((phrase, tokens, compact, max_errors, pattern_masks(compact)))
+
+            if max_errors == 0:
+                self.exact_index[tokens[0]].append(phrase_id)
+                self.min_votes.append(None)
+                continue
+
+            # Lema de q-gramas: una aparición con ≤k errores comparte ≥ m-q+1-k·q q-gramas con la frase
+            q = 3 if len(compact) - 2 - 3 * max_errors >= 1 else 2
+            self.min_votes.append((q, max(1, len(compact) - q + 1 - max_errors * q)))
+            for offset in range(len(compact) - q + 1):
+                if len(tokens) == 1:
+                    self.token_gram_index[q][compact[offset:offset + q]].append(phrase_id)
+                else:
+                    self.gram_index[q][compact[offset:offset + q]].append((phrase_id, offset))
+
+    def match(self, text):
+        """{frase: confianza 0-1} para las frases encontradas; confianza = 1 - errores / longitud"""
+        tokens = normalize_tokens(text)
+        matches = {}
+
+        # Frases cortas: coincidencia exacta de tokens consecutivos
+        for i, token in enumerate(tokens):
+            for phrase_id in self.exact_index.get(token, ()):
+                phrase, phrase_tokens = self.phrases[phrase_id][:2]
+                if tuple(tokens[i:i + len(phrase_tokens)]) == phrase_tokens:
+                    matches[phrase] = 1.0
+
+        # Palabras sueltas: contra cada token completo, no dentro de otra palabra ni entre dos
+        for token in set(tokens):
+            token_votes = defaultdict(int)
+            for q, index in self.token_gram_index.items():
+                for position in range(len(token) - q + 1):
+                    for phrase_id in index.get(token[position:position + q], ()):
+                        token_votes[phrase_id] += 1
+            for phrase_id, count in token_votes.items():
+                phrase, _, pattern, max_errors, masks = self.phrases[phrase_id]
+                if count < self.min_votes[phrase_id][1] or abs(len(token) - len(pattern)) > max_errors:
+                    continue
+                distance = bounded_edit_distance(pattern, token, max_errors, masks, anchored=True)
+                if distance is not None:
+                    matches[phrase] = max(matches.get(phrase, 0.0), round(1 - distance / len(pattern), 4))
+
+        # Frases de varias palabras: sin espacios (líneas partidas o palabras pegadas no cuentan como error)
+        compact = ''.join(tokens)
+        votes = defaultdict(lambda: defaultdict(int))  # id → diagonal (inicio estimado) → q-gramas
+        for q, index in self.gram_index.items():
+            if not index:
+                continue
+            for position in range(len(compact) - q + 1):
+                for phrase_id, offset in index.get(compact[position:position + q], ()):
+                    votes[phrase_id][position - offset] += 1
+
+        for phrase_id, diagonals in votes.items():
+            phrase, _, pattern, max_errors, masks = self.phrases[phrase_id]
+            distance = self._verify(pattern, masks, compact, diagonals, max_errors, self.min_votes[phrase_id][1])
+            if distance is not None:
+                matches[phrase] = round(1 - distance / len(pattern), 4)
+        return matches
+
+    def _verify(self, pattern, masks, compact, diagonals, max_errors, min_votes):
+        """Mejor distancia entre los inicios candidatos con votos suficientes (inserciones/borrados mueven la diagonal)"""
+        best = None
+        checked_until = float('-inf')  # Los inicios pueden ser negativos (borrados al comienzo)
+        starts = sorted(diagonals)
+        low = high = near = 0  # Ventana deslizante de diagonales en [start - k, start + k]
+        for start in starts:
+            while high < len(starts) and starts[high] <= start + max_errors:
+                near += diagonals[starts[high]]
+                high += 1
+            while starts[low] < start - max_errors:
+                near -= diagonals[starts[low]]
+                low += 1
+            if start <= checked_until or near < min_votes:
+                continue
+            window_start = max(0, start - max_errors)
+            window_end = start + len(pattern) + max_errors
+            distance = bounded_edit_distance(pattern, compact[window_start:window_end],
+                                             max_errors if best is None else best - 1, masks)
+            checked_until = start + max_errors
+            if distance is not None:
+                best = distance
+                if best == 0:
+                    break
+        return best
@@ -0,0 +1,121 @@
+# Micro-batching de peticiones a Vision API entre mensajes concurrentes
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# Agrupa AnnotateImageRequest de varios hilos en una sola llamada batch_annotate_images
+class VisionBatcher:
+    def __init__(self, client, max_batch_size=16, max_wait_ms=50, max_batch_bytes=8 * 1024 * 1024,
+                 max_concurrent_batches=4):
+        if not 1 <= max_batch_size <= 16:
+            raise ValueError("max_batch_size debe estar entre 1 y 16 (límite de Vision API)")
+
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_bytes = max_batch_bytes  # El total de imágenes de una petición tiene límite de tamaño
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix='vision-batch')
+        self._pending = []  # (request, future, bytes, encolado en)
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {
+            'batches': 0,
+            'images': 0,
+            'rpc_errors': 0,
+            'image_errors': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    def annotate(self, request, timeout=None):
+        """Enviar la petición en el próximo lote y esperar su AnnotateImageResponse"""
+        return self.submit(request).result(timeout)
+
+    def submit(self, request):
+        """Encolar una petición; retorna un Future con la respuesta de esa imagen"""
+        future = Future()
+        size = len(request.image.content)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vision-batcher', daemon=True)
+                self._thread.start()
+            self._pending.append((request, future, size, time.monotonic()))
+            self._pending_bytes += size
+            self._cond.notify()
+        return future
+
+    # hilo colector: cierra el lote al llenarse o al vencer max_wait desde la petición más antigua
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0][3] + self.max_wait
+                while not self._batch_full():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            try:
+                self._executor.submit(self._send, batch)
+            except Exception as e:
+                # Pool detenido (apagado): fallar el lote sin detener el colector
+                self._fail(batch, e)
+
+    def _batch_full(self):
+        return len(self._pending) >= self.max_batch_size or self._pending_bytes >= self.max_batch_bytes
+
+    def _take_batch(self):
+        batch, size = [], 0
+        while self._pending and len(batch) < self.max_batch_size:
+            item_size = self._pending[0][2]
+            if batch and size + item_size > self.max_batch_bytes:
+                break
+            item = self._pending.pop(0)
+            batch.append(item)
+            size += item_size
+        self._pending_bytes -= size
+        return batch
+
+    def _send(self, batch):
+        sent_at = time.monotonic()
+        try:
+            response = self.client.batch_annotate_images(requests=[item[0] for item in batch])
+            responses = list(response.responses)
+            for item, image_response in zip(batch, responses):
+                item[1].set_result(image_response)
+            # Cada respuesta trae su propio error: solo falla la imagen afectada (o la que quedó sin respuesta)
+            missing = len(batch) - len(responses)
+            self._record(batch, sent_at, image_errors=sum(1 for r in responses if r.error.message) + max(0, missing))
+            if missing > 0:
+                self._fail(batch, RuntimeError(f"Vision API devolvió {len(responses)} respuestas para {len(batch)} imágenes"))
+        except Exception as e:
+            # Falla de la llamada completa: todas las imágenes pendientes del lote fallan
+            logging.error(f"Error en batch_annotate_images ({len(batch)} imágenes): {e}")
+            self._record(batch, sent_at, rpc_error=True)
+            self._fail(batch, e)
+
+    def _fail(self, batch, error):
+        for item in batch:
+            if not item[1].done():
+                item[1].set_exception(error)
+
+    def _record(self, batch, sent_at, rpc_error=False, image_errors=0):
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['images'] += len(batch)
+            self._stats['rpc_errors'] += int(rpc_error)
+            self._stats['image_errors'] += image_errors
+            self._stats['wait_seconds_total'] += sum(sent_at - item[3] for item in batch)
+
+    def stats(self):
+        """Lotes enviados, imágenes por lote y espera promedio antes del envío"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        stats['avg_batch_size'] = round(stats['images'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_wait_ms'] = round(stats['wait_seconds_total'] / stats['images'] * 1000, 2) if stats['images'] else 0.0
+        return stats
@@ -0,0 +1,211 @@
+# Caché de resultados de Vision API por hash de contenido
+import hashlib
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+# Tier compartido local (sustituto de Firestore para pruebas y desarrollo)
+class LocalCacheStore:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Obtener entrada del tier compartido"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, entry):
+        """Guardar entrada, expulsando las más antiguas si se supera el tamaño"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Eliminar entrada"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Tier compartido en Firestore (una colección, un documento por hash)
+class FirestoreCacheStore:
+    def __init__(self, client, collection='vision_cache'):
+        self.client = client
+        self.collection = collection
+
+    def get(self, key):
+        """Leer documento de caché"""
+        doc = self.client.collection(self.collection).document(key).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set(self, key, entry):
+        """Escribir documento de caché"""
+        self.client.collection(self.collection).document(key).set(entry)
+
+    def delete(self, key):
+        """Eliminar documento de caché"""
+        self.client.collection(self.collection).document(key).delete()
+
+
+# Hash perceptual (dHash 64 bits) para detectar casi-duplicados
+def perceptual_hash(image_content, hash_size=8):
+    """Calcular dHash de la imagen como entero de 64 bits"""
+    from PIL import Image  # Solo necesario en modo perceptual
+
+    with Image.open(io.BytesIO(image_content)) as image:
+        pixels = list(image.convert('L').resize((hash_size + 1, hash_size)).getdata())
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+# Caché de dos niveles: LRU en proceso + tier compartido
+class VisionCache:
+    def __init__(self, shared_store=None, max_entries=512, ttl_seconds=7 * 24 * 3600,
+                 mode='sha256', phash_max_distance=4):
+        if mode not in ('sha256', 'phash'):
+            raise ValueError(f"Modo de caché no soportado: {mode}")
+
+        self.shared_store = shared_store
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.mode = mode
+        self.phash_max_distance = phash_max_distance
+        self._local = OrderedDict()  # key → entrada, en orden de uso
+        self._lock = threading.Lock()
+        self._stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expired': 0,
+            'errors': 0,
+            'compute_seconds': 0.0,
+        }
+
+    # clave de caché: hash del contenido + features solicitadas
+    def key_for(self, image_content, features):
+        """Calcular clave de caché para una imagen"""
+        features_key = '-'.join(sorted(features))
+        if self.mode == 'phash':
+            return f"phash_{perceptual_hash(image_content):016x}_{features_key}"
+        return f"sha256_{hashlib.sha256(image_content).hexdigest()}_{features_key}"
+
+    def get_or_compute(self, image_content, features, compute):
+        """Devolver el análisis cacheado o calcularlo con compute()"""
+        key = self.key_for(image_content, features)
+
+        analysis = self._get_local(key)
+        if analysis is not None:
+            self._count('local_hits')
+            return analysis
+
+        analysis = self._get_shared(key)
+        if analysis is not None:
+            self._count('shared_hits')
+            self._set_local(key, analysis)
+            return analysis
+
+        self._count('misses')
+        start = time.monotonic()
+        analysis = compute()
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._stats['compute_seconds'] += elapsed
+
+        self._set_local(key, analysis)
+        self._set_shared(key, analysis)
+        return analysis
+
+    def stats(self):
+        """Contadores de aciertos/fallos y estimación de ahorro"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+
+        hits = stats['local_hits'] + stats['shared_hits']
+        lookups = hits + stats['misses']
+        avg_compute = stats['compute_seconds'] / stats['misses'] if stats['misses'] else 0.0
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['vision_calls_saved'] = hits
+        stats['estimated_seconds_saved'] = round(hits * avg_compute, 3)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _is_expired(self, entry):
+        return entry.get('expires_at', 0) < time.time()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None and self.mode == 'phash':
+                key, entry = self._find_near_duplicate(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry):
+                del self._local[key]
+                self._stats['expired'] += 1
+                return None
+            self._local.move_to_end(key)
+            return entry['analysis']
+
+    # buscar en el LRU un hash perceptual a distancia de Hamming acotada
+    def _find_near_duplicate(self, key):
+        _, phash, features_key = key.split('_', 2)
+        target = int(phash, 16)
+        for candidate_key, entry in self._local.items():
+            _, candidate_hash, candidate_features = candidate_key.split('_', 2)
+            if candidate_features != features_key:
+                continue
+            if bin(target ^ int(candidate_hash, 16)).count('1') <= self.phash_max_distance:
+                return candidate_key, entry
+        return key, None
+
+    def _set_local(self, key, analysis):
+        with self._lock:
+            self._local[key] = {'analysis': analysis, 'expires_at': time.time() + self.ttl_seconds}
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _get_shared(self, key):
+        if self.shared_store is None:
+            return None
+        try:
+            entry = self.shared_store.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry):
+                self._count('expired')
+                self.shared_store.delete(key)
+                return None
+            return entry['analysis']
+        except Exception as e:
+            # El caché nunca debe bloquear el análisis
+            self._count('errors')
+            logging.warning(f"Error leyendo caché compartido: {e}")
+            return None
+
+    def _set_shared(self, key, analysis):
+        if self.shared_store is None:
+            return
+        try:
+            self.shared_store.set(key, {'analysis': analysis, 'expires_at': time.time() + self.ttl_seconds})
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Error escribiendo caché compartido: {e}")
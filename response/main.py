@@ -1,25 +1,286 @@
 ﻿# Respuesta a usuarios WhatsApp
 import functions_framework
-from google.cloud import firestore
+import base64
 import os
-import requests
 import logging
 import json
-from flask import Flask
+import atexit
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from flask import Flask, request
+from shared.idempotency import ClaimInProgress, create_idempotency_guard
+from shared.pubsub_publisher import BatchPublisher
+from shared.lazy import lazy_client
+from shared.metrics import CONTENT_TYPE, Metrics
  
 # Crear app Flask para Gunicorn
 app = Flask(__name__)
  
-# Clientes GCP
-firestore_client = firestore.Client()
-WHATSAPP_API_URL = "https://graph.facebook.com/v17.0/"
-WHATSAPP_ACCESS_TOKEN = os.environ.get('WHATSAPP_ACCESS_TOKEN')
-WHATSAPP_PHONE_NUMBER_ID = os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
+# Métricas por etapa (GET /metrics) y fracción de entregas con log estructurado
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+metrics = Metrics('response', log_sample_rate=LOG_SAMPLE_RATE)
+ 
+# Clientes GCP (import y construcción en el primer uso; el health check no los necesita)
+@lazy_client
+def firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+ 
+# Cliente de la Graph API compartido (pool de conexiones, reintentos y límite de envío)
+@lazy_client
+def whatsapp_client():
+    from shared.whatsapp_client import create_whatsapp_client
+    return create_whatsapp_client(metrics=metrics)
+ 
+# Envío saliente: cola acotada drenada por un pool de hilos
+OUTBOUND_CONCURRENCY = int(os.environ.get('OUTBOUND_CONCURRENCY', '16'))  # Envíos simultáneos a WhatsApp
+OUTBOUND_QUEUE_SIZE = int(os.environ.get('OUTBOUND_QUEUE_SIZE', '1000'))
+OUTBOUND_ENQUEUE_TIMEOUT = float(os.environ.get('OUTBOUND_ENQUEUE_TIMEOUT', '0.5'))  # Espera con la cola llena antes de rechazar
+# Cloud Run envía SIGKILL 10 s después de SIGTERM: vaciado + reencolado de lo pendiente deben caber antes
+OUTBOUND_SHUTDOWN_TIMEOUT = float(os.environ.get('OUTBOUND_SHUTDOWN_TIMEOUT', '6'))  # Vaciado al recibir SIGTERM
+OUTBOUND_ABANDON_TIMEOUT = float(os.environ.get('OUTBOUND_ABANDON_TIMEOUT', '2'))  # Reencolado de lo que no se envió
+# Resultados del push cuyo envío en segundo plano falla: se vuelven a publicar en el tópico
+# (el mismo RESULTS_TOPIC_NAME que processing; '' = sin eventos de resultado)
+RESULTS_TOPIC_NAME = os.environ.get('RESULTS_TOPIC_NAME', '')
+RESULT_MAX_REQUEUES = int(os.environ.get('RESULT_MAX_REQUEUES', '5'))
+ 
+# Resultados escritos por processing: documento por message_id + puntero por usuario
+RESULTS_COLLECTION = os.environ.get('RESULTS_COLLECTION', 'analysis_results')
+LATEST_RESULTS_COLLECTION = os.environ.get('LATEST_RESULTS_COLLECTION', 'latest_results')
+# Caché en proceso de resultados por message_id (0 = desactivado)
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '60'))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '1024'))
+# Consulta compuesta anterior como respaldo para documentos con ID aleatorio (requiere el índice compuesto)
+RESULT_LEGACY_QUERY_FALLBACK = os.environ.get('RESULT_LEGACY_QUERY_FALLBACK', 'false').lower() == 'true'
+ 
+# Caché con expiración: un resultado completado no cambia, solo se acota su vida en memoria
+class ResultCache:
+    def __init__(self, ttl_seconds=60, max_entries=1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # message_id → (expira en, resultado)
+        self._lock = threading.Lock()
+ 
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+ 
+    def set(self, key, value):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+ 
+result_cache = ResultCache(RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES)
+ 
+# Envío asíncrono de respuestas: la petición solo encola y el pool de hilos espera a la red
+class OutboundSender:
+    def __init__(self, send, concurrency=16, max_queue=1000, enqueue_timeout=0.5, shutdown_timeout=6,
+                 abandon_timeout=2):
+        self.send = send
+        self.concurrency = concurrency
+        self.enqueue_timeout = enqueue_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.abandon_timeout = abandon_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sending = {}  # id(item) → item de los envíos en curso
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._metrics = {
+            'in_flight': 0,
+            'sent': 0,
+            'failed': 0,
+            'rejected': 0,
+            'abandoned': 0,
+            'queue_wait_seconds_total': 0.0,
+            'latency_seconds_total': 0.0,
+            'latency_seconds_max': 0.0,
+        }
+        self._install_shutdown_hooks()
+ 
+    def submit(self, user_id, message, on_done=None):
+        """Encolar un envío; False si la cola sigue llena tras enqueue_timeout (backpressure)"""
+        if self._stopped:
+            return False
+        self._start()
+        try:
+            self._queue.put((user_id, message, on_done, time.monotonic()), timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            self._count('rejected')
+            logging.warning(f"Cola de envío llena ({self._queue.maxsize}), se rechaza el mensaje para {user_id}")
+            return False
+ 
+    # los hilos se crean en el primer envío (después del fork de Gunicorn)
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._worker, name=f'outbound-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+ 
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+ 
+            user_id, message, on_done, enqueued_at = item
+            started_at = time.monotonic()
+            with self._lock:
+                self._metrics['in_flight'] += 1
+                self._sending[id(item)] = item
+            ok = False
+            try:
+                ok = self.send(user_id, message)
+            except Exception as e:
+                logging.error(f"Error en envío saliente a {user_id}: {e}")
+            finally:
+                self._record(ok, started_at - enqueued_at, time.monotonic() - enqueued_at)
+                self._queue.task_done()
+            with self._lock:
+                owned = self._sending.pop(id(item), None) is not None
+ 
+            # Si shutdown ya lo dio por abandonado, su on_done ya corrió
+            if on_done is not None and owned:
+                try:
+                    on_done(ok)
+                except Exception as e:
+                    logging.error(f"Error en callback de envío a {user_id}: {e}")
+ 
+    def _count(self, name, value=1):
+        with self._lock:
+            self._metrics[name] += value
+ 
+    def _record(self, ok, queue_wait, latency):
+        with self._lock:
+            self._metrics['in_flight'] -= 1
+            self._metrics['sent' if ok else 'failed'] += 1
+            self._metrics['queue_wait_seconds_total'] += queue_wait
+            self._metrics['latency_seconds_total'] += latency
+            self._metrics['latency_seconds_max'] = max(self._metrics['latency_seconds_max'], latency)
+ 
+    def stats(self):
+        """Profundidad de cola, envíos en curso y latencia desde que se encola hasta que se entrega"""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['queue_depth'] = self._queue.qsize()
+        done = stats['sent'] + stats['failed']
+        stats['queue_wait_ms_avg'] = round(stats['queue_wait_seconds_total'] / done * 1000, 2) if done else 0.0
+        stats['latency_ms_avg'] = round(stats['latency_seconds_total'] / done * 1000, 2) if done else 0.0
+        return stats
+ 
+    def shutdown(self):
+        """Dejar de aceptar envíos, esperar a que se vacíe la cola (hasta shutdown_timeout) y abandonar el resto"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._abandon_pending(time.monotonic() + self.abandon_timeout)
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        logging.info(f"Envío saliente detenido: {self.stats()}")
+ 
+    # lo que sigue en cola o en curso al vencer shutdown_timeout se da por fallido (on_done lo reencola);
+    # un envío en curso que sí llegue antes del SIGKILL se entrega dos veces, en vez de ninguna
+    def _abandon_pending(self, deadline):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if item is not None:
+                items.append(item)
+        with self._lock:
+            items.extend(self._sending.values())
+            self._sending.clear()
+
+        # on_done puede retornar el future de su reencolado: se publica todo y se espera una sola vez
+        futures = []
+        for user_id, _, on_done, _ in items:
+            self._count('abandoned')
+            if on_done is None:
+                continue
+            try:
+                result = on_done(False)
+            except Exception as e:
+                logging.error(f"Error en callback de envío a {user_id}: {e}")
+                continue
+            if isinstance(result, Future):
+                futures.append(result)
+        if futures:
+            _, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+            if not_done:
+                logging.error(f"{len(not_done)} de {len(futures)} resultados sin confirmar al apagar")
+ 
+    # vaciar la cola al terminar el proceso (salida normal o SIGTERM de Cloud Run)
+    def _install_shutdown_hooks(self):
+        atexit.register(self.shutdown)
+        if threading.current_thread() is not threading.main_thread():
+            return
+ 
+        previous = signal.getsignal(signal.SIGTERM)
+ 
+        def handle_sigterm(signum, frame):
+            self.shutdown()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+ 
+        signal.signal(signal.SIGTERM, handle_sigterm)
+ 
+# Idempotencia de entregas: una reentrega del evento de resultado no envía dos veces el mensaje
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'firestore')  # 'firestore', 'local' o 'none'
+IDEMPOTENCY_COLLECTION = os.environ.get('IDEMPOTENCY_COLLECTION', 'processed_messages')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(7 * 24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '120'))
+ 
+idempotency_guard = create_idempotency_guard(
+    'response',
+    IDEMPOTENCY_BACKEND,
+    firestore_client_factory=lambda: firestore_client,
+    collection=IDEMPOTENCY_COLLECTION,
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    lease_seconds=IDEMPOTENCY_LEASE_SECONDS
+)
  
 # Mantener la función de Cloud Functions para compatibilidad
 @functions_framework.http
 def send_response(request):
     """Función para enviar respuestas a WhatsApp"""
+    # Envío síncrono: Cloud Functions no garantiza CPU después de retornar
+    return lookup_and_send(request, background=False)
+ 
+def lookup_and_send(request, background=True):
+    """Buscar el resultado del usuario y enviarlo; con background solo se encola (Cloud Run)"""
    
     if request.method != 'POST':
         return 'Método no permitido', 405
@@ -36,17 +297,28 @@ def send_response(request):
        
         if not result:
             logging.warning(f"No se encontraron resultados para {user_id}")
-            send_whatsapp_message(user_id, "❌ No se encontraron resultados de análisis. Por favor envía otra imagen.")
+            not_found = "❌ No se encontraron resultados de análisis. Por favor envía otra imagen."
+            if background:
+                outbound_sender.submit(user_id, not_found)
+            else:
+                send_whatsapp_message(user_id, not_found)
             return 'Resultado no encontrado', 404
        
         # Formatear mensaje de respuesta
         message = format_whatsapp_message(result)
        
-        #  ENVIAR A WHATSAPP
-        send_whatsapp_message(user_id, message)
+        if not background:
+            if not send_whatsapp_message(user_id, message):
+                return 'Error enviando mensaje', 500
+            logging.info(f"Respuesta enviada a {user_id}")
+            return 'Mensaje enviado', 200
+       
+        #  ENCOLAR ENVÍO A WHATSAPP (el pool de envío espera a la Graph API)
+        if not outbound_sender.submit(user_id, message):
+            return 'Cola de envío llena', 503
        
-        logging.info(f"Respuesta enviada a {user_id}")
-        return 'Mensaje enviado', 200
+        logging.info(f"Respuesta encolada para {user_id}")
+        return 'Mensaje encolado', 202
        
     except Exception as e:
         logging.error(f"Error enviando respuesta: {e}")
@@ -56,36 +328,176 @@ def send_response(request):
 @app.route('/')
 def health_check():
     return 'OK', 200
+ 
+# Métricas del envío saliente y de la Graph API
+@app.route('/stats')
+def stats_endpoint():
+    graph_api = whatsapp_client.stats() if whatsapp_client.loaded else {}
+    return {'outbound': outbound_sender.stats(), 'graph_api': graph_api}, 200
+
+# Métricas en formato Prometheus (etapas lookup/send, Graph API y cola de envío)
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': CONTENT_TYPE}
 
 # Descargar imagen de WhatsApp
 @app.route('/send-response', methods=['POST'])
 def send_response_endpoint():
     """Endpoint Flask para enviar respuestas"""
-    return send_response(request)
+    return lookup_and_send(request, background=True)
+ 
+# Suscripción push de Pub/Sub al tópico de resultados (Cloud Run)
+@app.route('/pubsub/result', methods=['POST'])
+def result_push_endpoint():
+    """Endpoint para el push de Pub/Sub con el evento de resultado"""
+    envelope = request.get_json(silent=True) or {}
+    if 'message' not in envelope:
+        return 'Mensaje Pub/Sub inválido', 400
+    # Un código distinto de 2xx hace que Pub/Sub reintente la entrega (cola llena = backpressure);
+    # si el envío encolado falla después del 200, deliver_result reencola el evento
+    if deliver_result(decode_result_event(envelope['message'])):
+        return 'Mensaje encolado', 200
+    return 'Cola de envío llena', 503
+ 
+# Manejador de Cloud Functions para el tópico de resultados
+@functions_framework.cloud_event
+def deliver_result_pubsub(cloud_event):
+    """Enviar a WhatsApp el resultado publicado por processing"""
+    # Envío síncrono: Cloud Functions no garantiza CPU después de retornar
+    if not deliver_result(decode_result_event(cloud_event.data['message']), background=False):
+        raise RuntimeError('Error enviando resultado a WhatsApp')  # Pub/Sub reintenta
+ 
+def decode_result_event(message):
+    """Decodificar el JSON del mensaje de Pub/Sub"""
+    return json.loads(base64.b64decode(message['data']).decode('utf-8'))
+ 
+def deliver_result(event, background=True):
+    """Formatear y enviar el resultado del evento sin consultar Firestore; False si hay que reintentar"""
+    user_id, message_id = event['user_id'], event['message_id']
+    try:
+        if idempotency_guard is not None and not idempotency_guard.claim(message_id):
+            logging.info(f"Resultado ya entregado, se descarta: {message_id}")
+            metrics.inc('results', outcome='duplicate')
+            return True
+    except ClaimInProgress:
+        # Otro intento está enviando el resultado: reintentar por si ese envío falla
+        logging.info(f"Resultado en envío en otra instancia, se reintentará: {message_id}")
+        metrics.inc('results', outcome='in_progress')
+        return False
+ 
+    start = time.perf_counter()
+    # La reserva se completa o se libera cuando termina el envío
+    def on_done(ok):
+        if not ok:
+            if idempotency_guard is not None:
+                idempotency_guard.release(message_id)
+            metrics.inc('results', outcome='failed')
+            return
+        if idempotency_guard is not None:
+            idempotency_guard.complete(message_id)
+        result_cache.set(message_id, event)
+        elapsed = time.perf_counter() - start
+        metrics.observe('deliver', elapsed)
+        metrics.inc('results', outcome='sent')
+        metrics.log_sample('result_delivered', message_id=message_id, probability=event.get('probability'),
+                           background=background, elapsed_ms=round(elapsed * 1000, 2))
+        logging.info(f"Resultado enviado a {user_id} ({message_id})")
+ 
+    message = format_whatsapp_message(event)
+    if not background:
+        ok = send_whatsapp_message(user_id, message)
+        on_done(ok)
+        return ok
+ 
+    # El push ya se confirmó con 200: un envío fallido (o abandonado al apagar) vuelve al tópico
+    def on_sent(ok):
+        on_done(ok)
+        if not ok:
+            return requeue_result(event)
+
+    if outbound_sender.submit(user_id, message, on_sent):
+        return True
+    on_done(False)  # Cola llena: el 503 hace que Pub/Sub reintente
+    return False
+
+def requeue_result(event):
+    """Publicar de nuevo el evento en el tópico de resultados sin bloquear; retorna el future (None si se descarta)"""
+    message_id = event['message_id']
+    requeues = event.get('requeues', 0) + 1
+    if requeues > RESULT_MAX_REQUEUES:
+        logging.error(f"Resultado descartado tras {RESULT_MAX_REQUEUES} reencolados: {message_id}")
+        metrics.inc('results', outcome='dropped')
+        return None
+    if requeue_publisher is None:
+        logging.error(f"RESULTS_TOPIC_NAME no configurado, no se puede reencolar el resultado {message_id}")
+        metrics.inc('results', outcome='dropped')
+        return None
+
+    def on_published(future):
+        error = future.exception()
+        if error is not None:
+            logging.error(f"No se pudo reencolar el resultado {message_id}: {error}")
+            metrics.inc('results', outcome='requeue_failed')
+            return
+        logging.warning(f"Envío fallido, resultado reencolado ({requeues}/{RESULT_MAX_REQUEUES}): {message_id}")
+        metrics.inc('results', outcome='requeued')
+
+    try:
+        future = requeue_publisher.publish(dict(event, requeues=requeues))
+    except Exception as e:
+        logging.error(f"No se pudo reencolar el resultado {message_id}: {e}")
+        metrics.inc('results', outcome='requeue_failed')
+        return None
+    future.add_done_callback(on_published)
+    return future
  
 # ... (el resto del código se mantiene igual)
+@metrics.timed('lookup')
 def get_latest_analysis_result(user_id, message_id=None):
-    """Obtener resultado del análisis de Firestore"""
+    """Obtener resultado del análisis de Firestore con una lectura puntual"""
     try:
-        query = firestore_client.collection('analysis_results')\
-            .where('user_id', '==', user_id)\
-            .where('status', '==', 'completed')
-       
         if message_id:
-            query = query.where('message_id', '==', message_id)
-           
-        docs = query.order_by('timestamp', direction=firestore.Query.DESCENDING)\
-            .limit(1)\
-            .stream()
-       
-        for doc in docs:
-            return doc.to_dict()
+            result = result_cache.get(message_id)
+            if result is None:
+                doc = firestore_client.collection(RESULTS_COLLECTION).document(message_id).get()
+                result = doc.to_dict() if doc.exists else None
+        else:
+            # El puntero del usuario ya trae probabilidad y anomalías; no se cachea porque cambia con cada imagen
+            doc = firestore_client.collection(LATEST_RESULTS_COLLECTION).document(user_id).get()
+            result = doc.to_dict() if doc.exists else None
+ 
+        if result and result.get('status') == 'completed' and (not message_id or result.get('user_id', user_id) == user_id):
+            if message_id:
+                result_cache.set(message_id, result)
+            return result
+ 
+        if RESULT_LEGACY_QUERY_FALLBACK:
+            return query_legacy_analysis_result(user_id, message_id)
         return None
        
     except Exception as e:
         logging.error(f"Error consultando Firestore: {e}")
         return None
  
+def query_legacy_analysis_result(user_id, message_id=None):
+    """Consulta compuesta para resultados guardados con ID aleatorio (antes del puntero por usuario)"""
+    from google.cloud import firestore
+ 
+    query = firestore_client.collection(RESULTS_COLLECTION)\
+        .where('user_id', '==', user_id)\
+        .where('status', '==', 'completed')
+   
+    if message_id:
+        query = query.where('message_id', '==', message_id)
+       
+    docs = query.order_by('timestamp', direction=firestore.Query.DESCENDING)\
+        .limit(1)\
+        .stream()
+   
+    for doc in docs:
+        return doc.to_dict()
+    return None
+ 
 def format_whatsapp_message(result):
     """Formatear mensaje para WhatsApp"""
     probability = result.get('probability', 0)
@@ -130,41 +542,28 @@ _Este análisis es preliminar. Para confirmación definitiva consulte con un esp
    
     return message
  
+@metrics.timed('send')
 def send_whatsapp_message(user_id, message):
     """ ENVÍO  A WHATSAPP BUSINESS API"""
-    try:
-        if not WHATSAPP_ACCESS_TOKEN or not WHATSAPP_PHONE_NUMBER_ID:
-            logging.error("WHATSAPP_ACCESS_TOKEN o WHATSAPP_PHONE_NUMBER_ID no configurados")
-            return False
-           
-        url = f"https://graph.facebook.com/v17.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-       
-        headers = {
-            'Authorization': f'Bearer {WHATSAPP_ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-       
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": user_id,
-            "text": {"body": message}
-        }
-       
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-       
-        if response.status_code == 200:
-            logging.info(f"Mensaje de respuesta enviado exitosamente a {user_id}")
-            return True
-        else:
-            logging.error(f"Error enviando mensaje a WhatsApp: {response.status_code} - {response.text}")
-            return False
-           
-    except requests.exceptions.Timeout:
-        logging.error("Timeout enviando mensaje a WhatsApp")
-        return False
-    except Exception as e:
-        logging.error(f"Error inesperado en send_whatsapp_message: {e}")
-        return False
+    return whatsapp_client.send_text(user_id, message)
+ 
+# Creado antes que outbound_sender: sus hooks de apagado corren después (LIFO) y publican lo abandonado
+requeue_publisher = BatchPublisher(
+    f"projects/{os.environ.get('GCP_PROJECT', 'prj-botlabs-dev')}/topics/{RESULTS_TOPIC_NAME}",
+    max_messages=100,
+    max_latency=0.005
+) if RESULTS_TOPIC_NAME else None
+ 
+outbound_sender = OutboundSender(
+    lambda user_id, message: send_whatsapp_message(user_id, message),
+    concurrency=OUTBOUND_CONCURRENCY,
+    max_queue=OUTBOUND_QUEUE_SIZE,
+    enqueue_timeout=OUTBOUND_ENQUEUE_TIMEOUT,
+    shutdown_timeout=OUTBOUND_SHUTDOWN_TIMEOUT,
+    abandon_timeout=OUTBOUND_ABANDON_TIMEOUT
+)
+metrics.gauge('outbound_queue_depth', lambda: outbound_sender.stats()['queue_depth'])
+metrics.gauge('outbound_in_flight', lambda: outbound_sender.stats()['in_flight'])
  
 # Punto de entrada para Gunicorn
 if __name__ == '__main__':
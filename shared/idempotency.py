@@ -0,0 +1,216 @@
+# Idempotencia por message_id de WhatsApp: descartar reentregas antes de cualquier trabajo costoso
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Resultado de claim() en los almacenes compartidos
+CLAIMED = 'claimed'
+PROCESSING = 'processing'  # Otra instancia tiene la reserva vigente y todavía no terminó
+DONE = 'done'
+
+
+# Reentrega de un mensaje que otra instancia sigue procesando: hay que reintentar más tarde (nack / 5xx),
+# no descartarla, porque si ese intento falla y libera la reserva nadie más lo procesaría
+class ClaimInProgress(Exception):
+    pass
+
+
+# Conjunto en memoria con expiración (camino rápido, por instancia)
+class TTLSet:
+    def __init__(self, ttl_seconds=3600, max_entries=100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key → expira en (monotonic)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key, ttl_seconds=None):
+        """Agregar clave; expulsa las más antiguas si se supera el tamaño"""
+        with self._lock:
+            self._entries[key] = time.monotonic() + (ttl_seconds or self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Almacén compartido local (sustituto de Firestore para pruebas)
+class LocalClaimStore:
+    def __init__(self):
+        self._claims = {}  # key → (estado, expira en epoch)
+        self._lock = threading.Lock()
+
+    def claim(self, key, lease_seconds):
+        """Reservar la clave; CLAIMED, o el estado (PROCESSING/DONE) de la reserva vigente de otra instancia"""
+        with self._lock:
+            current = self._claims.get(key)
+            if current is not None and current[1] > time.time():
+                return current[0]
+            self._claims[key] = (PROCESSING, time.time() + lease_seconds)
+            return CLAIMED
+
+    def complete(self, key, ttl_seconds):
+        with self._lock:
+            self._claims[key] = (DONE, time.time() + ttl_seconds)
+
+    def release(self, key):
+        with self._lock:
+            self._claims.pop(key, None)
+
+
+# Almacén compartido en Firestore (un documento por message_id)
+class FirestoreClaimStore:
+    def __init__(self, client, collection='processed_messages'):
+        self.client = client
+        self.collection = collection
+
+    def _ref(self, key):
+        return self.client.collection(self.collection).document(key)
+
+    def claim(self, key, lease_seconds):
+        """create() es atómico: falla si el documento ya existe"""
+        from google.api_core.exceptions import AlreadyExists
+
+        data = {'state': PROCESSING, 'expires_at': _expires_at(lease_seconds)}
+        try:
+            self._ref(key).create(data)
+            return CLAIMED
+        except AlreadyExists:
+            return self._take_over_expired(key, data)
+
+    # tomar una reserva vencida (instancia caída a mitad del procesamiento)
+    def _take_over_expired(self, key, data):
+        from google.cloud import firestore
+
+        ref = self._ref(key)
+
+        @firestore.transactional
+        def take_over(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.get('expires_at') > datetime.datetime.now(datetime.timezone.utc):
+                return snapshot.get('state')
+            transaction.set(ref, data)
+            return CLAIMED
+
+        return take_over(self.client.transaction())
+
+    def complete(self, key, ttl_seconds):
+        self._ref(key).set({'state': DONE, 'expires_at': _expires_at(ttl_seconds)})
+
+    def release(self, key):
+        self._ref(key).delete()
+
+
+def _expires_at(seconds):
+    # Timestamp de Firestore: permite configurar una política TTL sobre 'expires_at'
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+
+
+# Guardia de idempotencia: TTLSet en memoria + almacén compartido entre instancias
+class IdempotencyGuard:
+    def __init__(self, namespace, shared_store=None, ttl_seconds=7 * 24 * 3600, lease_seconds=600,
+                 max_local_entries=100000):
+        self.namespace = namespace  # 'webhook' y 'processing' reservan por separado
+        self.shared_store = shared_store
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds  # Duración de la reserva mientras se procesa
+        self._seen = TTLSet(ttl_seconds, max_local_entries)  # Terminados
+        self._in_flight = TTLSet(lease_seconds, max_local_entries)  # Reservados por esta instancia
+        self._lock = threading.Lock()
+        self._stats = {'claimed': 0, 'duplicates_local': 0, 'duplicates_shared': 0, 'in_progress': 0, 'errors': 0}
+
+    def _key(self, message_id):
+        return f"{self.namespace}_{message_id}"
+
+    def claim(self, message_id):
+        """True si este proceso debe manejar el mensaje; False si ya se terminó
+
+        Lanza ClaimInProgress si otro intento todavía lo está procesando.
+        """
+        key = self._key(message_id)
+        if key in self._seen:
+            self._count('duplicates_local')
+            return False
+        if key in self._in_flight:
+            self._count('in_progress')
+            raise ClaimInProgress(message_id)
+
+        if self.shared_store is not None:
+            try:
+                state = self.shared_store.claim(key, self.lease_seconds)
+            except Exception as e:
+                # Si el almacén no responde se procesa igual: mejor duplicar que perder el mensaje
+                self._count('errors')
+                logging.warning(f"Error reservando {key} en almacén de idempotencia: {e}")
+                state = CLAIMED
+            if state == PROCESSING:
+                self._count('in_progress')
+                raise ClaimInProgress(message_id)
+            if state != CLAIMED:
+                self._seen.add(key)
+                self._count('duplicates_shared')
+                return False
+
+        self._in_flight.add(key)
+        self._count('claimed')
+        return True
+
+    def complete(self, message_id):
+        """Marcar el mensaje como terminado (la reserva pasa a durar ttl_seconds)"""
+        key = self._key(message_id)
+        self._in_flight.discard(key)
+        self._seen.add(key)
+        if self.shared_store is None:
+            return
+        try:
+            self.shared_store.complete(key, self.ttl_seconds)
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Error completando {message_id} en almacén de idempotencia: {e}")
+
+    def release(self, message_id):
+        """Liberar la reserva para que un reintento pueda procesar el mensaje"""
+        key = self._key(message_id)
+        self._seen.discard(key)
+        self._in_flight.discard(key)
+        if self.shared_store is None:
+            return
+        try:
+            self.shared_store.release(key)
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Error liberando {key} en almacén de idempotencia: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def create_idempotency_guard(namespace, backend, firestore_client_factory=None, collection='processed_messages',
+                             ttl_seconds=7 * 24 * 3600, lease_seconds=600):
+    """Crear guardia según configuración: backend 'firestore', 'local' o 'none'"""
+    if backend == 'none':
+        return None
+    if backend == 'firestore':
+        shared_store = FirestoreClaimStore(firestore_client_factory(), collection)
+    else:
+        shared_store = LocalClaimStore()
+    return IdempotencyGuard(namespace, shared_store=shared_store, ttl_seconds=ttl_seconds, lease_seconds=lease_seconds)
@@ -0,0 +1,97 @@
+# Normalización de imágenes antes de guardarlas y enviarlas a Vision
+import io
+import logging
+import time
+
+from PIL import Image, ImageOps
+
+# Segmentos JPEG que se conservan al quitar metadatos sin re-codificar:
+# APP0 (JFIF) y APP14 (Adobe, transformación de color); APP1-13/APP15 (EXIF, XMP, ICC, IPTC) y COM se descartan
+KEPT_APP_MARKERS = (0xE0, 0xEE)
+
+
+def normalize_image(image_data, max_side=1600, jpeg_quality=85):
+    """Aplicar orientación EXIF, limitar el lado mayor, quitar metadatos y re-codificar a JPEG
+
+    Devuelve (bytes_normalizados, info). Si la imagen no se puede decodificar se
+    devuelven los bytes originales para no bloquear el análisis. Si ya es un JPEG
+    dentro de max_side, sin rotación EXIF, y re-codificarla no la achica, se
+    devuelve la original sin sus segmentos de metadatos (evita una generación
+    más de pérdida).
+    """
+    start = time.perf_counter()
+    info = {
+        'original_bytes': len(image_data),
+        'normalized_bytes': len(image_data),
+        'original_size': None,
+        'normalized_size': None,
+        'normalized': False,
+    }
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            info['original_size'] = image.size
+            already_fits = image.format == 'JPEG' and max(image.size) <= max_side \
+                and image.getexif().get(0x0112, 1) == 1  # Orientation: 1 = sin rotar
+
+            # JPEG: decodificar directamente a escala reducida (1/2, 1/4, 1/8) cuando es posible
+            scale = max_side / max(image.size)
+            if scale < 1:
+                image.draft('RGB', (int(image.size[0] * scale) + 1, int(image.size[1] * scale) + 1))
+
+            # Rotar según EXIF para que el OCR lea el texto derecho
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            # Reducir conservando proporción; el texto sigue siendo legible para OCR
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            info['normalized_size'] = image.size
+
+            # Guardar sin exif/icc: se descartan los metadatos
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=jpeg_quality, optimize=True, progressive=True)
+    except Exception as e:
+        logging.warning(f"No se pudo normalizar la imagen, se usa la original: {e}")
+        info['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return image_data, info
+
+    normalized = output.getvalue()
+    stripped = strip_jpeg_metadata(image_data) if already_fits else None
+    if stripped is not None and len(normalized) >= len(stripped):
+        info['normalized_bytes'] = len(stripped)
+        info['normalized_size'] = info['original_size']
+        info['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return stripped, info
+
+    info['normalized_bytes'] = len(normalized)
+    info['normalized'] = True
+    info['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return normalized, info
+
+
+def strip_jpeg_metadata(data):
+    """Quitar los segmentos de metadatos de un JPEG sin tocar los datos de imagen; None si no se puede recorrer"""
+    if data[:2] != b'\xff\xd8':
+        return None
+    output = bytearray(data[:2])
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:  # Relleno entre segmentos
+            position += 1
+            continue
+        if marker == 0xDA:  # SOS: a partir de aquí solo datos comprimidos, se copian tal cual
+            output += data[position:]
+            return bytes(output)
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        end = position + 2 + length
+        if length < 2 or end > len(data):
+            return None
+        metadata = marker == 0xFE or (0xE0 <= marker <= 0xEF and marker not in KEPT_APP_MARKERS)
+        if not metadata:
+            output += data[position:end]
+        position = end
+    return None
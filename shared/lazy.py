@@ -0,0 +1,35 @@
+# Clientes con inicialización diferida: el import pesado y la construcción ocurren en el primer uso
+import threading
+
+
+class LazyClient:
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def instance(self):
+        """Construir el cliente una sola vez (seguro entre hilos) y retornarlo"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def override(self, instance):
+        """Reemplazar el cliente (dobles en pruebas y en el harness de carga)"""
+        with self._lock:
+            self._instance = instance
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    # client.metodo(...) se delega al cliente real, construyéndolo si hace falta
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+
+def lazy_client(factory):
+    """Decorador: la función fábrica pasa a ser un proxy perezoso del cliente que construye"""
+    return LazyClient(factory)
@@ -0,0 +1,129 @@
+# Instrumentación del camino crítico: histogramas por etapa, contadores y logs estructurados muestreados
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los buckets en segundos (de operaciones en memoria a llamadas lentas a Vision)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+# Registro de métricas de un servicio, expuesto en formato de texto de Prometheus
+class Metrics:
+    def __init__(self, service, buckets=DEFAULT_BUCKETS, log_sample_rate=0.01):
+        self.service = service
+        self.buckets = tuple(buckets)
+        self.log_sample_rate = log_sample_rate
+        self._histograms = {}  # etapa → Histogram
+        self._counters = {}  # (nombre, etiquetas) → valor
+        self._gauges = []  # (nombre, etiquetas, función)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Medir el bloque como la etapa 'stage'; si lanza, cuenta además un error de la etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('stage_errors', stage=stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorador equivalente a timer()"""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            wrapper.__name__, wrapper.__doc__ = fn.__name__, fn.__doc__
+            return wrapper
+        return decorator
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, fn, **labels):
+        """Registrar un valor que se lee al exponer las métricas (profundidad de cola, etc.)"""
+        self._gauges.append((name, tuple(sorted(labels.items())), fn))
+
+    def log_sample(self, event, **fields):
+        """Log JSON de una línea para una fracción log_sample_rate de los eventos"""
+        if self.log_sample_rate <= 0 or random.random() >= self.log_sample_rate:
+            return
+        logging.info(json.dumps({'service': self.service, 'event': event, **fields}, default=str, ensure_ascii=False))
+
+    def _labels(self, labels):
+        pairs = [('service', self.service)] + list(labels)
+        return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+    def render(self):
+        """Texto para GET /metrics"""
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.sum, h.count) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        if histograms:
+            lines += ['# HELP aiasigna_stage_duration_seconds Duración de cada etapa del pipeline',
+                      '# TYPE aiasigna_stage_duration_seconds histogram']
+        for stage, (counts, total, count) in sorted(histograms.items()):
+            labels = self._labels([('stage', stage)])
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'aiasigna_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'aiasigna_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'aiasigna_stage_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'aiasigna_stage_duration_seconds_count{{{labels}}} {count}')
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE aiasigna_{name}_total counter')
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f'aiasigna_{name}_total{{{self._labels(labels)}}} {value}')
+
+        for name, labels, fn in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                logging.warning(f"Métrica {name} no disponible: {e}")
+                continue
+            lines.append(f'# TYPE aiasigna_{name} gauge')
+            lines.append(f'aiasigna_{name}{{{self._labels(labels)}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
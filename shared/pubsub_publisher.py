@@ -0,0 +1,129 @@
+# Publicación asíncrona y por lotes en Pub/Sub
+import atexit
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+
+class BatchPublisher:
+    def __init__(self, topic_path, max_messages=100, max_bytes=1_000_000, max_latency=0.01,
+                 flow_max_messages=1000, flow_max_bytes=10 * 1024 * 1024, client=None):
+        self.topic_path = topic_path
+        self._client = client
+        self._client_settings = (max_messages, max_bytes, max_latency, flow_max_messages, flow_max_bytes)
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._metrics = {
+            'published': 0,
+            'failed': 0,
+            'pending': 0,
+            'publish_seconds_total': 0.0,
+            'last_error': None,
+        }
+        self._install_shutdown_hooks()
+
+    # el cliente de Pub/Sub se construye en la primera publicación (no en el import del servicio)
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client(*self._client_settings)
+        return self._client
+
+    @staticmethod
+    def _create_client(max_messages, max_bytes, max_latency, flow_max_messages, flow_max_bytes):
+        from google.cloud import pubsub_v1  # Import pesado: solo cuando se publica
+
+        return pubsub_v1.PublisherClient(
+            # El cliente agrupa mensajes hasta max_messages/max_bytes o max_latency segundos
+            batch_settings=pubsub_v1.types.BatchSettings(
+                max_messages=max_messages,
+                max_bytes=max_bytes,
+                max_latency=max_latency
+            ),
+            # Control de flujo: si hay demasiados mensajes pendientes, publish() espera
+            publisher_options=pubsub_v1.types.PublisherOptions(
+                flow_control=pubsub_v1.types.PublishFlowControl(
+                    message_limit=flow_max_messages,
+                    byte_limit=flow_max_bytes,
+                    limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK
+                )
+            )
+        )
+
+    def publish(self, message_data, **attributes):
+        """Publicar un diccionario como JSON sin bloquear; retorna el future de Pub/Sub"""
+        data = json.dumps(message_data).encode('utf-8')
+        start = time.monotonic()
+        future = self.client.publish(self.topic_path, data, **attributes)
+        with self._lock:
+            self._metrics['pending'] += 1
+        future.add_done_callback(lambda f: self._on_done(f, start))
+        return future
+
+    def publish_many(self, messages):
+        """Publicar varios mensajes; el cliente los envía en el mismo lote"""
+        return [self.publish(message_data) for message_data in messages]
+
+    def _on_done(self, future, start):
+        elapsed = time.monotonic() - start
+        try:
+            message_id = future.result()
+        except Exception as e:
+            with self._lock:
+                self._metrics['pending'] -= 1
+                self._metrics['failed'] += 1
+                self._metrics['last_error'] = str(e)
+            logging.error(f"Error publicando en Pub/Sub ({self.topic_path}): {e}")
+            return
+
+        with self._lock:
+            self._metrics['pending'] -= 1
+            self._metrics['published'] += 1
+            self._metrics['publish_seconds_total'] += elapsed
+        logging.debug(f"Mensaje publicado en Pub/Sub: {message_id} ({elapsed * 1000:.1f} ms)")
+
+    def stats(self):
+        """Métricas de publicación"""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['avg_publish_ms'] = (
+            round(stats['publish_seconds_total'] / stats['published'] * 1000, 2) if stats['published'] else 0.0
+        )
+        return stats
+
+    def shutdown(self):
+        """Enviar los lotes pendientes y detener el cliente"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        if self._client is None:
+            return
+        try:
+            self.client.stop()
+            logging.info(f"Publisher detenido: {self.stats()}")
+        except Exception as e:
+            logging.error(f"Error vaciando publisher de Pub/Sub: {e}")
+
+    # vaciar lotes al terminar el proceso (salida normal o SIGTERM de Cloud Run)
+    def _install_shutdown_hooks(self):
+        atexit.register(self.shutdown)
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(signum, frame):
+            self.shutdown()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
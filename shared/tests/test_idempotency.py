@@ -0,0 +1,239 @@
+"""Pruebas de la guardia de idempotencia con el almacén en memoria y un reloj controlado
+
+Dos IdempotencyGuard sobre el mismo LocalClaimStore simulan dos instancias:
+cada una tiene su TTLSet local y comparten las reservas.
+
+Uso (desde la raíz del repositorio):
+    python -m pytest -q shared/tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from shared import idempotency  # noqa: E402
+from shared.idempotency import (  # noqa: E402
+    CLAIMED, DONE, PROCESSING, ClaimInProgress, IdempotencyGuard, LocalClaimStore
+)
+
+LEASE = 60
+TTL = 3600
+
+
+class Clock:
+    """Sustituto del módulo time en shared.idempotency (time() y monotonic() avanzan juntos)"""
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+# Almacén que no responde (Firestore caído)
+class FailingStore:
+    def claim(self, key, lease_seconds):
+        raise ConnectionError('almacén no disponible')
+
+    def complete(self, key, ttl_seconds):
+        raise ConnectionError('almacén no disponible')
+
+    def release(self, key):
+        raise ConnectionError('almacén no disponible')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(idempotency, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def store(clock):
+    return LocalClaimStore()
+
+
+def instance(store):
+    return IdempotencyGuard('processing', shared_store=store, ttl_seconds=TTL, lease_seconds=LEASE)
+
+
+def test_first_claim_succeeds(store):
+    guard = instance(store)
+    assert guard.claim('wamid.1') is True
+    assert guard.stats()['claimed'] == 1
+
+
+def test_duplicate_in_progress_raises_on_same_instance(store):
+    guard = instance(store)
+    guard.claim('wamid.1')
+    with pytest.raises(ClaimInProgress):
+        guard.claim('wamid.1')
+    assert guard.stats()['in_progress'] == 1
+
+
+def test_duplicate_in_progress_raises_on_other_instance(store):
+    instance(store).claim('wamid.1')
+    other = instance(store)
+    with pytest.raises(ClaimInProgress):
+        other.claim('wamid.1')
+    assert other.stats()['in_progress'] == 1
+
+
+def test_duplicate_after_complete_returns_false(store):
+    guard, other = instance(store), instance(store)
+    guard.claim('wamid.1')
+    guard.complete('wamid.1')
+    assert guard.claim('wamid.1') is False
+    assert other.claim('wamid.1') is False
+    assert guard.stats()['duplicates_local'] == 1
+    assert other.stats()['duplicates_shared'] == 1
+
+
+def test_claim_after_release_succeeds(store):
+    guard, other = instance(store), instance(store)
+    guard.claim('wamid.1')
+    guard.release('wamid.1')  # Error al procesar: el reintento debe poder reservarlo
+    assert other.claim('wamid.1') is True
+    other.release('wamid.1')
+    assert guard.claim('wamid.1') is True
+
+
+def test_expired_lease_is_taken_over(store, clock):
+    # La primera instancia se cae sin completar ni liberar: su reserva vence tras LEASE segundos
+    instance(store).claim('wamid.1')
+    other = instance(store)
+    clock.advance(LEASE - 1)
+    with pytest.raises(ClaimInProgress):
+        other.claim('wamid.1')
+    clock.advance(2)
+    assert other.claim('wamid.1') is True
+
+
+def test_completed_claim_outlives_lease(store, clock):
+    guard = instance(store)
+    guard.claim('wamid.1')
+    guard.complete('wamid.1')
+    clock.advance(LEASE * 10)
+    assert instance(store).claim('wamid.1') is False
+    clock.advance(TTL)
+    assert instance(store).claim('wamid.1') is True
+
+
+def test_namespaces_are_independent(store):
+    IdempotencyGuard('webhook', shared_store=store).claim('wamid.1')
+    assert IdempotencyGuard('processing', shared_store=store).claim('wamid.1') is True
+
+
+def test_store_down_fails_open(clock):
+    guard = IdempotencyGuard('processing', shared_store=FailingStore(), ttl_seconds=TTL, lease_seconds=LEASE)
+    assert guard.claim('wamid.1') is True  # Mejor duplicar que perder el mensaje
+    guard.complete('wamid.1')
+    assert guard.claim('wamid.1') is False  # El TTLSet local sigue descartando en esta instancia
+    guard.release('wamid.1')
+    assert guard.stats()['errors'] == 3
+
+
+def test_local_store_states(store, clock):
+    assert store.claim('k', LEASE) == CLAIMED
+    assert store.claim('k', LEASE) == PROCESSING
+    store.complete('k', TTL)
+    assert store.claim('k', LEASE) == DONE
+    store.release('k')
+    assert store.claim('k', LEASE) == CLAIMED
+
+
+# --- FirestoreClaimStore con un cliente en memoria ---
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data or {}
+
+    def get(self, field):
+        return self._data[field]
+
+
+class FakeDocument:
+    def __init__(self, documents, key):
+        self.documents, self.key = documents, key
+
+    def create(self, data):
+        from google.api_core.exceptions import AlreadyExists
+
+        if self.key in self.documents:
+            raise AlreadyExists(self.key)
+        self.documents[self.key] = dict(data)
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self.documents.get(self.key))
+
+    def set(self, data):
+        self.documents[self.key] = dict(data)
+
+    def delete(self):
+        self.documents.pop(self.key, None)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.documents = {}
+
+    def collection(self, name):
+        return self
+
+    def document(self, key):
+        return FakeDocument(self.documents, key)
+
+    def transaction(self):
+        return self
+
+    def set(self, ref, data):  # Transaction.set
+        ref.set(data)
+
+
+@pytest.fixture
+def firestore_store(monkeypatch):
+    from google.cloud import firestore
+
+    # Sin reintentos ni commit: la transacción del cliente en memoria aplica cada set al momento
+    monkeypatch.setattr(firestore, 'transactional', lambda function: function)
+    return idempotency.FirestoreClaimStore(FakeFirestore())
+
+
+def expire(store, key):
+    store.client.documents[key]['expires_at'] = idempotency._expires_at(-1)
+
+
+def test_firestore_store_states(firestore_store):
+    assert firestore_store.claim('k', LEASE) == CLAIMED
+    assert firestore_store.claim('k', LEASE) == PROCESSING
+    firestore_store.complete('k', TTL)
+    assert firestore_store.claim('k', LEASE) == DONE
+    firestore_store.release('k')
+    assert firestore_store.claim('k', LEASE) == CLAIMED
+
+
+def test_firestore_store_takes_over_expired_lease(firestore_store):
+    guard, other = instance(firestore_store), instance(firestore_store)
+    guard.claim('wamid.1')
+    with pytest.raises(ClaimInProgress):
+        other.claim('wamid.1')
+    expire(firestore_store, 'processing_wamid.1')
+    assert other.claim('wamid.1') is True
+    assert firestore_store.client.documents['processing_wamid.1']['state'] == PROCESSING
+
+
+def test_firestore_store_expired_done_can_be_claimed_again(firestore_store):
+    guard = instance(firestore_store)
+    guard.claim('wamid.1')
+    guard.complete('wamid.1')
+    expire(firestore_store, 'processing_wamid.1')
+    assert instance(firestore_store).claim('wamid.1') is True
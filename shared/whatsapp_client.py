@@ -0,0 +1,241 @@
+# Cliente compartido de la Graph API de WhatsApp: pool de conexiones, reintentos y límite de envío
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Errores transitorios de la Graph API que se reintentan
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Limitador token bucket: 'rate' envíos por segundo con ráfagas de hasta 'capacity'
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Esperar hasta que haya un token disponible; retorna los segundos esperados"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def is_connect_error(error):
+    """True si la petición no llegó a enviarse: timeout al conectar o no se pudo abrir la conexión"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests envuelve MaxRetryError; su reason es la causa (NewConnectionError incluye errores de DNS)
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+class WhatsAppClient:
+    def __init__(self, access_token, phone_number_id, base_url='https://graph.facebook.com', api_version='v17.0',
+                 timeout=(3.05, 10), max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 messages_per_second=80, pool_maxsize=32, metrics=None):
+        self.access_token = access_token
+        self.phone_number_id = phone_number_id
+        self.api_url = f"{base_url.rstrip('/')}/{api_version}"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Límite del nivel de mensajería del número (mensajes por segundo)
+        self.send_limiter = TokenBucket(messages_per_second) if messages_per_second else None
+
+        # Keep-alive: una sola sesión con pool de conexiones para todos los hilos
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.metrics = metrics  # shared.metrics.Metrics del servicio (etapas graph_<endpoint>)
+
+    @property
+    def configured(self):
+        return bool(self.access_token and self.phone_number_id)
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+    # petición con reintentos (backoff exponencial con jitter, respeta Retry-After)
+    def _request(self, endpoint, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('headers', self._headers())
+
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            self._record(endpoint, time.monotonic() - start, response, error)
+
+            if error is not None:
+                # Un POST que pudo haberse enviado (timeout de lectura, conexión cortada) no se reintenta
+                retryable = method == 'GET' or is_connect_error(error)
+            else:
+                retryable = response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, response)
+            self._count(endpoint, 'retries')
+            logging.warning(f"Graph API {endpoint}: reintento {attempt}/{self.max_retries} en {delay:.2f}s "
+                            f"({error or response.status_code})")
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        delay = min(self.backoff_base * (2 ** (attempt - 1)), self.backoff_max)
+        return delay * (0.5 + random.random() / 2)
+
+    def get_media_url(self, media_id):
+        """Consultar la URL de descarga de una media"""
+        if not self.access_token:
+            logging.error("WHATSAPP_ACCESS_TOKEN no configurado")
+            return None
+
+        response = self._request('media_lookup', 'GET', f"{self.api_url}/{media_id}/")
+        if response.status_code != 200:
+            logging.error(f"Error obteniendo media URL: {response.status_code} - {response.text}")
+            return None
+
+        download_url = response.json().get('url')
+        if not download_url:
+            logging.error("No se pudo obtener URL de descarga")
+        return download_url
+
+    def download_media(self, media_id):
+        """Descargar una media completa en memoria; None si falla"""
+        try:
+            download_url = self.get_media_url(media_id)
+            if not download_url:
+                return None
+
+            response = self._request('media_download', 'GET', download_url)
+            if response.status_code != 200:
+                logging.error(f"Error descargando imagen: {response.status_code}")
+                return None
+            return response.content
+
+        except Exception as e:
+            logging.error(f"Error descargando media {media_id}: {e}")
+            return None
+
+    @contextmanager
+    def open_media_stream(self, media_id):
+        """Abrir la descarga de una media en modo streaming; produce la respuesta o None"""
+        download_url = self.get_media_url(media_id)
+        response = self._request('media_download', 'GET', download_url, stream=True) if download_url else None
+        if response is not None and response.status_code != 200:
+            logging.error(f"Error descargando imagen: {response.status_code}")
+            response.close()
+            response = None
+        try:
+            yield response
+        finally:
+            if response is not None:
+                response.close()
+
+    def send_text(self, to, body):
+        """Enviar mensaje de texto; True si WhatsApp lo aceptó"""
+        try:
+            if not self.configured:
+                logging.error("WHATSAPP_ACCESS_TOKEN o WHATSAPP_PHONE_NUMBER_ID no configurados")
+                return False
+
+            if self.send_limiter is not None:
+                waited = self.send_limiter.acquire()
+                if waited:
+                    self._count('messages', 'rate_limited_seconds', waited)
+
+            response = self._request('messages', 'POST', f"{self.api_url}/{self.phone_number_id}/messages", json={
+                "messaging_product": "whatsapp",
+                "to": to,
+                "text": {"body": body}
+            })
+            if response.status_code == 200:
+                logging.info(f"Mensaje enviado a {to}")
+                return True
+
+            logging.error(f"Error enviando mensaje a WhatsApp: {response.status_code} - {response.text}")
+            return False
+
+        except Exception as e:
+            logging.error(f"Error enviando mensaje a {to}: {e}")
+            return False
+
+    # métricas por endpoint
+    def _record(self, endpoint, elapsed, response, error):
+        if self.metrics is not None:
+            self.metrics.observe(f'graph_{endpoint}', elapsed)
+        with self._lock:
+            metrics = self._endpoint_metrics(endpoint)
+            metrics['requests'] += 1
+            metrics['latency_seconds_total'] += elapsed
+            metrics['latency_seconds_max'] = max(metrics['latency_seconds_max'], elapsed)
+            if error is not None or response.status_code >= 400:
+                metrics['errors'] += 1
+
+    def _count(self, endpoint, name, value=1):
+        with self._lock:
+            self._endpoint_metrics(endpoint)[name] += value
+
+    def _endpoint_metrics(self, endpoint):
+        return self._metrics.setdefault(endpoint, {
+            'requests': 0, 'errors': 0, 'retries': 0, 'rate_limited_seconds': 0.0,
+            'latency_seconds_total': 0.0, 'latency_seconds_max': 0.0
+        })
+
+    def stats(self):
+        """Latencia, errores y reintentos por endpoint"""
+        with self._lock:
+            stats = {endpoint: dict(metrics) for endpoint, metrics in self._metrics.items()}
+        for metrics in stats.values():
+            metrics['latency_ms_avg'] = round(metrics['latency_seconds_total'] / metrics['requests'] * 1000, 2)
+        return stats
+
+
+def create_whatsapp_client(metrics=None):
+    """Crear cliente con la configuración común de los servicios (variables de entorno)"""
+    return WhatsAppClient(
+        access_token=os.environ.get('WHATSAPP_ACCESS_TOKEN'),
+        phone_number_id=os.environ.get('WHATSAPP_PHONE_NUMBER_ID'),
+        base_url=os.environ.get('GRAPH_API_BASE_URL', 'https://graph.facebook.com'),
+        api_version=os.environ.get('GRAPH_API_VERSION', 'v17.0'),
+        timeout=(float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05')), float(os.environ.get('HTTP_READ_TIMEOUT', '10'))),
+        max_retries=int(os.environ.get('HTTP_MAX_RETRIES', '3')),
+        messages_per_second=float(os.environ.get('WHATSAPP_MESSAGES_PER_SECOND', '80')),
+        metrics=metrics
+    )
@@ -1,21 +1,96 @@
 ﻿import functions_framework # Web Framework de Google Cloud Functions
 from flask import jsonify, request
-from google.cloud import storage, pubsub_v1
-import json
 import os
 import logging
-import requests  # Para llamadas HTTP API whatsApp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shared.image_normalization import normalize_image
+from shared.pubsub_publisher import BatchPublisher
+from shared.idempotency import ClaimInProgress, create_idempotency_guard
+from shared.lazy import lazy_client
+from shared.metrics import CONTENT_TYPE, Metrics
 
 # Configuración variables de entorno
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'prj-botlabs-dev-aiasigna-images')
 TOPIC_NAME = os.environ.get('TOPIC_NAME', 'aiasigna-image-processing')
 WHATSAPP_TOKEN = os.environ.get('WHATSAPP_TOKEN', 'aiasigna_verify_123')
-WHATSAPP_ACCESS_TOKEN = os.environ.get('WHATSAPP_ACCESS_TOKEN')  
-WHATSAPP_PHONE_NUMBER_ID = os.environ.get('WHATSAPP_PHONE_NUMBER_ID') 
 
-# Clientes GCP
-storage_client = storage.Client()
-publisher = pubsub_v1.PublisherClient()
+# Modo del webhook para imágenes:
+# 'inline'   → descarga, sube a GCS, publica y confirma antes de responder 200
+# 'fast_ack' → solo valida y publica un job compacto; el servicio de procesamiento
+#              descarga la imagen y envía la confirmación
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'inline')
+WEBHOOK_MAX_WORKERS = int(os.environ.get('WEBHOOK_MAX_WORKERS', '8'))  # Descargas/respuestas en paralelo por entrega
+
+# Normalización de imágenes antes de subirlas (orientación, tamaño, metadatos, calidad JPEG)
+IMAGE_NORMALIZATION_ENABLED = os.environ.get('IMAGE_NORMALIZATION_ENABLED', 'true').lower() == 'true'
+IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', '1600'))  # Lado mayor en píxeles, suficiente para OCR
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+KEEP_ORIGINALS = os.environ.get('KEEP_ORIGINALS', 'false').lower() == 'true'  # Guardar también la imagen original
+ORIGINALS_PREFIX = os.environ.get('ORIGINALS_PREFIX', 'originals/')
+ORIGINALS_STORAGE_CLASS = os.environ.get('ORIGINALS_STORAGE_CLASS', 'COLDLINE')
+
+# Transferencia de imágenes: 'buffered' (descarga completa + normalización) o
+# 'streaming' (la descarga se envía por bloques a una subida resumible de GCS, sin normalizar)
+IMAGE_TRANSFER_MODE = os.environ.get('IMAGE_TRANSFER_MODE', 'buffered')
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(256 * 1024)))  # Múltiplo de 256 KiB (requisito de GCS)
+
+# Publicación por lotes en Pub/Sub
+PUBSUB_BATCH_MAX_MESSAGES = int(os.environ.get('PUBSUB_BATCH_MAX_MESSAGES', '100'))
+PUBSUB_BATCH_MAX_BYTES = int(os.environ.get('PUBSUB_BATCH_MAX_BYTES', '1000000'))
+PUBSUB_BATCH_MAX_LATENCY = float(os.environ.get('PUBSUB_BATCH_MAX_LATENCY', '0.01'))  # segundos
+PUBSUB_FLOW_MAX_MESSAGES = int(os.environ.get('PUBSUB_FLOW_MAX_MESSAGES', '1000'))
+PUBSUB_FLOW_MAX_BYTES = int(os.environ.get('PUBSUB_FLOW_MAX_BYTES', str(10 * 1024 * 1024)))
+PUBSUB_PUBLISH_TIMEOUT = float(os.environ.get('PUBSUB_PUBLISH_TIMEOUT', '10'))  # segundos esperando confirmación
+
+# Idempotencia por message_id: descartar reentregas de WhatsApp
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'firestore')  # 'firestore', 'local' o 'none'
+IDEMPOTENCY_COLLECTION = os.environ.get('IDEMPOTENCY_COLLECTION', 'processed_messages')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(7 * 24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '120'))  # Reserva mientras se atiende la entrega
+
+# Métricas por etapa (GET /metrics) y fracción de entregas con log estructurado
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+metrics = Metrics('webhook', log_sample_rate=LOG_SAMPLE_RATE)
+
+# Clientes GCP: se importan y construyen en el primer uso (el GET de verificación no los necesita)
+@lazy_client
+def storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+@lazy_client
+def firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+publisher = BatchPublisher(
+    f"projects/{os.environ.get('GCP_PROJECT', 'prj-botlabs-dev')}/topics/{TOPIC_NAME}",
+    max_messages=PUBSUB_BATCH_MAX_MESSAGES,
+    max_bytes=PUBSUB_BATCH_MAX_BYTES,
+    max_latency=PUBSUB_BATCH_MAX_LATENCY,
+    flow_max_messages=PUBSUB_FLOW_MAX_MESSAGES,
+    flow_max_bytes=PUBSUB_FLOW_MAX_BYTES
+)
+
+# La reserva pasa a definitiva cuando los jobs quedaron publicados; si la entrega falla se libera
+idempotency_guard = create_idempotency_guard(
+    'webhook',
+    IDEMPOTENCY_BACKEND,
+    firestore_client_factory=lambda: firestore_client,
+    collection=IDEMPOTENCY_COLLECTION,
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    lease_seconds=IDEMPOTENCY_LEASE_SECONDS
+)
+
+# Cliente de la Graph API (WHATSAPP_ACCESS_TOKEN, WHATSAPP_PHONE_NUMBER_ID, timeouts y límite de envío)
+@lazy_client
+def whatsapp_client():
+    from shared.whatsapp_client import create_whatsapp_client  # requests solo cuando hay mensajes
+    return create_whatsapp_client(metrics=metrics)
+
+# Pool para descargas/subidas y respuestas concurrentes de una misma entrega
+_io_executor = ThreadPoolExecutor(max_workers=WEBHOOK_MAX_WORKERS)
 
 # funcion principal Webhook de WhatsApp Business API
 @functions_framework.http
@@ -24,6 +99,8 @@ def whatsapp_webhook(request):
     
     # Verificar token de WhatsApp GET → obtener datos y POST → crear recursos.
     if request.method == 'GET':
+        if request.path.rstrip('/').endswith('/metrics'):
+            return metrics.render(), 200, {'Content-Type': CONTENT_TYPE}
         return verify_webhook(request) # Verificación del webhook inicial de WhatsApp
     
     # Procesar mensaje entrante
@@ -48,173 +125,266 @@ def verify_webhook(request):
 
 # Procesar mensaje entrante
 def process_message(request):
-    """Procesar mensajes entrantes de WhatsApp"""
+    """Procesar todas las entradas, cambios y mensajes de una entrega de WhatsApp"""
+    start = time.perf_counter()
+    claimed = []  # message_id reservados por esta entrega
     try:
-        data = request.get_json()
-        logging.info(f"Mensaje recibido: {json.dumps(data, indent=2)}")
+        with metrics.timer('parse'):
+            data = request.get_json()
+            received = extract_messages(data)
         
-        # Extraer información del mensaje
-        message_data = extract_message_data(data)
+        # Extraer y clasificar todos los elementos de la entrega (sin reentregas)
+        with metrics.timer('dedupe'):
+            items = [item for item in received if is_first_delivery(item, claimed)]
+        images = [item for item in items if item['kind'] == 'image']
+        texts = [item for item in items if item['kind'] == 'text']
+        statuses = [item for item in items if item['kind'] == 'status']
+        if statuses:
+            logging.info(f"Callbacks de estado recibidos: {len(statuses)}")
         
-        if message_data.get('has_media'):
-            # Procesar imagen
-            return process_image_message(message_data)
+        # Imágenes: un solo lote de publicación en Pub/Sub
+        if WEBHOOK_MODE == 'fast_ack':
+            jobs, replies = enqueue_image_jobs(images), []
         else:
-            # Mensaje de texto - enviar instrucciones
-            return send_instructions(message_data)
+            jobs, replies = process_image_messages(images)
+        
+        # Mensajes de texto - enviar instrucciones (todas las respuestas en paralelo)
+        replies.extend((item['from'], INSTRUCTIONS) for item in texts)
+        sent = send_text_messages(replies)
+        
+        # Jobs publicados y respuestas enviadas: una reentrega de WhatsApp ya no debe repetirlos
+        for message_id in claimed:
+            idempotency_guard.complete(message_id)
+        
+        for kind in ('image', 'text', 'status'):
+            metrics.inc('webhook_items', sum(1 for item in items if item['kind'] == kind), kind=kind)
+        metrics.inc('webhook_items', len(received) - len(items), kind='duplicate')
+        metrics.observe('request', time.perf_counter() - start)
+        # Resumen de la entrega en vez del payload completo (muestreado)
+        metrics.log_sample('webhook_delivery', mode=WEBHOOK_MODE, images=len(images), texts=len(texts),
+                           statuses=len(statuses), duplicates=len(received) - len(items), jobs=len(jobs),
+                           replies_sent=sent, elapsed_ms=round((time.perf_counter() - start) * 1000, 2))
+        
+        return jsonify({
+            'status': 'processing' if jobs else 'ok',
+            'images': len(jobs),
+            'texts': len(texts),
+            'statuses': len(statuses),
+            'replies_sent': sent
+        }), 200
+    
+    except ClaimInProgress as e:
+        # Otra instancia sigue atendiendo un mensaje de la entrega: WhatsApp reintenta con el 503
+        logging.info(f"Mensaje en proceso en otra instancia, se pide reintento: {e}")
+        for message_id in claimed:
+            idempotency_guard.release(message_id)
+        return jsonify({'status': 'retry'}), 503
             
     except Exception as e:
         logging.error(f"Error procesando mensaje: {e}")
+        metrics.inc('webhook_errors')
+        # Liberar las reservas para que el reintento de WhatsApp vuelva a procesar la entrega
+        for message_id in claimed:
+            idempotency_guard.release(message_id)
         return jsonify({'status': 'error'}), 500
 
-# Extraer datos del mensaje
-def extract_message_data(data):
-    """Extraer datos relevantes del mensaje de WhatsApp"""
-    try:
-        entry = data.get('entry', [{}])[0]
-        changes = entry.get('changes', [{}])[0]
-        value = changes.get('value', {})
-        messages = value.get('messages', [{}])
-        message = messages[0]
-        
-        return {
-            'from': message.get('from', 'unknown_user'), # Número del usuario que envió el mensaje
-            'message_id': message.get('id', 'unknown_id'), # ID del mensaje
-            'timestamp': message.get('timestamp', '0'), # # Timestamp del mensaje
-            'has_media': 'image' in message.get('type', ''), # Verificar si el mensaje tiene imagen
-            'media_id': message.get('image', {}).get('id') if 'image' in message.get('type', '') else None, # ID de la media si existe
-            'message_type': message.get('type', 'text') # Tipo de mensaje
-        }
-    except Exception as e:
-        logging.error(f"Error extrayendo datos del mensaje: {e}")
-        return {'from': 'unknown', 'has_media': False}
+# Extraer datos de todos los mensajes
+def extract_messages(data):
+    """Recorrer entry → changes → messages/statuses y clasificar cada elemento como image, text o status"""
+    items = []
+    for entry in (data or {}).get('entry', []):
+        for change in entry.get('changes', []):
+            value = change.get('value', {})
+
+            for message in value.get('messages', []):
+                if not message.get('from') or not message.get('id'):
+                    logging.warning(f"Mensaje sin remitente o id, se ignora: {message.get('type')}")
+                    continue
+                message_type = message.get('type', 'text') # Tipo de mensaje
+                is_image = message_type == 'image'
+                items.append({
+                    'kind': 'image' if is_image else 'text',
+                    'from': message['from'], # Número del usuario que envió el mensaje
+                    'message_id': message['id'], # ID del mensaje
+                    'timestamp': message.get('timestamp', '0'), # Timestamp del mensaje
+                    'media_id': message.get('image', {}).get('id') if is_image else None, # ID de la media si existe
+                    'message_type': message_type
+                })
+
+            for status in value.get('statuses', []):
+                items.append({
+                    'kind': 'status',
+                    'message_id': status.get('id'),
+                    'status': status.get('status'),
+                    'recipient_id': status.get('recipient_id')
+                })
+    return items
+
+# Filtrar reentregas de WhatsApp por message_id
+def is_first_delivery(item, claimed):
+    """False si el mensaje ya fue recibido antes (en esta u otra instancia); anota en claimed lo reservado"""
+    if item['kind'] == 'status' or idempotency_guard is None:
+        return True
+    if idempotency_guard.claim(item['message_id']):
+        claimed.append(item['message_id'])
+        return True
+    logging.info(f"Mensaje duplicado descartado: {item['message_id']}")
+    return False
+
+# Publicar jobs de imagen sin descargarlas (modo fast_ack)
+def enqueue_image_jobs(images):
+    """Validar los mensajes y delegar descarga, subida y confirmación al procesamiento"""
+    jobs = []
+    for message_data in images:
+        if not message_data.get('media_id'):
+            logging.warning(f"Mensaje de imagen sin media_id, se ignora: {message_data['message_id']}")
+            continue
+        jobs.append({
+            'user_id': message_data['from'],
+            'media_id': message_data['media_id'],
+            'message_id': message_data['message_id'],
+            'timestamp': message_data['timestamp']
+        })
+
+    publish_to_pubsub(jobs)
+    return jobs
+
+# Procesar mensajes con imagen (modo inline)
+def process_image_messages(images):
+    """Descargar y subir todas las imágenes en paralelo y publicarlas en un solo lote"""
+    jobs, replies = [], []
+    for message_data, (job, reply) in zip(images, _io_executor.map(prepare_image_job, images)):
+        if job:
+            jobs.append(job)
+        replies.append((message_data['from'], reply))
+
+    publish_to_pubsub(jobs)
+    return jobs, replies
 
 # Procesar mensaje con imagen
-def process_image_message(message_data):
-    """Procesar mensaje con imagen """
+def prepare_image_job(message_data):
+    """Descargar la imagen y subirla a GCS; retorna (job o None, texto de respuesta)"""
     try:
-        # DESCARGAR IMAGEN  DE WHATSAPP
-        image_data = download_whatsapp_image(message_data['media_id']) # Descargar imagen usando media_id
-        
-        if not image_data:
-            return send_text_message(message_data['from'], "❌ Error al descargar la imagen. Por favor intenta nuevamente.")
-        
-        # Subir a Cloud Storage
         file_name = f"{message_data['from']}_{message_data['message_id']}.jpg"
-        image_url = upload_to_gcs(image_data, file_name)
+
+        if IMAGE_TRANSFER_MODE == 'streaming':
+            # Descargar de WhatsApp y subir a Cloud Storage en paralelo, por bloques
+            with metrics.timer('stream_upload'):
+                image_url = stream_whatsapp_image_to_gcs(message_data['media_id'], file_name)
+        else:
+            # DESCARGAR IMAGEN  DE WHATSAPP
+            with metrics.timer('download'):
+                image_data = download_whatsapp_image(message_data['media_id']) # Descargar imagen usando media_id
+            # Subir a Cloud Storage
+            image_url = None
+            if image_data:
+                with metrics.timer('normalize'):
+                    image_data = prepare_image(image_data, file_name)
+                with metrics.timer('upload'):
+                    image_url = upload_to_gcs(image_data, file_name)
+        
+        if not image_url:
+            return None, "❌ Error al descargar la imagen. Por favor intenta nuevamente."
         
-        # Publicar mensaje en Pub/Sub
-        publish_to_pubsub({
+        job = {
             'user_id': message_data['from'],
             'image_path': image_url,
             'message_id': message_data['message_id'],
             'timestamp': message_data['timestamp']
-        })
-        
-        # Enviar mensaje de confirmación
-        send_text_message(message_data['from'], "🔄 Procesando tu imagen... Esto puede tomar unos segundos.")
-        
-        return jsonify({'status': 'processing'}), 200
+        }
+        # Mensaje de confirmación
+        return job, "🔄 Procesando tu imagen... Esto puede tomar unos segundos."
         
     except Exception as e:
         logging.error(f"Error procesando imagen: {e}")
-        return send_text_message(message_data['from'], "❌ Error al procesar la imagen. Por favor intenta con otra foto.")
+        return None, "❌ Error al procesar la imagen. Por favor intenta con otra foto."
 
 # Descargar imagen de WhatsApp Business API
 def download_whatsapp_image(media_id):
     """ DESCARGAR IMAGEN REAL DE WHATSAPP BUSINESS API"""
+    return whatsapp_client.download_media(media_id)
+
+# Descargar imagen de WhatsApp directamente a una subida resumible de GCS
+def stream_whatsapp_image_to_gcs(media_id, file_name):
+    """Copiar la imagen por bloques sin cargarla completa en memoria; retorna la ruta gs://"""
     try:
-        if not WHATSAPP_ACCESS_TOKEN:
-            logging.error("WHATSAPP_ACCESS_TOKEN no configurado")
-            return None
-            
-        # Obtener URL de la media con el token de acceso
-        media_url = f"https://graph.facebook.com/v17.0/{media_id}/"
-        headers = {
-            "Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}"
-        }
-        
-        response = requests.get(media_url, headers=headers)
-        if response.status_code != 200:
-            logging.error(f"Error obteniendo media URL: {response.status_code} - {response.text}")
-            return None
-            
-        media_data = response.json()
-        download_url = media_data.get('url')
-        
-        if not download_url:
-            logging.error("No se pudo obtener URL de descarga")
-            return None
-            
-        # Descargar la imagen desde la URL obtenida
-        image_response = requests.get(download_url, headers=headers)
-        if image_response.status_code != 200:
-            logging.error(f"Error descargando imagen: {image_response.status_code}")
-            return None
-            
-        return image_response.content
-        
+        with whatsapp_client.open_media_stream(media_id) as response:
+            if response is None:
+                return None
+
+            blob = storage_client.bucket(BUCKET_NAME).blob(file_name)
+            try:
+                # El writer sube cada bloque de chunk_size apenas se completa (memoria acotada)
+                with blob.open('wb', chunk_size=STREAM_CHUNK_SIZE, content_type='image/jpeg') as writer:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        writer.write(chunk)
+            except Exception:
+                # Al salir del with el writer finaliza la subida aunque la copia falle: borrar el objeto truncado
+                delete_partial_upload(blob)
+                raise
+
+        return f"gs://{BUCKET_NAME}/{file_name}"
+
     except Exception as e:
-        logging.error(f"Error en download_whatsapp_image: {e}")
+        logging.error(f"Error en stream_whatsapp_image_to_gcs: {e}")
         return None
 
+# Borrar un objeto que quedó incompleto
+def delete_partial_upload(blob):
+    """Eliminar la imagen truncada; si no llegó a crearse no hay nada que borrar"""
+    try:
+        blob.delete()
+    except Exception as e:
+        logging.warning(f"No se pudo borrar la subida incompleta {blob.name}: {e}")
+
+# Normalizar imagen antes de subirla
+def prepare_image(image_data, file_name):
+    """Normalizar imagen y, si está configurado, guardar la original en almacenamiento frío"""
+    if not IMAGE_NORMALIZATION_ENABLED:
+        return image_data
+
+    if KEEP_ORIGINALS:
+        upload_to_gcs(image_data, f"{ORIGINALS_PREFIX}{file_name}", storage_class=ORIGINALS_STORAGE_CLASS)
+
+    normalized_data, info = normalize_image(image_data, max_side=IMAGE_MAX_SIDE, jpeg_quality=IMAGE_JPEG_QUALITY)
+    logging.info(f"Imagen normalizada {file_name}: {info['original_bytes']} → {info['normalized_bytes']} bytes, "
+                 f"{info['original_size']} → {info['normalized_size']} en {info['elapsed_ms']} ms")
+    return normalized_data
+
 # Subir imagen a Cloud Storage
-def upload_to_gcs(image_data, file_name):
+def upload_to_gcs(image_data, file_name, storage_class=None):
     """Subir imagen a Cloud Storage"""
     bucket = storage_client.bucket(BUCKET_NAME)
     blob = bucket.blob(file_name)
+    if storage_class:
+        blob.storage_class = storage_class
     blob.upload_from_string(image_data, content_type='image/jpeg')
     return f"gs://{BUCKET_NAME}/{file_name}" # Retornar la ruta GCS de la imagen subida ejmplo: gs://bucket-name/file-name.jpg
 
-# Publicar mensaje en Pub/Sub
-def publish_to_pubsub(message_data): 
-    """Publicar mensaje en Pub/Sub para procesamiento"""
-    topic_path = publisher.topic_path(os.environ.get('GCP_PROJECT', 'prj-botlabs-dev'), TOPIC_NAME) 
-    future = publisher.publish(
-        topic_path,
-        json.dumps(message_data).encode('utf-8')
-    )
-    message_id = future.result()
-    logging.info(f"Mensaje publicado en Pub/Sub: {message_id}")
-    return message_id
+# Publicar jobs en Pub/Sub
+def publish_to_pubsub(jobs): 
+    """Publicar jobs en un mismo lote y esperar su confirmación; lanza si alguno falla (la entrega responde 5xx)"""
+    with metrics.timer('publish'):
+        futures = publisher.publish_many(jobs)
+        # Una sola espera por entrega: todos los futures se resuelven con el mismo lote
+        for future in futures:
+            future.result(timeout=PUBSUB_PUBLISH_TIMEOUT)
+        return futures
 
 # Enviar mensaje de texto a WhatsApp
 def send_text_message(user_id, text):
-    """ENVIAR MENSAJE DE TEXTO REAL A WHATSAPP"""
-    try:
-        if not WHATSAPP_ACCESS_TOKEN or not WHATSAPP_PHONE_NUMBER_ID:
-            logging.error("Configuración de WhatsApp incompleta")
-            return jsonify({'status': 'error'}), 500
-            
-        url = f"https://graph.facebook.com/v17.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-        
-        headers = {
-            'Authorization': f'Bearer {WHATSAPP_ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": user_id,
-            "text": {"body": text}
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code == 200:
-            logging.info(f"Mensaje enviado a {user_id}")
-            return jsonify({'status': 'message_sent'}), 200
-        else:
-            logging.error(f"Error enviando mensaje: {response.status_code} - {response.text}")
-            return jsonify({'status': 'error'}), 500
-            
-    except Exception as e:
-        logging.error(f"Error en send_text_message: {e}")
-        return jsonify({'status': 'error'}), 500
+    """ENVIAR MENSAJE DE TEXTO REAL A WHATSAPP; retorna True si WhatsApp lo aceptó"""
+    return whatsapp_client.send_text(user_id, text)
+
+# Enviar varias respuestas en paralelo
+def send_text_messages(replies):
+    """Enviar [(user_id, texto), ...] concurrentemente; retorna cuántos se enviaron"""
+    if not replies:
+        return 0
+    with metrics.timer('reply'):
+        return sum(_io_executor.map(lambda reply: send_text_message(*reply), replies))
 
-def send_instructions(message_data):
-    """Enviar instrucciones al usuario"""
-    instructions = """
+INSTRUCTIONS = """
 📱 *AIASIGNA - Verificador de Productos*
 
 Para verificar un producto, envía una foto clara que muestre:
@@ -224,4 +394,3 @@ Para verificar un producto, envía una foto clara que muestre:
 
 Ejemplo: 📸 [foto del producto]
 """
-    return send_text_message(message_data['from'], instructions)
\ No newline at end of file